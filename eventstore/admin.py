@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.core.paginator import Paginator
-from django.db import OperationalError, connection, transaction
+from django.db import OperationalError, connections, transaction
 from django.utils.functional import cached_property
 
 from eventstore.forms import MomConnectImportForm
@@ -20,6 +20,7 @@ from eventstore.models import (
     IdentificationSwitch,
     ImportError,
     ImportRow,
+    ImportStage,
     LanguageSwitch,
     MomConnectImport,
     MSISDNSwitch,
@@ -30,6 +31,7 @@ from eventstore.models import (
     PublicRegistration,
     ResearchOptinSwitch,
 )
+from ndoh_hub.db_routers import use_replica
 
 
 class ApproximatePaginator(Paginator):
@@ -42,14 +44,14 @@ class ApproximatePaginator(Paginator):
 
     @cached_property
     def count(self):
-        cursor = connection.cursor()
-        with transaction.atomic(), connection.cursor() as cursor:
+        db = self.object_list.db
+        with transaction.atomic(using=db), connections[db].cursor() as cursor:
             cursor.execute("SET LOCAL statement_timeout TO 50")
             try:
                 return super().count
             except OperationalError:
                 pass
-        with connection.cursor() as cursor:
+        with connections[db].cursor() as cursor:
             cursor.execute(
                 "SELECT reltuples FROM pg_class WHERE relname = %s",
                 [self.object_list.query.model._meta.db_table],
@@ -62,6 +64,16 @@ class BaseEventAdmin(admin.ModelAdmin):
     paginator = ApproximatePaginator
     show_full_result_count = False
 
+    def changelist_view(self, request, extra_context=None):
+        if request.method != "GET":
+            return super().changelist_view(request, extra_context)
+        # Read the changelist from the replica database, if there is one
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, "render"):
+                response.render()
+            return response
+
     def save_model(self, request, obj, form, change):
         obj.created_by = request.user.username
         super().save_model(request, obj, form, change)
@@ -207,6 +219,22 @@ class ImportErrorInline(admin.TabularInline):
         return False
 
 
+class ImportStageInline(admin.TabularInline):
+    model = ImportStage
+    fields = ("stage", "processed", "total", "rate", "eta", "mean_latency", "updated")
+    readonly_fields = fields
+
+    # Don't allow any changes
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 class ImportRowInline(admin.TabularInline):
     model = ImportRow
 
@@ -225,7 +253,7 @@ class ImportRowInline(admin.TabularInline):
 class MomConnectImportAdmin(admin.ModelAdmin):
     readonly_fields = ("timestamp", "status")
     list_display = ("timestamp", "status")
-    inlines = (ImportErrorInline, ImportRowInline)
+    inlines = (ImportStageInline, ImportErrorInline, ImportRowInline)
     form = MomConnectImportForm
 
     def get_inline_instances(self, request, obj=None):
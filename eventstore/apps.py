@@ -5,4 +5,9 @@ class EventstoreConfig(AppConfig):
     name = "eventstore"
 
     def ready(self):
+        from prometheus_client import REGISTRY
+
         import eventstore.signals  # noqa
+        from eventstore.import_metrics import ImportStageCollector
+
+        REGISTRY.register(ImportStageCollector())
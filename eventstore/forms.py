@@ -1,11 +1,17 @@
 import codecs
 import csv
+from itertools import islice
 
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils.text import slugify
 
-from eventstore.models import ImportError, ImportRow, MomConnectImport
-from eventstore.tasks import validate_momconnect_import
+from eventstore.import_metrics import ImportStageTracker
+from eventstore.models import ImportError, ImportRow, ImportStage, MomConnectImport
+from eventstore.tasks import parse_momconnect_import
+from registrations.models import ClinicCode
 
 
 class MomConnectImportForm(forms.ModelForm):
@@ -80,10 +86,9 @@ class MomConnectImportForm(forms.ModelForm):
                 return value
         return text
 
-    def create_row(self, mcimport, row_number, row_data):
-        row_data = {self.normalise_key(k): v for k, v in row_data.items()}
-        row_data["mcimport"] = mcimport.pk
-        row_data["row_number"] = row_number + 2  # First row is header
+    def get_row_data(self, row_number, row_data):
+        row_data = dict(row_data)
+        row_data["row_number"] = row_number
         row_data["id_type"] = self.get_id_type(row_data["id_type"])
         if row_data.get("passport_country"):
             row_data["passport_country"] = self.get_passport_country(
@@ -93,35 +98,101 @@ class MomConnectImportForm(forms.ModelForm):
             row_data["language"] = self.get_language(row_data["language"])
         else:
             row_data["language"] = ImportRow.Language.ENG
-        form = ImportRowForm(data=row_data)
-        if form.errors:
-            mcimport.status = MomConnectImport.Status.ERROR
-            mcimport.save()
-            for field, errors in form.errors.items():
-                for error in errors:
-                    if field == "__all__":
-                        mcimport.errors.create(
-                            row_number=row_number + 2,
-                            error_type=ImportError.ErrorType.ROW_VALIDATION_ERROR,
-                            error_args=[error],
-                        )
-                    else:
-                        mcimport.errors.create(
-                            row_number=row_number + 2,
-                            error_type=ImportError.ErrorType.FIELD_VALIDATION_ERROR,
-                            error_args=[field, error],
-                        )
-            return
-        form.save()
+        return row_data
 
-    def save(self, commit=True):
-        mcimport = super().save(commit=commit)
-        mcimport.save()
+    def get_row_errors(self, mcimport, row_number, form):
+        for field, errors in form.errors.items():
+            for error in errors:
+                if field == "__all__":
+                    yield ImportError(
+                        mcimport=mcimport,
+                        row_number=row_number,
+                        error_type=ImportError.ErrorType.ROW_VALIDATION_ERROR,
+                        error_args=[error],
+                    )
+                else:
+                    yield ImportError(
+                        mcimport=mcimport,
+                        row_number=row_number,
+                        error_type=ImportError.ErrorType.FIELD_VALIDATION_ERROR,
+                        error_args=[field, error],
+                    )
+
+    def get_chunks(self, rows):
+        """
+        Groups the (row number, row) pairs into chunks for validating and writing
+        """
+        while True:
+            chunk = list(islice(rows, settings.MOMCONNECT_IMPORT_CHUNK_SIZE))
+            if not chunk:
+                return
+            yield chunk
+
+    def validate_rows_chunk(self, mcimport, chunk):
+        """
+        Validates a chunk of (row number, row data) pairs, using a single query for
+        the facility codes. Returns the valid rows, and the errors for the invalid rows
+        """
+        facility_codes = set(
+            ClinicCode.objects.filter(
+                value__in={row.get("facility_code") for _, row in chunk}
+            ).values_list("value", flat=True)
+        )
+
+        rows, errors = [], []
+        for row_number, row_data in chunk:
+            form = ImportRowForm(
+                data=row_data,
+                instance=ImportRow(mcimport=mcimport),
+                facility_codes=facility_codes,
+            )
+            if form.is_valid():
+                rows.append(form.instance)
+            else:
+                errors.extend(self.get_row_errors(mcimport, row_number, form))
+        return len(chunk), rows, errors
+
+    def write_rows_chunk(self, mcimport, rows, errors):
+        """
+        Stores the valid rows and the errors for a chunk, using a single query for each
+        """
+        ImportRow.objects.bulk_create(rows)
+        if errors:
+            if mcimport.status != MomConnectImport.Status.ERROR:
+                mcimport.status = MomConnectImport.Status.ERROR
+                mcimport.save()
+            ImportError.objects.bulk_create(errors)
+
+    def create_rows(self, mcimport, reader):
+        """
+        Streams the rows from `reader` through normalising, validating, and writing,
+        one chunk at a time, so that memory use doesn't depend on the size of the file.
+
+        Each chunk is written in the same transaction as the progress of the parse
+        stage, so if parsing is interrupted, it resumes after the last written chunk.
+        """
+        reader.fieldnames = [self.normalise_key(k) for k in reader.fieldnames]
+        tracker = ImportStageTracker(mcimport, ImportStage.Stage.PARSE)
+        rows = enumerate(reader, start=2)  # First row is header
+        rows = islice(rows, tracker.stage.processed, None)
+        rows = ((i, self.get_row_data(i, row)) for i, row in rows)
+        chunks = (
+            self.validate_rows_chunk(mcimport, chunk) for chunk in self.get_chunks(rows)
+        )
+        for count, valid_rows, errors in chunks:
+            with transaction.atomic():
+                self.write_rows_chunk(mcimport, valid_rows, errors)
+                tracker.add(count)
+        tracker.finish()
+
+    def process_file(self, mcimport, f):
+        """
+        Parses the CSV file `f`, a binary file object, into rows for `mcimport`
+        """
         try:
-            f = codecs.iterdecode(self.cleaned_data["file"].file, "utf-8")
-            reader = csv.DictReader(f)
+            reader = csv.DictReader(codecs.iterdecode(f, "utf-8"))
             missing_fields = self.required_fields - set(
-                map(self.normalise_key, reader.fieldnames)
+                map(self.normalise_key, reader.fieldnames or [])
             )
             if missing_fields:
                 mcimport.status = MomConnectImport.Status.ERROR
@@ -131,9 +202,8 @@ class MomConnectImportForm(forms.ModelForm):
                     error_type=ImportError.ErrorType.INVALID_HEADER,
                     error_args=[" ".join(sorted(missing_fields))],
                 )
-                return mcimport
-            for i, row in enumerate(reader):
-                self.create_row(mcimport, i, row)
+                return
+            self.create_rows(mcimport, reader)
         except UnicodeDecodeError:
             mcimport.status = MomConnectImport.Status.ERROR
             mcimport.save()
@@ -142,10 +212,15 @@ class MomConnectImportForm(forms.ModelForm):
                 error_type=ImportError.ErrorType.INVALID_FILETYPE,
                 error_args=[],
             )
-            return mcimport
 
-        if mcimport.status == MomConnectImport.Status.VALIDATING:
-            validate_momconnect_import.delay(mcimport.id)
+    def save(self, commit=True):
+        """
+        Stores the uploaded file, and parses it in the background once the import has
+        been committed
+        """
+        mcimport = super().save(commit=commit)
+        mcimport.save()
+        transaction.on_commit(lambda: parse_momconnect_import.delay(mcimport.id))
         return mcimport
 
     class Meta:
@@ -170,6 +245,26 @@ class ImportRowForm(forms.ModelForm):
     research_consent = TextBooleanField(required=False, empty_value=False)
     previous_optout = TextBooleanField(required=False, empty_value=True)
 
+    def __init__(self, *args, facility_codes=None, **kwargs):
+        """
+        `facility_codes` is an optional set of the valid facility codes, to validate
+        against instead of querying the database for each row
+        """
+        super().__init__(*args, **kwargs)
+        self.facility_codes = facility_codes
+
+    def clean_facility_code(self):
+        value = self.cleaned_data["facility_code"]
+        if self.facility_codes is not None and value not in self.facility_codes:
+            raise ValidationError("Invalid Facility Code")
+        return value
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self.facility_codes is not None:
+            exclude.add("facility_code")
+        return exclude
+
     class Meta:
         model = ImportRow
-        fields = "__all__"
+        exclude = ("mcimport",)
@@ -0,0 +1,174 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily
+
+from eventstore.models import ImportStage, MomConnectImport
+
+logger = logging.getLogger(__name__)
+
+
+class ImportStageTracker:
+    """
+    Records the progress, throughput, and RapidPro request latency of a stage of
+    processing a MomConnectImport. Safe to use from the dispatcher's worker threads.
+    """
+
+    def __init__(self, mcimport, stage, total=None):
+        self.stage, _ = ImportStage.objects.get_or_create(
+            mcimport=mcimport, stage=stage
+        )
+        self.stage.total = total
+        if not self.stage.latency_buckets:
+            self.stage.latency_buckets = [0] * (len(ImportStage.LATENCY_BUCKETS) + 1)
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.start_processed = self.stage.processed
+
+    def timed(self, func):
+        """
+        Wraps `func`, recording how long each call takes in the latency histogram
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(time.monotonic() - start)
+
+        return wrapper
+
+    def observe(self, duration):
+        with self.lock:
+            bucket = bisect_left(ImportStage.LATENCY_BUCKETS, duration)
+            self.stage.latency_buckets[bucket] += 1
+            self.stage.latency_sum += duration
+            self.stage.latency_count += 1
+
+    def add(self, rows):
+        """
+        Adds `rows` to the rows processed, and saves the progress and the rate for
+        this run of the stage
+        """
+        with self.lock:
+            self.stage.processed += rows
+            elapsed = time.monotonic() - self.start
+            if elapsed > 0:
+                self.stage.rate = (
+                    self.stage.processed - self.start_processed
+                ) / elapsed
+            self.stage.save()
+
+    def finish(self):
+        """
+        For stages where the total isn't known upfront, marks the stage as complete
+        """
+        with self.lock:
+            self.stage.total = self.stage.processed
+            self.stage.save()
+
+
+class ImportStageCollector:
+    """
+    Exports the progress of the stages of all the imports that are still being
+    processed. The stages are read from the database, so that the progress recorded
+    by the celery workers is available from the web workers' metrics endpoint. Every
+    process is scraped, so each one only reads them once per
+    MOMCONNECT_IMPORT_METRICS_INTERVAL.
+    """
+
+    ACTIVE_STATUSES = (
+        MomConnectImport.Status.VALIDATING,
+        MomConnectImport.Status.VALIDATED,
+        MomConnectImport.Status.UPLOADING,
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = []
+        self.fetched = None
+
+    def get_stages(self):
+        with self.lock:
+            now = time.monotonic()
+            if (
+                self.fetched is None
+                or now - self.fetched >= settings.MOMCONNECT_IMPORT_METRICS_INTERVAL
+            ):
+                try:
+                    self.stages = list(
+                        ImportStage.objects.filter(
+                            mcimport__status__in=self.ACTIVE_STATUSES
+                        )
+                    )
+                except DatabaseError:
+                    logger.exception("Failed to fetch import stages for metrics")
+                    self.stages = []
+                self.fetched = now
+            return self.stages
+
+    def get_metric_families(self):
+        labels = ["mcimport", "stage"]
+        return {
+            "processed": GaugeMetricFamily(
+                "momconnect_import_rows_processed",
+                "Rows processed by the import stage",
+                labels=labels,
+            ),
+            "total": GaugeMetricFamily(
+                "momconnect_import_rows_total",
+                "Total rows to be processed by the import stage",
+                labels=labels,
+            ),
+            "rate": GaugeMetricFamily(
+                "momconnect_import_rows_per_second",
+                "Rows processed per second by the import stage",
+                labels=labels,
+            ),
+            "eta": GaugeMetricFamily(
+                "momconnect_import_eta_seconds",
+                "Estimated seconds until the import stage completes",
+                labels=labels,
+            ),
+            "latency": HistogramMetricFamily(
+                "momconnect_import_rapidpro_request_seconds",
+                "Latency of the RapidPro requests made by the import stage",
+                labels=labels,
+            ),
+        }
+
+    def describe(self):
+        return list(self.get_metric_families().values())
+
+    def collect(self):
+        families = self.get_metric_families()
+        now = timezone.now()
+        for stage in self.get_stages():
+            labels = [str(stage.mcimport_id), stage.get_stage_display().lower()]
+            families["processed"].add_metric(labels, stage.processed)
+            if stage.total is not None:
+                families["total"].add_metric(labels, stage.total)
+            if stage.rate is not None:
+                families["rate"].add_metric(labels, stage.rate)
+            if stage.eta is not None:
+                families["eta"].add_metric(
+                    labels, max((stage.eta - now).total_seconds(), 0)
+                )
+            if stage.latency_buckets:
+                cumulative, buckets = 0, []
+                bounds = [str(b) for b in ImportStage.LATENCY_BUCKETS] + ["+Inf"]
+                for bound, count in zip(bounds, stage.latency_buckets):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                families["latency"].add_metric(
+                    labels, buckets, sum_value=stage.latency_sum
+                )
+        return families.values()
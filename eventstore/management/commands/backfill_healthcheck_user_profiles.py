@@ -0,0 +1,136 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ndoh_hub.dispatch import dispatch
+
+# The latest value of the field, ignoring empty values, like
+# HealthCheckUserProfile.update_from_healthcheck
+LATEST_TEXT = (
+    "(array_agg(t.{0} ORDER BY t.completed_timestamp DESC) "
+    "FILTER (WHERE t.{0} <> ''))[1]"
+)
+LATEST_VALUE = (
+    "(array_agg(t.{0} ORDER BY t.completed_timestamp DESC) "
+    "FILTER (WHERE t.{0} IS NOT NULL))[1]"
+)
+
+FIELDS = (
+    ("first_name", LATEST_TEXT),
+    ("last_name", LATEST_TEXT),
+    ("province", f"COALESCE({LATEST_TEXT}, '')"),
+    ("city", f"COALESCE({LATEST_TEXT}, '')"),
+    ("age", f"COALESCE({LATEST_TEXT}, '')"),
+    ("date_of_birth", LATEST_VALUE),
+    ("gender", f"COALESCE({LATEST_TEXT}, '')"),
+    ("location", f"COALESCE({LATEST_TEXT}, '')"),
+    ("city_location", LATEST_TEXT),
+    ("preexisting_condition", f"COALESCE({LATEST_TEXT}, '')"),
+    ("rooms_in_household", LATEST_VALUE),
+    ("persons_in_household", LATEST_VALUE),
+)
+
+# All the keys of the healthchecks' data, with the latest non empty value for each
+DATA = """
+    COALESCE((
+        SELECT jsonb_object_agg(d.key, d.value ORDER BY h.completed_timestamp)
+        FROM eventstore_covid19triage h, jsonb_each(
+            CASE WHEN jsonb_typeof(h.data) = 'object' THEN h.data ELSE '{}' END
+        ) d
+        WHERE h.msisdn = t.msisdn
+        AND d.value NOT IN ('null', '""', '[]', '{}')
+    ), '{}')
+"""
+
+BACKFILL_SQL = """
+    INSERT INTO eventstore_healthcheckuserprofile (msisdn, %s, data)
+    SELECT t.msisdn, %s, %s
+    FROM eventstore_covid19triage t
+    WHERE t.msisdn = ANY(%%s)
+    GROUP BY t.msisdn
+    ON CONFLICT (msisdn) DO NOTHING
+""" % (
+    ", ".join(name for name, _ in FIELDS),
+    ", ".join(expr.format(name) for name, expr in FIELDS),
+    DATA,
+)
+
+MISSING_SQL = """
+    SELECT DISTINCT t.msisdn
+    FROM eventstore_covid19triage t
+    WHERE t.msisdn > %s
+    AND NOT EXISTS (
+        SELECT 1 FROM eventstore_healthcheckuserprofile p WHERE p.msisdn = t.msisdn
+    )
+    ORDER BY t.msisdn
+    LIMIT %s
+"""
+
+
+def get_missing_msisdns(batch_size):
+    """
+    Yields batches of the msisdns that have healthchecks, but no profile
+    """
+    last = ""
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(MISSING_SQL, [last, batch_size])
+            msisdns = [msisdn for (msisdn,) in cursor.fetchall()]
+        if not msisdns:
+            return
+        yield msisdns
+        last = msisdns[-1]
+
+
+def backfill_profiles(msisdns):
+    """
+    Creates the profiles for `msisdns` from their healthchecks in a single query,
+    returning the number of profiles created
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(BACKFILL_SQL, [msisdns])
+            return cursor.rowcount
+    finally:
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the missing HealthCheckUserProfiles from the historical healthchecks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="The number of profiles to create in each query",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="The number of batches to process in parallel",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        batches = get_missing_msisdns(options["batch_size"])
+        created = 0
+        while True:
+            # Only fetch a few batches ahead, to keep memory bounded
+            window = list(islice(batches, concurrency * 2))
+            if not window:
+                break
+            if concurrency > 1:
+                results = dispatch(backfill_profiles, window, concurrency)
+            else:
+                results = ((b, backfill_profiles(b), None) for b in window)
+            for _, count, exc in results:
+                if exc is not None:
+                    raise exc
+                created += count
+        self.stdout.write(f"Created {created} profiles")
@@ -0,0 +1,104 @@
+import csv
+import io
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from eventstore.forms import MomConnectImportForm
+from eventstore.models import MomConnectImport
+from registrations.models import ClinicCode
+
+HEADER = [
+    "msisdn",
+    "facility code",
+    "id type",
+    "id number",
+    "messaging consent",
+    "edd year",
+    "edd month",
+    "edd day",
+    "baby dob year",
+    "baby dob month",
+    "baby dob day",
+    "language",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures how long it takes to ingest MomConnect import CSV files of different "
+        "sizes. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[10000, 100000],
+            help="The number of rows in each of the files to benchmark",
+        )
+        parser.add_argument(
+            "--invalid-every",
+            type=int,
+            default=10,
+            help="Make every nth row invalid, to include writing errors",
+        )
+
+    def generate_csv(self, rows, invalid_every):
+        edd = date.today() + timedelta(days=90)
+        f = io.StringIO()
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i in range(rows):
+            msisdn = f"+2782{i:07d}"
+            if invalid_every and i % invalid_every == 0:
+                msisdn = "+1234"
+            writer.writerow(
+                [
+                    msisdn,
+                    "123456",
+                    "said",
+                    "9001010001088",
+                    "true",
+                    edd.year,
+                    edd.month,
+                    edd.day,
+                    "",
+                    "",
+                    "",
+                    "eng",
+                ]
+            )
+        f.seek(0)
+        return f
+
+    def benchmark(self, rows, invalid_every):
+        f = self.generate_csv(rows, invalid_every)
+        with transaction.atomic():
+            ClinicCode.objects.get_or_create(
+                value="123456",
+                defaults={"uid": "benchmark", "code": "123456", "name": "Benchmark"},
+            )
+            mcimport = MomConnectImport.objects.create()
+            form = MomConnectImportForm()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.monotonic()
+                form.create_rows(mcimport, csv.DictReader(f))
+                duration = time.monotonic() - start
+            row_count = mcimport.rows.count()
+            error_count = mcimport.errors.count()
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{rows} rows: {duration:.2f}s, {rows / duration:.0f} rows/s, "
+            f"{len(queries)} queries, {row_count} rows and {error_count} errors "
+            "written"
+        )
+
+    def handle(self, *args, **options):
+        for rows in options["rows"]:
+            self.benchmark(rows, options["invalid_every"])
@@ -0,0 +1,119 @@
+import time
+from random import Random
+
+import phonenumbers
+from django.core.management.base import BaseCommand
+
+from ndoh_hub.msisdn import _normalise_msisdn, normalise_msisdn, validate_msisdn
+
+
+def parse_normalise(msisdn):
+    """
+    Normalises the MSISDN by parsing it every time, without the fast path or cache
+    """
+    return phonenumbers.format_number(
+        phonenumbers.parse(msisdn, "ZA"), phonenumbers.PhoneNumberFormat.E164
+    )
+
+
+def parse_validate(msisdn):
+    """
+    Validates the MSISDN by parsing it every time, without the fast path or cache
+    """
+    try:
+        number = phonenumbers.parse(msisdn, "ZA")
+    except phonenumbers.NumberParseException:
+        return False
+    return phonenumbers.is_possible_number(number) and phonenumbers.is_valid_number(
+        number
+    )
+
+
+def format_msisdn(number, style):
+    national = f"0{number}"
+    return {
+        "e164": f"+27{number}",
+        "national": national,
+        "spaced": f"{national[:3]} {national[3:6]} {national[6:]}",
+        "international": f"27{number}",
+    }[style]
+
+
+# The proportion of each input format in each mix, and whether the numbers repeat
+MIXES = {
+    "e164": ({"e164": 1}, False),
+    "mixed": (
+        {"e164": 0.5, "national": 0.25, "spaced": 0.15, "international": 0.1},
+        False,
+    ),
+    "mixed, repeated": (
+        {"e164": 0.5, "national": 0.25, "spaced": 0.15, "international": 0.1},
+        True,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the time taken to normalise and validate MSISDNs, with and without "
+        "the fast path and cache, for different mixes of input formats"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=100000,
+            help="The number of MSISDNs in each mix",
+        )
+        parser.add_argument(
+            "--distinct",
+            type=int,
+            default=1000,
+            help="The number of distinct numbers in the repeated mixes",
+        )
+
+    def generate(self, count, formats, repeated, distinct):
+        random = Random(42)
+        pool = [random.randint(600000000, 849999999) for _ in range(distinct)]
+        styles, weights = zip(*formats.items())
+        msisdns = []
+        for _ in range(count):
+            if repeated:
+                number = random.choice(pool)
+            else:
+                number = random.randint(600000000, 849999999)
+            style = random.choices(styles, weights)[0]
+            msisdns.append(format_msisdn(number, style))
+        return msisdns
+
+    def measure(self, func, msisdns):
+        start = time.perf_counter()
+        for msisdn in msisdns:
+            func(msisdn)
+        return (time.perf_counter() - start) / len(msisdns) * 1000000
+
+    def handle(self, *args, **options):
+        for name, (formats, repeated) in MIXES.items():
+            msisdns = self.generate(
+                options["count"], formats, repeated, options["distinct"]
+            )
+            _normalise_msisdn.cache_clear()
+            validate_msisdn.cache_clear()
+            results = [
+                (
+                    "normalise",
+                    self.measure(parse_normalise, msisdns),
+                    self.measure(normalise_msisdn, msisdns),
+                ),
+                (
+                    "validate",
+                    self.measure(parse_validate, msisdns),
+                    self.measure(validate_msisdn, msisdns),
+                ),
+            ]
+            for operation, before, after in results:
+                self.stdout.write(
+                    f"{name}, {operation}: {before:.1f}us -> {after:.1f}us per MSISDN, "
+                    f"{before / after:.1f}x faster"
+                )
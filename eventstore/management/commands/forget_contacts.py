@@ -0,0 +1,59 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eventstore.models import ForgetContactJob
+from eventstore.tasks import bulk_forget_contacts
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes the PII of a batch of contacts from the eventstore, and deletes "
+        "them from RapidPro"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "contact_ids", nargs="*", type=str, help="The contact UUIDs to forget"
+        )
+        parser.add_argument(
+            "--file",
+            type=str,
+            help="A file containing the contact UUIDs to forget, one per line",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Process the job in this process instead of queuing a task",
+        )
+
+    def get_contact_ids(self, options):
+        contact_ids = list(options["contact_ids"])
+        if options["file"]:
+            with open(options["file"]) as f:
+                contact_ids.extend(line.strip() for line in f if line.strip())
+
+        try:
+            contact_ids = [str(uuid.UUID(c)) for c in contact_ids]
+        except ValueError as e:
+            raise CommandError(f"Invalid contact UUID: {e}")
+
+        if not contact_ids:
+            raise CommandError("No contact UUIDs specified")
+        return list(dict.fromkeys(contact_ids))
+
+    def handle(self, *args, **options):
+        job = ForgetContactJob.objects.create(
+            contact_ids=self.get_contact_ids(options), created_by="forget_contacts"
+        )
+
+        if options["sync"]:
+            bulk_forget_contacts(str(job.id))
+            job.refresh_from_db()
+        else:
+            bulk_forget_contacts.delay(str(job.id))
+
+        self.stdout.write(
+            f"Forget contact job {job.id}: {job.processed}/{job.total} processed, "
+            f"{len(job.failed)} failed"
+        )
@@ -0,0 +1,73 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from eventstore.models import Covid19Triage
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates the risk of all the historical HealthChecks using the current "
+        "risk rules, and reports how many changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="The number of HealthChecks to recalculate in each query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the changes without updating the HealthChecks",
+        )
+
+    def get_chunks(self, chunk_size):
+        """
+        Yields the IDs of consecutive chunks of HealthChecks
+        """
+        last_id = None
+        while True:
+            ids = Covid19Triage.objects.order_by("id")
+            if last_id is not None:
+                ids = ids.filter(id__gt=last_id)
+            ids = list(ids.values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    def recalculate_chunk(self, ids, dry_run):
+        """
+        Calculates the risk for the chunk in the database, and updates the ones that
+        changed. Returns the number of changes, by (old risk, new risk).
+        """
+        risk = Covid19Triage.get_risk_expression()
+        changed = Covid19Triage.objects.filter(id__in=ids).exclude(risk=risk)
+        changes = {
+            (c["risk"], c["new_risk"]): c["count"]
+            for c in changed.annotate(new_risk=risk)
+            .values("risk", "new_risk")
+            .annotate(count=Count("id"))
+            .order_by()
+        }
+        if changes and not dry_run:
+            changed.update(risk=risk)
+        return changes
+
+    def handle(self, *args, **options):
+        total, changes = 0, Counter()
+        for ids in self.get_chunks(options["chunk_size"]):
+            changes.update(self.recalculate_chunk(ids, options["dry_run"]))
+            total += len(ids)
+
+        self.stdout.write(f"Recalculated the risk for {total} HealthChecks")
+        for (old, new), count in sorted(changes.items()):
+            self.stdout.write(f"{old} -> {new}: {count}")
+        if not changes:
+            self.stdout.write("No changes")
+        elif options["dry_run"]:
+            self.stdout.write("Dry run, no changes were saved")
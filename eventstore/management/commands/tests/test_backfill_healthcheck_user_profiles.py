@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from eventstore.models import Covid19Triage, HealthCheckUserProfile
+
+
+class BackfillHealthCheckUserProfilesTests(TestCase):
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command(
+            "backfill_healthcheck_user_profiles",
+            *args,
+            stdout=out,
+            stderr=StringIO(),
+            **kwargs,
+        )
+        return out.getvalue()
+
+    def create_triage(self, msisdn, days_ago, **kwargs):
+        return Covid19Triage.objects.create(
+            msisdn=msisdn,
+            fever=False,
+            cough=False,
+            sore_throat=False,
+            tracing=True,
+            completed_timestamp=timezone.now() - timedelta(days=days_ago),
+            **kwargs,
+        )
+
+    def test_backfill(self):
+        """
+        Should create the missing profiles the same way as prefilling them from the
+        historical healthchecks would
+        """
+        self.create_triage(
+            "+27820001001",
+            2,
+            first_name="oldfirst",
+            last_name="oldlast",
+            province="ZA-WC",
+            date_of_birth=date(1990, 1, 1),
+            rooms_in_household=0,
+            data={"replace": "old", "keep": "value", "replacebool": True},
+        )
+        self.create_triage(
+            "+27820001001",
+            1,
+            last_name="newlast",
+            city="Cape Town",
+            preexisting_condition="no",
+            data={"replace": "new", "keep": "", "replacebool": False, "none": None},
+        )
+        # Out of order, should still use the latest completed healthcheck
+        self.create_triage("+27820001001", 3, last_name="oldestlast", age="18-40")
+        self.create_triage("+27820001002", 1, city="Durban")
+        self.create_triage("+27820001003", 1, data=None)
+        prefilled = [
+            HealthCheckUserProfile.objects.get_or_prefill(msisdn)
+            for msisdn in ("+27820001001", "+27820001002")
+        ]
+
+        out = self.call_command("--batch-size=1", "--concurrency=1")
+        self.assertEqual(out.strip(), "Created 3 profiles")
+
+        fields = [f.name for f in HealthCheckUserProfile._meta.fields]
+        for expected in prefilled:
+            profile = HealthCheckUserProfile.objects.get(msisdn=expected.msisdn)
+            for field in fields:
+                self.assertEqual(
+                    getattr(profile, field), getattr(expected, field), field
+                )
+        profile = HealthCheckUserProfile.objects.get(msisdn="+27820001003")
+        self.assertEqual(profile.data, {})
+
+    def test_existing_profile(self):
+        """
+        Should not change existing profiles
+        """
+        HealthCheckUserProfile.objects.create(msisdn="+27820001001", city="Durban")
+        self.create_triage("+27820001001", 1, city="Cape Town")
+
+        out = self.call_command("--concurrency=1")
+        self.assertEqual(out.strip(), "Created 0 profiles")
+        profile = HealthCheckUserProfile.objects.get(msisdn="+27820001001")
+        self.assertEqual(profile.city, "Durban")
@@ -0,0 +1,29 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from eventstore.models import ImportRow, MomConnectImport
+
+
+class BenchmarkMomConnectImportTests(TestCase):
+    def test_benchmark(self):
+        """
+        Should report the results for each file size, and roll back all the changes
+        """
+        out = StringIO()
+        call_command(
+            "benchmark_momconnect_import",
+            "--rows",
+            "10",
+            "20",
+            "--invalid-every",
+            "5",
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("8 rows and 2 errors written", lines[0])
+        self.assertIn("16 rows and 4 errors written", lines[1])
+        self.assertFalse(MomConnectImport.objects.exists())
+        self.assertFalse(ImportRow.objects.exists())
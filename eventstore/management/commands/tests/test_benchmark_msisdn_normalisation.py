@@ -0,0 +1,24 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+class BenchmarkMSISDNNormalisationTests(SimpleTestCase):
+    def test_benchmark(self):
+        """
+        Should report the results for each operation on each mix
+        """
+        out = StringIO()
+        call_command(
+            "benchmark_msisdn_normalisation",
+            "--count",
+            "100",
+            "--distinct",
+            "10",
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith("e164, normalise: "))
+        self.assertTrue(lines[5].startswith("mixed, repeated, validate: "))
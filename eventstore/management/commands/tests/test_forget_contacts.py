@@ -0,0 +1,49 @@
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from eventstore.models import ForgetContactJob
+
+
+class ForgetContactsTests(TestCase):
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command("forget_contacts", *args, stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    def test_no_contacts(self):
+        self.assertRaises(CommandError, self.call_command)
+
+    def test_invalid_contact(self):
+        self.assertRaises(CommandError, self.call_command, "not-a-uuid")
+
+    @mock.patch("eventstore.management.commands.forget_contacts.bulk_forget_contacts")
+    def test_queues_job(self, mock_bulk_forget_contacts):
+        """
+        Should create a single job for all the contacts from the arguments and the
+        file, and queue the task for it
+        """
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+            f.write(
+                "9e12d04c-af25-40b6-aa4f-57c72e8e3f91\n\n"
+                "0b8c1bde-0b0a-4bd1-a3d5-aee43f4e2a3b\n"
+            )
+            f.flush()
+            out = self.call_command(
+                "9e12d04c-af25-40b6-aa4f-57c72e8e3f91", "--file", f.name
+            )
+
+        [job] = ForgetContactJob.objects.all()
+        self.assertEqual(
+            job.contact_ids,
+            [
+                "9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+                "0b8c1bde-0b0a-4bd1-a3d5-aee43f4e2a3b",
+            ],
+        )
+        mock_bulk_forget_contacts.delay.assert_called_once_with(str(job.id))
+        self.assertIn("0/2 processed", out)
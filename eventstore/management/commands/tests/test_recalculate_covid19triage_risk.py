@@ -0,0 +1,126 @@
+from io import StringIO
+from itertools import product
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from eventstore.models import Covid19Triage
+
+
+class RecalculateCovid19TriageRiskTests(TestCase):
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command(
+            "recalculate_covid19triage_risk",
+            *args,
+            stdout=out,
+            stderr=StringIO(),
+            **kwargs,
+        )
+        return out.getvalue()
+
+    def create_triage(self, risk, **kwargs):
+        fields = {
+            "msisdn": "+27820001001",
+            "fever": False,
+            "cough": False,
+            "sore_throat": False,
+            "tracing": True,
+            "exposure": Covid19Triage.EXPOSURE_NO,
+            "age": Covid19Triage.AGE_18T40,
+        }
+        fields.update(kwargs)
+        return Covid19Triage.objects.create(risk=risk, **fields)
+
+    def test_risk_expression_matches_calculate_risk(self):
+        """
+        The database expression should give the same risk as calculate_risk for every
+        combination of symptoms, exposure, and age
+        """
+        triages = [
+            Covid19Triage(
+                msisdn="+27820001001",
+                fever=fever,
+                cough=cough,
+                sore_throat=sore_throat,
+                difficulty_breathing=difficulty_breathing,
+                muscle_pain=muscle_pain,
+                smell=smell,
+                exposure=exposure,
+                age=age,
+                tracing=True,
+            )
+            for (
+                fever,
+                cough,
+                sore_throat,
+                difficulty_breathing,
+                muscle_pain,
+                smell,
+                exposure,
+                age,
+            ) in product(
+                [True, False],
+                [True, False],
+                [True, False],
+                [True, False, None],
+                [True, False, None],
+                [True, False, None],
+                [e for e, _ in Covid19Triage.EXPOSURE_CHOICES],
+                [Covid19Triage.AGE_18T40, Covid19Triage.AGE_O65],
+            )
+        ]
+        Covid19Triage.objects.bulk_create(triages)
+        expected = {t.id: t.calculate_risk() for t in triages}
+        actual = dict(
+            Covid19Triage.objects.annotate(
+                calculated_risk=Covid19Triage.get_risk_expression()
+            ).values_list("id", "calculated_risk")
+        )
+        self.assertEqual(actual, expected)
+
+    def test_recalculate(self):
+        """
+        Should update only the HealthChecks whose risk changed, and report the changes
+        """
+        low = self.create_triage(Covid19Triage.RISK_LOW, fever=True, cough=True)
+        unchanged = self.create_triage(Covid19Triage.RISK_LOW)
+        high = self.create_triage(Covid19Triage.RISK_HIGH)
+        moderate = self.create_triage(
+            Covid19Triage.RISK_MODERATE, exposure=Covid19Triage.EXPOSURE_YES
+        )
+
+        out = self.call_command("--chunk-size=3")
+        self.assertEqual(
+            out.splitlines(),
+            [
+                "Recalculated the risk for 4 HealthChecks",
+                "high -> low: 1",
+                "low -> moderate: 1",
+            ],
+        )
+        for triage, risk in [
+            (low, Covid19Triage.RISK_MODERATE),
+            (unchanged, Covid19Triage.RISK_LOW),
+            (high, Covid19Triage.RISK_LOW),
+            (moderate, Covid19Triage.RISK_MODERATE),
+        ]:
+            triage.refresh_from_db()
+            self.assertEqual(triage.risk, risk)
+
+    def test_dry_run(self):
+        """
+        A dry run should report the changes without saving them
+        """
+        triage = self.create_triage(Covid19Triage.RISK_HIGH)
+        out = self.call_command("--dry-run")
+        self.assertEqual(
+            out.splitlines(),
+            [
+                "Recalculated the risk for 1 HealthChecks",
+                "high -> low: 1",
+                "Dry run, no changes were saved",
+            ],
+        )
+        triage.refresh_from_db()
+        self.assertEqual(triage.risk, Covid19Triage.RISK_HIGH)
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:27
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0068_whatsapptemplatesendstatus_contact_uuid_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ForgetContactJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(auto_now=True)),
+                (
+                    "created_by",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "status",
+                    models.PositiveSmallIntegerField(
+                        choices=[(0, "Pending"), (1, "Processing"), (2, "Complete")],
+                        default=0,
+                    ),
+                ),
+                ("contact_ids", models.JSONField(default=list)),
+                (
+                    "processed",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="The number of contacts that have been processed",
+                    ),
+                ),
+                (
+                    "failed",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="The contacts that could not be deleted from RapidPro",
+                    ),
+                ),
+            ],
+        ),
+    ]
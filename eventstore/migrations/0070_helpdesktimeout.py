@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:31
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0069_forgetcontactjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HelpdeskTimeout",
+            fields=[
+                ("contact_id", models.UUIDField(primary_key=True, serialize=False)),
+                (
+                    "wa_id",
+                    models.CharField(
+                        blank=True, db_index=True, default="", max_length=255
+                    ),
+                ),
+                (
+                    "message_id",
+                    models.CharField(
+                        help_text="The ID of the message waiting for a reply",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "timeout_date",
+                    models.DateField(
+                        default=datetime.date.today,
+                        help_text="The date that the wait started",
+                    ),
+                ),
+                (
+                    "due_date",
+                    models.DateField(
+                        db_index=True,
+                        help_text="The date that the conversation should be archived",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(auto_now=True)),
+                (
+                    "created_by",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0070_helpdesktimeout"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="importerror",
+            name="row_number",
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="importrow",
+            name="row_number",
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="momconnectimport",
+            name="last_uploaded_row",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
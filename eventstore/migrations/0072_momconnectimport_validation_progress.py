@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0071_import_row_number_integer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="momconnectimport",
+            name="last_validated_row",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
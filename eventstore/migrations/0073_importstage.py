@@ -0,0 +1,66 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0072_momconnectimport_validation_progress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportStage",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "stage",
+                    models.PositiveSmallIntegerField(
+                        choices=[(0, "Parse"), (1, "Validate"), (2, "Upload")]
+                    ),
+                ),
+                ("processed", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "rate",
+                    models.FloatField(
+                        blank=True, help_text="Rows processed per second", null=True
+                    ),
+                ),
+                ("started", models.DateTimeField(default=django.utils.timezone.now)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "latency_buckets",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="Count of RapidPro requests in each of the LATENCY_BUCKETS, and +Inf",
+                    ),
+                ),
+                ("latency_sum", models.FloatField(default=0)),
+                ("latency_count", models.PositiveIntegerField(default=0)),
+                (
+                    "mcimport",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stages",
+                        to="eventstore.momconnectimport",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("mcimport", "stage")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0073_importstage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="momconnectimport",
+            name="file",
+            field=models.FileField(blank=True, upload_to="momconnect_imports/"),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def create_counters(apps, schema_editor):
+    StudyArmCounter = apps.get_model("eventstore", "StudyArmCounter")
+    HealthCheckUserProfile = apps.get_model("eventstore", "HealthCheckUserProfile")
+    HCSStudyBRandomization = apps.get_model("eventstore", "HCSStudyBRandomization")
+
+    counters = [
+        StudyArmCounter(study="hcs_study_a", province=p["province"], count=p["count"])
+        for p in HealthCheckUserProfile.objects.filter(hcs_study_a_arm__isnull=False)
+        .values("province")
+        .annotate(count=Count("*"))
+    ]
+    counters.extend(
+        StudyArmCounter(
+            study="hcs_study_b",
+            source=r["source"],
+            province=r["province"],
+            count=r["count"],
+        )
+        for r in HCSStudyBRandomization.objects.filter(study_b_arm__isnull=False)
+        .values("source", "province")
+        .annotate(count=Count("*"))
+    )
+    StudyArmCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0074_momconnectimport_file"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StudyArmCounter",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "study",
+                    models.CharField(
+                        choices=[
+                            ("hcs_study_a", "HealthCheck study A"),
+                            ("hcs_study_b", "HealthCheck study B"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("source", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "province",
+                    models.CharField(
+                        choices=[
+                            ("ZA-EC", "Eastern Cape"),
+                            ("ZA-FS", "Free State"),
+                            ("ZA-GT", "Gauteng"),
+                            ("ZA-LP", "Limpopo"),
+                            ("ZA-MP", "Mpumalanga"),
+                            ("ZA-NC", "Northern Cape"),
+                            ("ZA-NL", "Kwazulu-Natal"),
+                            ("ZA-NW", "North-West (South Africa)"),
+                            ("ZA-WC", "Western Cape"),
+                        ],
+                        max_length=6,
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("study", "source", "province")},
+            },
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
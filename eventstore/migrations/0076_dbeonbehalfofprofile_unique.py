@@ -0,0 +1,61 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:13
+
+from django.db import migrations
+from django.db.models import Count
+
+CONDITIONS = (
+    "obesity",
+    "diabetes",
+    "hypertension",
+    "cardio",
+    "asthma",
+    "tb",
+    "pregnant",
+    "respiratory",
+    "cardiac",
+    "immuno",
+)
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Keeps the latest profile for each msisdn and name, filling in any conditions it
+    doesn't have from the older duplicates, and deletes the rest
+    """
+    DBEOnBehalfOfProfile = apps.get_model("eventstore", "DBEOnBehalfOfProfile")
+    duplicates = (
+        DBEOnBehalfOfProfile.objects.values("msisdn", "name")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        latest, *older = DBEOnBehalfOfProfile.objects.filter(
+            msisdn=duplicate["msisdn"], name=duplicate["name"]
+        ).order_by("-id")
+        for field in CONDITIONS:
+            if getattr(latest, field) is None:
+                values = (getattr(p, field) for p in older)
+                setattr(latest, field, next((v for v in values if v is not None), None))
+        latest.save(update_fields=CONDITIONS)
+        DBEOnBehalfOfProfile.objects.filter(id__in=[p.id for p in older]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0075_studyarmcounter"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        # The unique index on (msisdn, name) also serves msisdn lookups
+        migrations.RemoveIndex(
+            model_name="dbeonbehalfofprofile",
+            name="eventstore__msisdn_3a3304_idx",
+        ),
+        migrations.AlterUniqueTogether(
+            name="dbeonbehalfofprofile",
+            unique_together={("msisdn", "name")},
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eventstore", "0076_dbeonbehalfofprofile_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="momconnectimport",
+            name="uploaded_rows",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="The rows after the last uploaded row that have been uploaded",
+            ),
+        ),
+    ]
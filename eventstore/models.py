@@ -1,13 +1,17 @@
 import random
 import uuid
-from datetime import date
+from datetime import date, timedelta
+from functools import partial
 from typing import Text
 
 import pycountry
 from django.conf import settings
 from django.conf.locale import LANG_INFO
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import Exact, GreaterThanOrEqual, LessThan
 from django.utils import timezone
 
 from eventstore.hcs_tasks import start_study_c_registration_flow, update_turn_contact
@@ -406,6 +410,33 @@ class Event(models.Model):
         return self.status == "failed"
 
 
+class HelpdeskTimeout(models.Model):
+    """
+    Contacts that are waiting for a reply from the helpdesk, indexed by the date that
+    their wait expires
+    """
+
+    contact_id = models.UUIDField(primary_key=True)
+    wa_id = models.CharField(max_length=255, blank=True, default="", db_index=True)
+    message_id = models.CharField(
+        max_length=255, help_text="The ID of the message waiting for a reply"
+    )
+    timeout_date = models.DateField(
+        default=date.today, help_text="The date that the wait started"
+    )
+    due_date = models.DateField(
+        db_index=True, help_text="The date that the conversation should be archived"
+    )
+    timestamp = models.DateTimeField(auto_now=True)
+    created_by = models.CharField(max_length=255, blank=True, default="")
+
+    def save(self, *args, **kwargs):
+        self.due_date = self.timeout_date + timedelta(
+            days=settings.HELPDESK_TIMEOUT_DAYS + 1
+        )
+        super().save(*args, **kwargs)
+
+
 class ExternalRegistrationID(models.Model):
     """
     Keeps track of all the registration IDs that we've processed from external
@@ -553,6 +584,37 @@ class Covid19Triage(models.Model):
             else:
                 return self.RISK_LOW
 
+    @classmethod
+    def get_risk_expression(cls):
+        """
+        The same rules as calculate_risk, as a database expression, so that the risk
+        can be calculated for many rows at once
+        """
+        symptoms = sum(
+            Cast(Coalesce(field, False), models.IntegerField())
+            for field in [
+                "fever",
+                "cough",
+                "sore_throat",
+                "difficulty_breathing",
+                "muscle_pain",
+                "smell",
+            ]
+        )
+        exposed = Q(exposure=cls.EXPOSURE_YES)
+        return Case(
+            When(GreaterThanOrEqual(symptoms, 3), then=Value(cls.RISK_HIGH)),
+            When(
+                Q(Exact(symptoms, 2)) & (exposed | Q(age=cls.AGE_O65)),
+                then=Value(cls.RISK_HIGH),
+            ),
+            When(Exact(symptoms, 2), then=Value(cls.RISK_MODERATE)),
+            When(Q(Exact(symptoms, 1)) & exposed, then=Value(cls.RISK_HIGH)),
+            When(Exact(symptoms, 1), then=Value(cls.RISK_MODERATE)),
+            When(exposed, then=Value(cls.RISK_MODERATE)),
+            default=Value(cls.RISK_LOW),
+        )
+
 
 class Covid19TriageStart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -562,6 +624,126 @@ class Covid19TriageStart(models.Model):
     created_by = models.CharField(max_length=255, blank=True, default="")
 
 
+class StudyArmCounterManager(models.Manager):
+    def increment(self, study: Text, province: Text, source: Text = "") -> None:
+        counter, _ = self.get_or_create(study=study, source=source, province=province)
+        self.filter(pk=counter.pk).update(count=F("count") + 1)
+
+    def increment_if_under_target(
+        self,
+        study: Text,
+        province: Text,
+        target_total: int,
+        target_percentage: int,
+        source: Text = "",
+    ) -> bool:
+        """
+        Increments the counter if the province and source are under either of their
+        targets, like get_totals. The targets are checked by the UPDATE itself, so
+        that concurrent assignments can't all see the same count and go over them.
+        Returns whether the counter was incremented.
+        """
+        counter, _ = self.get_or_create(study=study, source=source, province=province)
+        all_total = (
+            self.filter(study=study)
+            .order_by()
+            .values("study")
+            .annotate(total=Sum("count"))
+            .values("total")
+        )
+        under_target = Q(count__lt=target_total) | Q(
+            LessThan(F("count") * 100, Subquery(all_total) * target_percentage)
+        )
+        return bool(
+            self.filter(under_target, pk=counter.pk).update(count=F("count") + 1)
+        )
+
+    def get_totals(self, study: Text, province: Text, source: Text = ""):
+        """
+        Returns the number of participants assigned an arm in the province and
+        source, and what percentage that is of all the study's participants
+        """
+        all_total = province_total = 0
+        for counter in self.filter(study=study):
+            all_total += counter.count
+            if counter.province == province and counter.source == source:
+                province_total += counter.count
+
+        province_percentage = 0
+        if all_total > 0:
+            province_percentage = province_total * 100 / all_total
+
+        return province_total, province_percentage
+
+    def get_actual_counts(self, study: Text) -> dict:
+        """
+        Counts the participants assigned an arm in the study's table, by source and
+        province
+        """
+        if study == StudyArmCounter.Study.HCS_STUDY_A:
+            participants = HealthCheckUserProfile.objects.filter(
+                hcs_study_a_arm__isnull=False
+            ).annotate(source=Value(""))
+        else:
+            participants = HCSStudyBRandomization.objects.filter(
+                study_b_arm__isnull=False
+            )
+        return {
+            (p["source"], p["province"]): p["count"]
+            for p in participants.values("source", "province").annotate(
+                count=Count("*")
+            )
+        }
+
+    def reconcile(self, study: Text) -> list:
+        """
+        Corrects the study's counters to match its table. Returns a
+        (source, province, counter, actual) tuple for every counter that was wrong.
+        """
+        mismatches = []
+        with transaction.atomic():
+            # Lock the counters before counting, so that any arm assignments in
+            # progress are either included in the count, or wait for us to finish
+            counters = {
+                (c.source, c.province): c.count
+                for c in self.select_for_update().filter(study=study)
+            }
+            actual = self.get_actual_counts(study)
+            for source, province in sorted(set(counters) | set(actual)):
+                count = counters.get((source, province), 0)
+                expected = actual.get((source, province), 0)
+                if count != expected:
+                    mismatches.append((source, province, count, expected))
+                    self.update_or_create(
+                        study=study,
+                        source=source,
+                        province=province,
+                        defaults={"count": expected},
+                    )
+        return mismatches
+
+
+class StudyArmCounter(models.Model):
+    """
+    The number of participants that have been assigned an arm in each study, so that
+    we don't need to count them for every assignment
+    """
+
+    class Study(models.TextChoices):
+        HCS_STUDY_A = "hcs_study_a", "HealthCheck study A"
+        HCS_STUDY_B = "hcs_study_b", "HealthCheck study B"
+
+    study = models.CharField(max_length=20, choices=Study.choices)
+    source = models.CharField(max_length=255, blank=True, default="")
+    province = models.CharField(max_length=6, choices=Covid19Triage.PROVINCE_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = StudyArmCounterManager()
+
+    class Meta:
+        unique_together = ("study", "source", "province")
+
+
 class HCSStudyBRandomization(models.Model):
     ARM_CONTROL = "C"
     ARM_TREATMENT_1 = "T1"
@@ -591,48 +773,63 @@ class HCSStudyBRandomization(models.Model):
         max_length=3, choices=STUDY_ARM_B_CHOICES, null=True, default=None
     )
 
+    # Whether the arm has been counted, either when it was assigned or saved
+    _counted_study_b_arm = False
+
     def process_study_b(self):
         if self.msisdn not in settings.HCS_STUDY_B_WHITELIST:
             if not settings.HCS_STUDY_B_ACTIVE:
                 return
         if self.created_by in settings.HCS_STUDY_B_CREATED_BY and not self.study_b_arm:
-            self.study_b_arm = self.get_random_study_b_arm()
+            self.study_b_arm = self.assign_random_study_b_arm()
 
             if self.study_b_arm:
-                update_turn_contact.delay(
-                    self.msisdn, "hcs_study_b_arm", self.study_b_arm
+                transaction.on_commit(
+                    partial(
+                        update_turn_contact.delay,
+                        self.msisdn,
+                        "hcs_study_b_arm",
+                        self.study_b_arm,
+                    )
                 )
 
-    def get_random_study_b_arm(self):
-        target_total = HCS_STUDY_B_TARGETS[self.source][self.province]["total"]
-        target_percentage = HCS_STUDY_B_TARGETS[self.source][self.province][
-            "percentage"
-        ]
-
-        actual_total, actual_percentage = self.get_study_totals_per_province()
-
-        if actual_total < target_total or actual_percentage < target_percentage:
+    def assign_random_study_b_arm(self):
+        """
+        Returns a random arm, if the province and source are still under their
+        targets, counting it straight away so that concurrent assignments can't go
+        over the targets
+        """
+        target = HCS_STUDY_B_TARGETS[self.source][self.province]
+        if StudyArmCounter.objects.increment_if_under_target(
+            StudyArmCounter.Study.HCS_STUDY_B,
+            self.province,
+            target["total"],
+            target["percentage"],
+            self.source,
+        ):
+            self._counted_study_b_arm = True
             return random.choice(self.STUDY_ARM_B_CHOICES)[0]
 
     def get_study_totals_per_province(self):
-        all_provinces = HCSStudyBRandomization.objects.filter(
-            study_b_arm__isnull=False
-        ).values("province", "source")
-
-        all_total = all_provinces.count()
-        province_total = all_provinces.filter(
-            province=self.province, source=self.source
-        ).count()
-
-        province_percentage = 0
-        if all_total > 0:
-            province_percentage = province_total * 100 / all_total
+        return StudyArmCounter.objects.get_totals(
+            StudyArmCounter.Study.HCS_STUDY_B, self.province, self.source
+        )
 
-        return province_total, province_percentage
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_study_b_arm = bool(instance.study_b_arm)
+        return instance
 
     def save(self, *args, **kwargs):
-        self.process_study_b()
-        super().save(*args, **kwargs)
+        with transaction.atomic(savepoint=False):
+            self.process_study_b()
+            if self.study_b_arm and not self._counted_study_b_arm:
+                StudyArmCounter.objects.increment(
+                    StudyArmCounter.Study.HCS_STUDY_B, self.province, self.source
+                )
+            super().save(*args, **kwargs)
+        self._counted_study_b_arm = bool(self.study_b_arm)
 
 
 class HealthCheckUserProfileManager(models.Manager):
@@ -644,12 +841,47 @@ class HealthCheckUserProfileManager(models.Manager):
         try:
             return self.get(msisdn=msisdn)
         except self.model.DoesNotExist:
-            healthchecks = Covid19Triage.objects.filter(msisdn=msisdn).order_by(
-                "completed_timestamp"
-            )
             profile = self.model()
-            for healthcheck in healthchecks.iterator():
-                profile.update_from_healthcheck(healthcheck)
+            self.prefill(profile, msisdn)
+            return profile
+
+    def prefill(self, profile: "HealthCheckUserProfile", msisdn: Text) -> None:
+        """
+        Updates the profile with the data in the historical healthchecks
+        """
+        healthchecks = Covid19Triage.objects.filter(msisdn=msisdn).order_by(
+            "completed_timestamp"
+        )
+        for healthcheck in healthchecks.iterator():
+            profile.update_from_healthcheck(healthcheck)
+
+    def get_or_build(self, msisdn: Text) -> "HealthCheckUserProfile":
+        """
+        Either gets the existing user profile, or returns a new empty one. Profiles
+        are updated on every healthcheck, and the backfill_healthcheck_user_profiles
+        command creates them from the historical healthchecks, so we only need to
+        prefill while that backfill is still running.
+        """
+        if settings.HEALTHCHECK_PROFILE_PREFILL_ENABLED:
+            return self.get_or_prefill(msisdn)
+        try:
+            return self.get(msisdn=msisdn)
+        except self.model.DoesNotExist:
+            return self.model()
+
+    def get_for_update(self, msisdn: Text) -> "HealthCheckUserProfile":
+        """
+        Gets the user profile, locked until the end of the transaction, so that
+        concurrent healthchecks for the same user are applied one after the other.
+        If there isn't one, returns a new one like get_or_build, to be inserted by
+        save_changes.
+        """
+        try:
+            return self.select_for_update().get(msisdn=msisdn)
+        except self.model.DoesNotExist:
+            profile = self.model(msisdn=msisdn)
+            if settings.HEALTHCHECK_PROFILE_PREFILL_ENABLED:
+                self.prefill(profile, msisdn)
             return profile
 
 
@@ -715,6 +947,9 @@ class HealthCheckUserProfile(models.Model):
 
     objects = HealthCheckUserProfileManager()
 
+    # Whether the arm has been counted, either when it was assigned or saved
+    _counted_study_a_arm = False
+
     def update_from_healthcheck(self, healthcheck: Covid19Triage) -> None:
         """
         Updates the profile with the data from the latest healthcheck
@@ -763,11 +998,16 @@ class HealthCheckUserProfile(models.Model):
                 return
 
         if created_by == settings.HCS_STUDY_A_CREATED_BY and not self.hcs_study_a_arm:
-            self.hcs_study_a_arm = self.get_random_study_arm()
+            self.hcs_study_a_arm = self.assign_random_study_a_arm()
 
             if self.hcs_study_a_arm:
-                update_turn_contact.delay(
-                    self.msisdn, "hcs_study_a_arm", self.hcs_study_a_arm
+                transaction.on_commit(
+                    partial(
+                        update_turn_contact.delay,
+                        self.msisdn,
+                        "hcs_study_a_arm",
+                        self.hcs_study_a_arm,
+                    )
                 )
 
     def process_study_c(self, risk, created_by):
@@ -777,40 +1017,75 @@ class HealthCheckUserProfile(models.Model):
         if not self.hcs_study_c_testing_arm and not self.hcs_study_c_quarantine_arm:
             if risk == Covid19Triage.RISK_HIGH:
                 self.hcs_study_c_testing_arm = self.get_random_study_arm()
-                update_turn_contact.delay(
-                    self.msisdn, "hcs_study_c_arm", self.hcs_study_c_testing_arm
+                transaction.on_commit(
+                    partial(
+                        update_turn_contact.delay,
+                        self.msisdn,
+                        "hcs_study_c_arm",
+                        self.hcs_study_c_testing_arm,
+                    )
                 )
 
             if risk == Covid19Triage.RISK_MODERATE:
                 self.hcs_study_c_quarantine_arm = self.get_random_study_quarantine_arm()
-                update_turn_contact.delay(
-                    self.msisdn,
-                    "hcs_study_c_quarantine_arm",
-                    self.hcs_study_c_quarantine_arm,
+                transaction.on_commit(
+                    partial(
+                        update_turn_contact.delay,
+                        self.msisdn,
+                        "hcs_study_c_quarantine_arm",
+                        self.hcs_study_c_quarantine_arm,
+                    )
                 )
 
             if risk == Covid19Triage.RISK_HIGH or risk == Covid19Triage.RISK_MODERATE:
-                start_study_c_registration_flow.delay(
-                    self.msisdn,
-                    self.hcs_study_c_testing_arm,
-                    self.hcs_study_c_quarantine_arm,
-                    risk,
-                    created_by,
+                transaction.on_commit(
+                    partial(
+                        start_study_c_registration_flow.delay,
+                        self.msisdn,
+                        self.hcs_study_c_testing_arm,
+                        self.hcs_study_c_quarantine_arm,
+                        risk,
+                        created_by,
+                    )
                 )
 
     def get_study_totals_per_province(self):
-        all_provinces = HealthCheckUserProfile.objects.filter(
-            hcs_study_a_arm__isnull=False
-        ).values("province")
+        return StudyArmCounter.objects.get_totals(
+            StudyArmCounter.Study.HCS_STUDY_A, self.province
+        )
 
-        all_total = all_provinces.count()
-        province_total = all_provinces.filter(province=self.province).count()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_study_a_arm = bool(instance.hcs_study_a_arm)
+        return instance
 
-        province_percentage = 0
-        if all_total > 0:
-            province_percentage = province_total * 100 / all_total
+    def update_study_arm_counters(self):
+        if self.hcs_study_a_arm and not self._counted_study_a_arm:
+            StudyArmCounter.objects.increment(
+                StudyArmCounter.Study.HCS_STUDY_A, self.province
+            )
 
-        return province_total, province_percentage
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            self.update_study_arm_counters()
+            super().save(*args, **kwargs)
+        self._counted_study_a_arm = bool(self.hcs_study_a_arm)
+
+    def save_changes(self):
+        """
+        Saves a profile from get_for_update in a single query. Existing profiles are
+        locked, so they're updated. New profiles are inserted, which raises an
+        IntegrityError if a concurrent healthcheck inserted it first.
+        """
+        if self._state.adding:
+            self.save(force_insert=True)
+        else:
+            self.save(
+                update_fields=[
+                    f.name for f in self._meta.concrete_fields if not f.primary_key
+                ]
+            )
 
     def get_random_study_arm(self):
         target_total = HCS_STUDY_A_TARGETS[self.province]["total"]
@@ -821,6 +1096,21 @@ class HealthCheckUserProfile(models.Model):
         if actual_total < target_total or actual_percentage < target_percentage:
             return random.choice(self.STUDY_ARM_CHOICES)[0]
 
+    def assign_random_study_a_arm(self):
+        """
+        Returns a random arm, if the province is still under its targets, counting
+        it straight away so that concurrent assignments can't go over the targets
+        """
+        target = HCS_STUDY_A_TARGETS[self.province]
+        if StudyArmCounter.objects.increment_if_under_target(
+            StudyArmCounter.Study.HCS_STUDY_A,
+            self.province,
+            target["total"],
+            target["percentage"],
+        ):
+            self._counted_study_a_arm = True
+            return random.choice(self.STUDY_ARM_CHOICES)[0]
+
     def get_random_study_quarantine_arm(self):
         return random.choice(self.STUDY_ARM_QUARANTINE_CHOICES)[0]
 
@@ -849,33 +1139,40 @@ class DBEOnBehalfOfProfileManager(models.Manager):
         self, healthcheck: Covid19Triage
     ) -> "DBEOnBehalfOfProfile":
         """
-        Either updates an existing profile, or creates a new one.
+        Either updates an existing profile, or creates a new one, using a single
+        INSERT ... ON CONFLICT query. The returned profile doesn't have its id set.
         """
-        return self.update_or_create(
-            msisdn=healthcheck.msisdn,
-            name=healthcheck.data.get("name"),
-            defaults={
-                "age": healthcheck.data.get("age"),
-                "gender": healthcheck.gender,
-                "province": healthcheck.province,
-                "city": healthcheck.city,
-                "city_location": healthcheck.city_location or "",
-                "location": healthcheck.location,
-                "school": healthcheck.data.get("school_name"),
-                "school_emis": healthcheck.data.get("school_emis"),
-                "preexisting_condition": healthcheck.preexisting_condition,
-                "obesity": healthcheck.data.get("obesity"),
-                "diabetes": healthcheck.data.get("diabetes"),
-                "hypertension": healthcheck.data.get("hypertension"),
-                "cardio": healthcheck.data.get("cardio"),
-                "asthma": healthcheck.data.get("asthma"),
-                "tb": healthcheck.data.get("tb"),
-                "pregnant": healthcheck.data.get("pregnant"),
-                "respiratory": healthcheck.data.get("respiratory"),
-                "cardiac": healthcheck.data.get("cardiac"),
-                "immuno": healthcheck.data.get("immuno"),
-            },
+        defaults = {
+            "age": healthcheck.data.get("age"),
+            "gender": healthcheck.gender,
+            "province": healthcheck.province,
+            "city": healthcheck.city,
+            "city_location": healthcheck.city_location or "",
+            "location": healthcheck.location,
+            "school": healthcheck.data.get("school_name"),
+            "school_emis": healthcheck.data.get("school_emis"),
+            "preexisting_condition": healthcheck.preexisting_condition,
+            "obesity": healthcheck.data.get("obesity"),
+            "diabetes": healthcheck.data.get("diabetes"),
+            "hypertension": healthcheck.data.get("hypertension"),
+            "cardio": healthcheck.data.get("cardio"),
+            "asthma": healthcheck.data.get("asthma"),
+            "tb": healthcheck.data.get("tb"),
+            "pregnant": healthcheck.data.get("pregnant"),
+            "respiratory": healthcheck.data.get("respiratory"),
+            "cardiac": healthcheck.data.get("cardiac"),
+            "immuno": healthcheck.data.get("immuno"),
+        }
+        profile = self.model(
+            msisdn=healthcheck.msisdn, name=healthcheck.data.get("name"), **defaults
         )
+        self.bulk_create(
+            [profile],
+            update_conflicts=True,
+            unique_fields=["msisdn", "name"],
+            update_fields=list(defaults),
+        )
+        return profile
 
 
 class DBEOnBehalfOfProfile(models.Model):
@@ -910,7 +1207,7 @@ class DBEOnBehalfOfProfile(models.Model):
     objects = DBEOnBehalfOfProfileManager()
 
     class Meta:
-        indexes = [models.Index(fields=["msisdn"])]
+        unique_together = ("msisdn", "name")
 
 
 class MomConnectImport(models.Model):
@@ -932,8 +1229,16 @@ class MomConnectImport(models.Model):
     status = models.PositiveSmallIntegerField(
         choices=Status.choices, default=Status.VALIDATING
     )
-    last_uploaded_row = models.PositiveSmallIntegerField(default=0)
+    last_validated_row = models.PositiveIntegerField(default=0)
+    last_uploaded_row = models.PositiveIntegerField(default=0)
+    uploaded_rows = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="The rows after the last uploaded row that have been uploaded",
+    )
     source = models.CharField(max_length=255, default="MomConnect Import")
+    # The uploaded file, until it has been parsed
+    file = models.FileField(upload_to="momconnect_imports/", blank=True)
 
 
 class ImportError(models.Model):
@@ -956,7 +1261,7 @@ class ImportError(models.Model):
     mcimport = models.ForeignKey(
         to=MomConnectImport, on_delete=models.CASCADE, related_name="errors"
     )
-    row_number = models.PositiveSmallIntegerField()
+    row_number = models.PositiveIntegerField()
     error_type = models.PositiveSmallIntegerField(choices=ErrorType.choices)
     error_args = models.JSONField(blank=True)
 
@@ -1019,7 +1324,7 @@ class ImportRow(models.Model):
     mcimport = models.ForeignKey(
         to=MomConnectImport, on_delete=models.CASCADE, related_name="rows"
     )
-    row_number = models.PositiveSmallIntegerField()
+    row_number = models.PositiveIntegerField()
     msisdn = models.CharField(max_length=255, validators=[za_phone_number])
     messaging_consent = models.BooleanField(validators=[validate_true])
     research_consent = models.BooleanField(default=False)
@@ -1096,6 +1401,58 @@ class ImportRow(models.Model):
                 raise ValidationError(f"Invalid date of birth date, {str(e)}")
 
 
+class ImportStage(models.Model):
+    """
+    Progress and throughput of one of the stages of processing a MomConnectImport
+    """
+
+    class Stage(models.IntegerChoices):
+        PARSE = 0, "Parse"
+        VALIDATE = 1, "Validate"
+        UPLOAD = 2, "Upload"
+
+    # Upper bounds, in seconds, of the RapidPro request latency histogram buckets
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    mcimport = models.ForeignKey(
+        to=MomConnectImport, on_delete=models.CASCADE, related_name="stages"
+    )
+    stage = models.PositiveSmallIntegerField(choices=Stage.choices)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    rate = models.FloatField(
+        null=True, blank=True, help_text="Rows processed per second"
+    )
+    started = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
+    latency_buckets = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Count of RapidPro requests in each of the LATENCY_BUCKETS, and +Inf",
+    )
+    latency_sum = models.FloatField(default=0)
+    latency_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("mcimport", "stage")
+
+    @property
+    def eta(self):
+        """
+        Estimated completion time, at the current rate
+        """
+        if not self.rate or self.total is None:
+            return None
+        remaining = max(self.total - self.processed, 0)
+        return self.updated + timedelta(seconds=remaining / self.rate)
+
+    @property
+    def mean_latency(self):
+        if not self.latency_count:
+            return None
+        return self.latency_sum / self.latency_count
+
+
 class OpenHIMQueue(models.Model):
     class ObjectType:
         PREBIRTH_REGISTRATION = "prebirth_registration"
@@ -1151,3 +1508,34 @@ class WhatsAppTemplateSendStatus(models.Model):
     contact_uuid = models.UUIDField(null=True, blank=True)
     flow_uuid = models.UUIDField(null=True, blank=True)
     data = models.JSONField(default=dict, blank=True, null=True)
+
+
+class ForgetContactJob(models.Model):
+    """
+    Tracks the progress of forgetting a batch of contacts
+    """
+
+    class Status(models.IntegerChoices):
+        PENDING = 0
+        PROCESSING = 1
+        COMPLETE = 2
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    timestamp = models.DateTimeField(auto_now=True)
+    created_by = models.CharField(max_length=255, blank=True, default="")
+    status = models.PositiveSmallIntegerField(
+        choices=Status.choices, default=Status.PENDING
+    )
+    contact_ids = models.JSONField(default=list)
+    processed = models.PositiveIntegerField(
+        default=0, help_text="The number of contacts that have been processed"
+    )
+    failed = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="The contacts that could not be deleted from RapidPro",
+    )
+
+    @property
+    def total(self):
+        return len(self.contact_ids)
@@ -1,6 +1,5 @@
 import uuid
 
-import phonenumbers
 from rest_framework import serializers
 
 from eventstore.models import (
@@ -15,8 +14,10 @@ from eventstore.models import (
     EddSwitch,
     Event,
     Feedback,
+    ForgetContactJob,
     HCSStudyBRandomization,
     HealthCheckUserProfile,
+    HelpdeskTimeout,
     IdentificationSwitch,
     LanguageSwitch,
     MSISDNSwitch,
@@ -28,6 +29,7 @@ from eventstore.models import (
     ResearchOptinSwitch,
     WhatsAppTemplateSendStatus,
 )
+from ndoh_hub.msisdn import normalise_msisdn, validate_msisdn
 
 from .validators import posix_timestamp
 
@@ -132,19 +134,13 @@ class MSISDNField(serializers.CharField):
         return super(MSISDNField, self).__init__(*args, **kwargs)
 
     def to_representation(self, obj):
-        number = phonenumbers.parse(obj, self.country)
-        return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+        return normalise_msisdn(obj, self.country)
 
     def to_internal_value(self, data):
-        try:
-            number = phonenumbers.parse(data, self.country)
-        except phonenumbers.NumberParseException as e:
-            raise serializers.ValidationError(str(e))
-        if not phonenumbers.is_possible_number(number):
-            raise serializers.ValidationError("Not a possible phone number")
-        if not phonenumbers.is_valid_number(number):
-            raise serializers.ValidationError("Not a valid phone number")
-        return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+        msisdn = validate_msisdn(data, self.country)
+        if msisdn.error:
+            raise serializers.ValidationError(msisdn.message)
+        return msisdn.e164
 
 
 class Covid19TriageSerializer(BaseEventSerializer):
@@ -310,7 +306,12 @@ class Covid19TriageV4Serializer(BaseEventSerializer):
         read_only_fields = ("id", "created_by", "profile")
 
     def get_profile(self, obj):
-        profile = HealthCheckUserProfile.objects.get_or_prefill(msisdn=obj.msisdn)
+        view = self.context.get("view")
+        if hasattr(view, "get_profile"):
+            # Use the profile that the view has already fetched and updated
+            profile = view.get_profile(obj.msisdn)
+        else:
+            profile = HealthCheckUserProfile.objects.get_or_build(msisdn=obj.msisdn)
         return HealthCheckUserProfileSerializer(profile, many=False).data
 
 
@@ -435,6 +436,61 @@ class ForgetContactSerializer(serializers.Serializer):
     contact_id = serializers.UUIDField(required=True)
 
 
+class ForgetContactJobSerializer(BaseEventSerializer):
+    contact_ids = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, write_only=True
+    )
+    total = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ForgetContactJob
+        fields = (
+            "id",
+            "timestamp",
+            "created_by",
+            "status",
+            "contact_ids",
+            "total",
+            "processed",
+            "failed",
+        )
+        read_only_fields = (
+            "id",
+            "timestamp",
+            "created_by",
+            "status",
+            "processed",
+            "failed",
+        )
+
+    def validate_contact_ids(self, value):
+        # Remove duplicates, keeping the order
+        return list(dict.fromkeys(str(v) for v in value))
+
+
+class HelpdeskTimeoutSerializer(BaseEventSerializer):
+    contact_id = serializers.UUIDField()
+    msisdn = MSISDNField(country="ZA", write_only=True)
+
+    class Meta:
+        model = HelpdeskTimeout
+        fields = (
+            "contact_id",
+            "msisdn",
+            "wa_id",
+            "message_id",
+            "timeout_date",
+            "due_date",
+            "timestamp",
+            "created_by",
+        )
+        read_only_fields = ("wa_id", "due_date", "timestamp", "created_by")
+
+    def validate(self, data):
+        data["wa_id"] = data.pop("msisdn").lstrip("+")
+        return data
+
+
 class DeliveryFailureSerializer(serializers.Serializer):
     contact_id = serializers.CharField()
     timestamp = serializers.DateTimeField()
@@ -1,20 +1,23 @@
 import json
 import logging
+import random
 from datetime import date, datetime, timedelta
 from itertools import chain as ichain
-from itertools import dropwhile, takewhile
+from itertools import dropwhile, islice, takewhile
 from urllib.parse import urljoin
 from uuid import UUID
 
-import phonenumbers
 import pytz
 import requests
 from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
 from django.utils import dateparse, timezone
 from requests.exceptions import RequestException
 from temba_client.exceptions import TembaHttpError
 
+from eventstore.import_metrics import ImportStageTracker
 from eventstore.models import (
     BabyDobSwitch,
     BabySwitch,
@@ -23,9 +26,12 @@ from eventstore.models import (
     DeliveryFailure,
     EddSwitch,
     Event,
+    ForgetContactJob,
+    HelpdeskTimeout,
     IdentificationSwitch,
     ImportError,
     ImportRow,
+    ImportStage,
     LanguageSwitch,
     Message,
     MomConnectImport,
@@ -36,10 +42,13 @@ from eventstore.models import (
     PrebirthRegistration,
     PublicRegistration,
     ResearchOptinSwitch,
+    StudyArmCounter,
     WhatsAppTemplateSendStatus,
 )
 from ndoh_hub.celery import app
-from ndoh_hub.utils import get_random_date, get_today, rapidpro, send_slack_message
+from ndoh_hub.dispatch import RedisTokenBucket, dispatch
+from ndoh_hub.msisdn import normalise_msisdn
+from ndoh_hub.utils import get_today, rapidpro, redis, send_slack_message
 from registrations.models import JembiSubmission
 
 
@@ -153,8 +162,7 @@ def send_helpdesk_response_to_dhis2(self, context):
     encdate = datetime.utcfromtimestamp(int(context["inbound_timestamp"]))
     repdate = datetime.utcfromtimestamp(int(context["reply_timestamp"]))
 
-    msisdn = phonenumbers.parse(context["inbound_address"], "ZA")
-    msisdn = phonenumbers.format_number(msisdn, phonenumbers.PhoneNumberFormat.E164)
+    msisdn = normalise_msisdn(context["inbound_address"])
     contact = context["contact"]
 
     request_to_jembi_api.delay(
@@ -180,57 +188,100 @@ def send_helpdesk_response_to_dhis2(self, context):
     )
 
 
-@app.task(
-    autoretry_for=(SoftTimeLimitExceeded,),
-    retry_backoff=True,
-    max_retries=1,
-    acks_late=True,
-    soft_time_limit=60 * 60,
-    time_limit=60 * 61,
-)
-def delete_contact_pii(contact):
+def get_whatsapp_msisdn(contact):
+    """
+    Returns the msisdn, without the leading +, of the first URN of a serialized
+    RapidPro contact, or None if it doesn't have one
+    """
     try:
-        contact_uuid = contact["uuid"]
-    except (TypeError, KeyError):
-        return
+        _, msisdn = contact["urns"][0].split(":")
+        return msisdn.lstrip("+")
+    except (KeyError, IndexError, ValueError, AttributeError, TypeError):
+        return None
+
+
+def get_switched_msisdns(contact_uuids):
+    """
+    Returns a mapping of msisdn, without the leading +, to contact UUID, for all the
+    msisdns that the contacts have switched from or to
+    """
+    msisdns = {}
+    for contact_id, old_msisdn, new_msisdn in MSISDNSwitch.objects.filter(
+        contact_id__in=contact_uuids
+    ).values_list("contact_id", "old_msisdn", "new_msisdn"):
+        for msisdn in (old_msisdn, new_msisdn):
+            if msisdn:
+                msisdns[msisdn.lstrip("+")] = str(contact_id)
+    return msisdns
+
 
-    MSISDNSwitch.objects.filter(contact_id=contact_uuid).update(
+def delete_contacts_pii(contact_uuids, msisdns=None):
+    """
+    Removes the PII for all of the `contact_uuids` from the eventstore, using a single
+    update per table.
+
+    `msisdns` is a mapping of msisdn to contact UUID, used to replace the msisdn on
+    messages and events with the contact UUID.
+    """
+    MSISDNSwitch.objects.filter(contact_id__in=contact_uuids).update(
         old_msisdn="", new_msisdn="", data={}
     )
-    IdentificationSwitch.objects.filter(contact_id=contact_uuid).update(
+    IdentificationSwitch.objects.filter(contact_id__in=contact_uuids).update(
         old_id_number="",
         new_id_number="",
         old_passport_number="",
         new_passport_number="",
         data={},
     )
-    CHWRegistration.objects.filter(contact_id=contact_uuid).update(
-        id_number="", passport_number="", data={}
-    )
-    PrebirthRegistration.objects.filter(contact_id=contact_uuid).update(
-        id_number="", passport_number="", data={}
+    for model in (CHWRegistration, PrebirthRegistration, PostbirthRegistration):
+        model.objects.filter(contact_id__in=contact_uuids).update(
+            id_number="", passport_number="", data={}
+        )
+    for model in (
+        OptOut,
+        BabySwitch,
+        ChannelSwitch,
+        LanguageSwitch,
+        ResearchOptinSwitch,
+        PublicRegistration,
+        PMTCTRegistration,
+        EddSwitch,
+        BabyDobSwitch,
+    ):
+        model.objects.filter(contact_id__in=contact_uuids).update(data={})
+
+    if not msisdns:
+        return
+
+    Message.objects.filter(contact_id__in=msisdns.keys()).update(
+        contact_id=Case(
+            *(When(contact_id=m, then=Value(str(u))) for m, u in msisdns.items())
+        ),
+        data={},
     )
-    PostbirthRegistration.objects.filter(contact_id=contact_uuid).update(
-        id_number="", passport_number="", data={}
+    Event.objects.filter(recipient_id__in=msisdns.keys()).update(
+        recipient_id=Case(
+            *(When(recipient_id=m, then=Value(str(u))) for m, u in msisdns.items())
+        )
     )
-    OptOut.objects.filter(contact_id=contact_uuid).update(data={})
-    BabySwitch.objects.filter(contact_id=contact_uuid).update(data={})
-    ChannelSwitch.objects.filter(contact_id=contact_uuid).update(data={})
-    LanguageSwitch.objects.filter(contact_id=contact_uuid).update(data={})
-    ResearchOptinSwitch.objects.filter(contact_id=contact_uuid).update(data={})
-    PublicRegistration.objects.filter(contact_id=contact_uuid).update(data={})
-    PMTCTRegistration.objects.filter(contact_id=contact_uuid).update(data={})
-    EddSwitch.objects.filter(contact_id=contact_uuid).update(data={})
-    BabyDobSwitch.objects.filter(contact_id=contact_uuid).update(data={})
 
+
+@app.task(
+    autoretry_for=(SoftTimeLimitExceeded,),
+    retry_backoff=True,
+    max_retries=1,
+    acks_late=True,
+    soft_time_limit=60 * 60,
+    time_limit=60 * 61,
+)
+def delete_contact_pii(contact):
     try:
-        _, msisdn = contact["urns"][0].split(":")
-        msisdn = msisdn.lstrip("+")
-    except (KeyError, IndexError, ValueError, AttributeError):
-        return contact_uuid
+        contact_uuid = contact["uuid"]
+    except (TypeError, KeyError):
+        return
 
-    Message.objects.filter(contact_id=msisdn).update(contact_id=contact_uuid, data={})
-    Event.objects.filter(recipient_id=msisdn).update(recipient_id=contact_uuid)
+    msisdn = get_whatsapp_msisdn(contact)
+    delete_contacts_pii([contact_uuid], {msisdn: contact_uuid} if msisdn else None)
     return contact_uuid
 
 
@@ -255,6 +306,81 @@ forget_contact = (
 )
 
 
+def _get_rapidpro_contact(contact_uuid):
+    contact = rapidpro.get_contacts(uuid=contact_uuid).first(retry_on_rate_exceed=True)
+    return contact and contact.serialize()
+
+
+def _delete_rapidpro_contact(contact_uuid):
+    return rapidpro.delete_contact(contact_uuid)
+
+
+@app.task(
+    autoretry_for=(SoftTimeLimitExceeded,),
+    retry_backoff=True,
+    max_retries=5,
+    acks_late=True,
+    soft_time_limit=60 * 60,
+    time_limit=60 * 61,
+)
+def bulk_forget_contacts(job_id):
+    """
+    Forgets all the contacts in the ForgetContactJob, a chunk at a time. For each
+    chunk, the contacts are fetched from RapidPro, their PII is removed from the
+    eventstore, and then they are deleted from RapidPro.
+
+    Progress is saved after every chunk, so that retries continue where they left off
+    """
+    job = ForgetContactJob.objects.get(id=job_id)
+    if job.status == ForgetContactJob.Status.COMPLETE:
+        return
+
+    job.status = ForgetContactJob.Status.PROCESSING
+    job.save(update_fields=["status", "timestamp"])
+
+    chunk_size = settings.BULK_FORGET_CONTACTS_CHUNK_SIZE
+    dispatch_args = {
+        "concurrency": settings.RAPIDPRO_DISPATCH_CONCURRENCY,
+        "rate": settings.RAPIDPRO_DISPATCH_RATE,
+    }
+    while job.processed < job.total:
+        start, end = job.processed, job.processed + chunk_size
+        contact_uuids = job.contact_ids[start:end]
+
+        # The msisdns are scrubbed even if the contact can't be fetched from RapidPro
+        msisdns = get_switched_msisdns(contact_uuids)
+        found, failed = [], set()
+        for contact_uuid, contact, error in dispatch(
+            _get_rapidpro_contact, contact_uuids, **dispatch_args
+        ):
+            if error is not None:
+                failed.add(contact_uuid)
+                continue
+            if contact is None:
+                continue
+            found.append(contact_uuid)
+            msisdn = get_whatsapp_msisdn(contact)
+            if msisdn:
+                msisdns[msisdn] = contact_uuid
+
+        delete_contacts_pii(contact_uuids, msisdns)
+
+        for contact_uuid, _, error in dispatch(
+            _delete_rapidpro_contact, found, **dispatch_args
+        ):
+            if error is not None:
+                failed.add(contact_uuid)
+
+        # A retried chunk replaces the failures from the previous attempt
+        job.failed = [c for c in job.failed if c not in contact_uuids]
+        job.failed.extend(c for c in contact_uuids if c in failed)
+        job.processed += len(contact_uuids)
+        job.save(update_fields=["processed", "failed", "timestamp"])
+
+    job.status = ForgetContactJob.Status.COMPLETE
+    job.save(update_fields=["status", "timestamp"])
+
+
 @app.task(
     autoretry_for=(RequestException, SoftTimeLimitExceeded),
     retry_backoff=True,
@@ -289,6 +415,11 @@ def archive_turn_conversation(urn, message_id, reason):
     time_limit=600,
 )
 def handle_expired_helpdesk_contacts():
+    """
+    Reconciles the helpdesk timeout index with the "Waiting for helpdesk" group.
+    Archives the conversations of the contacts whose wait has expired, and adds the
+    contacts that are still waiting to the index, if they're not already in it.
+    """
     if not settings.HANDLE_EXPIRED_HELPDESK_CONTACTS_ENABLED:
         return
 
@@ -303,28 +434,84 @@ def handle_expired_helpdesk_contacts():
                     contact.fields["helpdesk_timeout"], "%Y-%m-%d"
                 ).date()
 
+                wa_id = None
+                for urn in contact.urns:
+                    if "whatsapp" in urn:
+                        wa_id = urn.split(":")[1]
+
                 delta = get_today() - timeout_date
-                if delta.days > settings.HELPDESK_TIMEOUT_DAYS:
-                    update_rapidpro_contact.delay(
-                        contact.uuid,
-                        {
-                            "helpdesk_timeout": None,
-                            "wait_for_helpdesk": None,
-                            "helpdesk_message_id": None,
+                if delta.days <= settings.HELPDESK_TIMEOUT_DAYS:
+                    HelpdeskTimeout.objects.get_or_create(
+                        contact_id=contact.uuid,
+                        defaults={
+                            "wa_id": wa_id or "",
+                            "message_id": contact.fields["helpdesk_message_id"],
+                            "timeout_date": timeout_date,
+                            "created_by": "handle_expired_helpdesk_contacts",
                         },
                     )
+                    continue
+
+                update_rapidpro_contact.delay(
+                    contact.uuid,
+                    {
+                        "helpdesk_timeout": None,
+                        "wait_for_helpdesk": None,
+                        "helpdesk_message_id": None,
+                    },
+                )
 
-                    wa_id = None
-                    for urn in contact.urns:
-                        if "whatsapp" in urn:
-                            wa_id = urn.split(":")[1]
+                if wa_id:
+                    archive_turn_conversation.delay(
+                        wa_id,
+                        contact.fields["helpdesk_message_id"],
+                        f"Auto archived after {delta.days} days",
+                    )
+                HelpdeskTimeout.objects.filter(contact_id=contact.uuid).delete()
 
-                    if wa_id:
-                        archive_turn_conversation.delay(
-                            wa_id,
-                            contact.fields["helpdesk_message_id"],
-                            f"Auto archived after {delta.days} days",
-                        )
+
+@app.task(acks_late=True, soft_time_limit=300, time_limit=310)
+def process_due_helpdesk_timeouts():
+    """
+    Archives the conversations of all the contacts whose wait for the helpdesk has
+    expired, using the local index instead of scanning the RapidPro group
+    """
+    if not settings.HANDLE_EXPIRED_HELPDESK_CONTACTS_ENABLED:
+        return
+
+    today = get_today()
+    while True:
+        with transaction.atomic():
+            timeouts = list(
+                HelpdeskTimeout.objects.filter(due_date__lte=today)
+                .select_for_update(skip_locked=True)
+                .order_by("due_date")[:1000]
+            )
+            if not timeouts:
+                return
+
+            # The tasks are queued before the timeouts are deleted, so that if
+            # queueing fails, the transaction is rolled back and they're kept
+            for timeout in timeouts:
+                update_rapidpro_contact.delay(
+                    str(timeout.contact_id),
+                    {
+                        "helpdesk_timeout": None,
+                        "wait_for_helpdesk": None,
+                        "helpdesk_message_id": None,
+                    },
+                )
+                if timeout.wa_id:
+                    days = (today - timeout.timeout_date).days
+                    archive_turn_conversation.delay(
+                        timeout.wa_id,
+                        timeout.message_id,
+                        f"Auto archived after {days} days",
+                    )
+
+            HelpdeskTimeout.objects.filter(
+                contact_id__in=[t.contact_id for t in timeouts]
+            ).delete()
 
 
 @app.task(
@@ -349,151 +536,320 @@ def reset_delivery_failure(contact_uuid):
         DeliveryFailure.objects.filter(contact_id=wa_id).update(number_of_failures=0)
 
 
+@app.task(
+    autoretry_for=(SoftTimeLimitExceeded,),
+    retry_backoff=True,
+    max_retries=5,
+    acks_late=True,
+    soft_time_limit=60 * 60,
+    time_limit=60 * 61,
+)
+def parse_momconnect_import(mcimport_id):
+    """
+    Parses the uploaded file for the import into rows, and then starts validation.
+    The file is streamed from storage, so that large files don't need to fit in memory.
+    """
+    # The form starts this task, so we import it here to avoid a circular import
+    from eventstore.forms import MomConnectImportForm
+
+    mcimport = MomConnectImport.objects.get(id=mcimport_id)
+    if not mcimport.file:
+        return
+
+    try:
+        with mcimport.file.open("rb") as f:
+            MomConnectImportForm().process_file(mcimport, f)
+    except SoftTimeLimitExceeded:
+        # Retried, continuing after the last parsed chunk, so the file is kept
+        raise
+    except Exception:
+        logger.exception(f"Cannot parse MomConnect import {mcimport.id}")
+        mcimport.status = MomConnectImport.Status.ERROR
+        mcimport.save()
+        mcimport.errors.create(
+            row_number=0,
+            error_type=ImportError.ErrorType.INVALID_FILETYPE,
+            error_args=[],
+        )
+    mcimport.file.delete()
+
+    if mcimport.status == MomConnectImport.Status.VALIDATING:
+        validate_momconnect_import.delay(mcimport.id)
+
+
 @app.task(
     autoretry_for=(RequestException, SoftTimeLimitExceeded, TembaHttpError),
     retry_backoff=True,
     max_retries=5,
     acks_late=True,
-    soft_time_limit=600,
-    time_limit=700,
+    soft_time_limit=60 * 60,
+    time_limit=60 * 61,
 )
 def validate_momconnect_import(mcimport_id):
+    """
+    Checks each of the import rows against the existing RapidPro contacts, using a
+    pool of workers that share the RapidPro rate limit.
+
+    The errors and the last validated row are saved after every chunk of rows, so
+    that retries continue where they left off.
+    """
     mcimport = MomConnectImport.objects.get(id=mcimport_id)
 
     if mcimport.status != MomConnectImport.Status.VALIDATING:
         return
 
-    for row in mcimport.rows.iterator():
-        msisdn = phonenumbers.parse(row.msisdn, "ZA")
-        msisdn = phonenumbers.format_number(msisdn, phonenumbers.PhoneNumberFormat.E164)
-        urn = f"whatsapp:{msisdn.lstrip('+')}"
-        contact = rapidpro.get_contacts(urn=urn).first(retry_on_rate_exceed=True)
-
-        if contact is None:
-            # No existing contact, so nothing to validate
-            continue
-
-        # validate previously opted out
-        if (
-            contact.fields.get("opted_out")
-            and contact.fields["opted_out"].strip().lower() == "true"
-            and not row.previous_optout
+    rows = (
+        mcimport.rows.order_by("row_number")
+        .filter(row_number__gt=mcimport.last_validated_row)
+        .iterator()
+    )
+    limiter = get_rapidpro_limiter()
+    tracker = ImportStageTracker(
+        mcimport, ImportStage.Stage.VALIDATE, total=mcimport.rows.count()
+    )
+    while True:
+        chunk = list(islice(rows, settings.MOMCONNECT_IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+
+        errors, failure, validated = [], None, 0
+        for row, fields, error in dispatch(
+            tracker.timed(_get_import_row_contact_fields),
+            chunk,
+            concurrency=settings.RAPIDPRO_DISPATCH_CONCURRENCY,
+            limiter=limiter,
         ):
-            mcimport.status = MomConnectImport.Status.ERROR
-            mcimport.save()
-            mcimport.errors.create(
-                row_number=row.row_number,
-                error_type=ImportError.ErrorType.OPTED_OUT_ERROR,
-                error_args=[],
-            )
-            continue
+            if error is not None:
+                failure = error
+                break
+            error_type = get_import_row_error_type(row, fields)
+            if error_type is not None:
+                errors.append(
+                    ImportError(
+                        mcimport=mcimport,
+                        row_number=row.row_number,
+                        error_type=error_type,
+                        error_args=[],
+                    )
+                )
+            mcimport.last_validated_row = row.row_number
+            validated += 1
 
-        # validate already receiving prebirth/postbirth messaging
-        try:
-            prebirth_messaging = int(contact.fields.get("prebirth_messaging"))
-        except (TypeError, ValueError):
-            prebirth_messaging = -1
-        postbirth_messaging = contact.fields.get("postbirth_messaging", "FALSE")
-        if (
-            prebirth_messaging >= 1 and prebirth_messaging <= 6
-        ) or postbirth_messaging == "TRUE":
-            mcimport.status = MomConnectImport.Status.ERROR
-            mcimport.save()
-            mcimport.errors.create(
-                row_number=row.row_number,
-                error_type=ImportError.ErrorType.ALREADY_REGISTERED,
-                error_args=[],
-            )
-            continue
+        ImportError.objects.bulk_create(errors)
+        mcimport.save()
+        tracker.add(validated)
+        if failure is not None:
+            raise failure
 
-    if mcimport.status == MomConnectImport.Status.VALIDATING:
+    # Only mark as error once all the rows are validated, so that retries continue
+    if mcimport.errors.exists():
+        mcimport.status = MomConnectImport.Status.ERROR
+        mcimport.save()
+    else:
         mcimport.status = MomConnectImport.Status.VALIDATED
         mcimport.save()
         upload_momconnect_import.delay(mcimport.id)
 
 
+def get_rapidpro_limiter():
+    """
+    Returns a rate limiter for the RapidPro API that is shared between all workers
+    """
+    return RedisTokenBucket(
+        redis, "rapidpro_rate_limit", settings.RAPIDPRO_DISPATCH_RATE
+    )
+
+
+def get_import_row_msisdn(row):
+    return normalise_msisdn(row.msisdn)
+
+
+def get_import_row_urn(row):
+    return f"whatsapp:{get_import_row_msisdn(row).lstrip('+')}"
+
+
+def _get_import_row_contact_fields(row):
+    contact = rapidpro.get_contacts(urn=get_import_row_urn(row)).first(
+        retry_on_rate_exceed=True
+    )
+    return contact and contact.fields
+
+
+def get_import_row_error_type(row, fields):
+    """
+    Returns the type of error for the import row, given the fields of the existing
+    RapidPro contact, or None if the row is valid
+    """
+    if fields is None:
+        # No existing contact, so nothing to validate
+        return None
+
+    # validate previously opted out
+    if (
+        fields.get("opted_out")
+        and fields["opted_out"].strip().lower() == "true"
+        and not row.previous_optout
+    ):
+        return ImportError.ErrorType.OPTED_OUT_ERROR
+
+    # validate already receiving prebirth/postbirth messaging
+    try:
+        prebirth_messaging = int(fields.get("prebirth_messaging"))
+    except (TypeError, ValueError):
+        prebirth_messaging = -1
+    postbirth_messaging = fields.get("postbirth_messaging", "FALSE")
+    if (
+        prebirth_messaging >= 1 and prebirth_messaging <= 6
+    ) or postbirth_messaging == "TRUE":
+        return ImportError.ErrorType.ALREADY_REGISTERED
+    return None
+
+
+IMPORT_LANGUAGES = {
+    ImportRow.Language.ZUL: "zul",
+    ImportRow.Language.XHO: "xho",
+    ImportRow.Language.AFR: "afr",
+    ImportRow.Language.ENG: "eng",
+    ImportRow.Language.NSO: "nso",
+    ImportRow.Language.TSN: "tsn",
+    ImportRow.Language.SOT: "sot",
+    ImportRow.Language.TSO: "tso",
+    ImportRow.Language.SSW: "ssw",
+    ImportRow.Language.VEN: "ven",
+    ImportRow.Language.NBL: "nbl",
+}
+
+IMPORT_ID_TYPES = {
+    ImportRow.IDType.SAID: "sa_id",
+    ImportRow.IDType.PASSPORT: "passport",
+    ImportRow.IDType.NONE: "dob",
+}
+
+IMPORT_PASSPORT_COUNTRIES = {
+    ImportRow.PassportCountry.ZW: "zw",
+    ImportRow.PassportCountry.MZ: "mz",
+    ImportRow.PassportCountry.MW: "mw",
+    ImportRow.PassportCountry.NG: "ng",
+    ImportRow.PassportCountry.CD: "cd",
+    ImportRow.PassportCountry.SO: "so",
+    ImportRow.PassportCountry.OTHER: "other",
+}
+
+
+def get_import_row_flow_start(row, source):
+    """
+    Returns the flow UUID, URN, and extra data for the flow start to register the
+    import row
+    """
+    flow_uuid = settings.RAPIDPRO_PREBIRTH_CLINIC_FLOW
+    msisdn = get_import_row_msisdn(row)
+    urn = f"whatsapp:{msisdn.lstrip('+')}"
+    data = {
+        "research_consent": "TRUE" if row.research_consent else "FALSE",
+        "registered_by": msisdn,
+        "language": IMPORT_LANGUAGES[row.language],
+        "timestamp": datetime.now().isoformat(),
+        "source": source,
+        "id_type": IMPORT_ID_TYPES[row.id_type],
+        "clinic_code": row.facility_code,
+        "sa_id_number": row.id_number,
+        "passport_number": row.passport_number,
+        "swt": "7",
+    }
+
+    if row.edd_year and row.edd_month and row.edd_day:
+        data["edd"] = date(row.edd_year, row.edd_month, row.edd_day).isoformat()
+
+    if row.baby_dob_year and row.baby_dob_month and row.baby_dob_day:
+        data["baby_dob"] = date(
+            row.baby_dob_year, row.baby_dob_month, row.baby_dob_day
+        ).isoformat()
+        flow_uuid = settings.RAPIDPRO_POSTBIRTH_CLINIC_FLOW
+
+    if row.passport_country is not None:
+        data["passport_origin"] = IMPORT_PASSPORT_COUNTRIES[row.passport_country]
+    if row.dob_year and row.dob_month and row.dob_day:
+        data["dob"] = date(row.dob_year, row.dob_month, row.dob_day).isoformat()
+
+    return flow_uuid, urn, data
+
+
 @app.task(
     autoretry_for=(RequestException, SoftTimeLimitExceeded, TembaHttpError),
     retry_backoff=True,
     max_retries=5,
     acks_late=True,
-    soft_time_limit=600,
-    time_limit=700,
+    soft_time_limit=60 * 60,
+    time_limit=60 * 61,
 )
 def upload_momconnect_import(mcimport_id):
+    """
+    Starts the registration flow for each of the import rows, using a pool of
+    workers that share the RapidPro rate limit.
+
+    The last uploaded row is saved after every MOMCONNECT_IMPORT_UPLOAD_CHECKPOINT
+    rows, so that retries continue where they left off. If a flow start fails, no
+    new rows are started, and the rows after it that were already started are saved
+    in uploaded_rows, so that they aren't registered again.
+    """
     mcimport = MomConnectImport.objects.get(id=mcimport_id)
 
-    if mcimport.status != MomConnectImport.Status.VALIDATED:
+    if mcimport.status not in (
+        MomConnectImport.Status.VALIDATED,
+        MomConnectImport.Status.UPLOADING,
+    ):
         return
 
     mcimport.status = MomConnectImport.Status.UPLOADING
     mcimport.save()
 
-    for row in (
+    def start_flow(row):
+        flow_uuid, urn, data = get_import_row_flow_start(row, mcimport.source)
+        return rapidpro.create_flow_start(flow=flow_uuid, urns=[urn], extra=data)
+
+    rows = (
         mcimport.rows.order_by("row_number")
         .filter(row_number__gt=mcimport.last_uploaded_row)
+        .exclude(row_number__in=mcimport.uploaded_rows)
         .iterator()
-    ):
-        flow_uuid = settings.RAPIDPRO_PREBIRTH_CLINIC_FLOW
-
-        msisdn = phonenumbers.parse(row.msisdn, "ZA")
-        msisdn = phonenumbers.format_number(msisdn, phonenumbers.PhoneNumberFormat.E164)
-        urn = f"whatsapp:{msisdn.lstrip('+')}"
-        data = {
-            "research_consent": "TRUE" if row.research_consent else "FALSE",
-            "registered_by": msisdn,
-            "language": {
-                ImportRow.Language.ZUL: "zul",
-                ImportRow.Language.XHO: "xho",
-                ImportRow.Language.AFR: "afr",
-                ImportRow.Language.ENG: "eng",
-                ImportRow.Language.NSO: "nso",
-                ImportRow.Language.TSN: "tsn",
-                ImportRow.Language.SOT: "sot",
-                ImportRow.Language.TSO: "tso",
-                ImportRow.Language.SSW: "ssw",
-                ImportRow.Language.VEN: "ven",
-                ImportRow.Language.NBL: "nbl",
-            }[row.language],
-            "timestamp": datetime.now().isoformat(),
-            "source": mcimport.source,
-            "id_type": {
-                ImportRow.IDType.SAID: "sa_id",
-                ImportRow.IDType.PASSPORT: "passport",
-                ImportRow.IDType.NONE: "dob",
-            }[row.id_type],
-            "clinic_code": row.facility_code,
-            "sa_id_number": row.id_number,
-            "passport_number": row.passport_number,
-            "swt": "7",
-        }
+    )
+    limiter = get_rapidpro_limiter()
+    tracker = ImportStageTracker(
+        mcimport, ImportStage.Stage.UPLOAD, total=mcimport.rows.count()
+    )
+    while True:
+        chunk = list(islice(rows, settings.MOMCONNECT_IMPORT_UPLOAD_CHECKPOINT))
+        if not chunk:
+            break
+
+        failure, uploaded = None, 0
+        for row, _, error in dispatch(
+            tracker.timed(start_flow),
+            takewhile(lambda _: failure is None, chunk),
+            concurrency=settings.RAPIDPRO_DISPATCH_CONCURRENCY,
+            limiter=limiter,
+        ):
+            if error is not None:
+                failure = failure or error
+                continue
+            if failure is None:
+                mcimport.last_uploaded_row = row.row_number
+            else:
+                mcimport.uploaded_rows.append(row.row_number)
+            uploaded += 1
 
-        if row.edd_year and row.edd_month and row.edd_day:
-            data["edd"] = date(row.edd_year, row.edd_month, row.edd_day).isoformat()
-
-        if row.baby_dob_year and row.baby_dob_month and row.baby_dob_day:
-            data["baby_dob"] = date(
-                row.baby_dob_year, row.baby_dob_month, row.baby_dob_day
-            ).isoformat()
-            flow_uuid = settings.RAPIDPRO_POSTBIRTH_CLINIC_FLOW
-
-        if row.passport_country is not None:
-            data["passport_origin"] = {
-                ImportRow.PassportCountry.ZW: "zw",
-                ImportRow.PassportCountry.MZ: "mz",
-                ImportRow.PassportCountry.MW: "mw",
-                ImportRow.PassportCountry.NG: "ng",
-                ImportRow.PassportCountry.CD: "cd",
-                ImportRow.PassportCountry.SO: "so",
-                ImportRow.PassportCountry.OTHER: "other",
-            }[row.passport_country]
-        if row.dob_year and row.dob_month and row.dob_day:
-            data["dob"] = date(row.dob_year, row.dob_month, row.dob_day).isoformat()
-
-        rapidpro.create_flow_start(flow=flow_uuid, urns=[urn], extra=data)
-        mcimport.last_uploaded_row = row.row_number
+        mcimport.uploaded_rows = [
+            r for r in mcimport.uploaded_rows if r > mcimport.last_uploaded_row
+        ]
         mcimport.save()
+        tracker.add(uploaded)
+        if failure is not None:
+            raise failure
 
+    mcimport.last_uploaded_row = max(
+        [mcimport.last_uploaded_row, *mcimport.uploaded_rows]
+    )
+    mcimport.uploaded_rows = []
     mcimport.status = MomConnectImport.Status.COMPLETE
     mcimport.save()
 
@@ -510,29 +866,39 @@ def post_random_mc_contacts_to_slack_channel():
     return post_random_contacts_to_slack_channel()
 
 
-def post_random_contacts_to_slack_channel(
-    contact_type="MomConnect", start_date=None, group=None
-):
+def post_random_contacts_to_slack_channel(contact_type="MomConnect", start_date=None):
     # Get 10 random contacts to post to slack channel
     if settings.RAPIDPRO_URL and settings.RAPIDPRO_TOKEN and settings.SLACK_CHANNEL:
         rapidpro_url = urljoin(settings.RAPIDPRO_URL, "/contact/read/{}/")
+        limit = settings.RANDOM_CONTACT_LIMIT
 
         contact_details = [f"{contact_type} Contacts for investigation"]
-        count = 0
+        tried = set()
 
-        while len(contact_details) < settings.RANDOM_CONTACT_LIMIT and count < 50:
-            turn_profile_link, contact_uuid = get_random_contact(start_date, group)
-
-            if turn_profile_link and contact_uuid:
-                rapidpro_link = rapidpro_url.format(contact_uuid)
-                contact_number = len(contact_details)
+        # Many contacts don't have a Turn profile, so keep sampling until we have
+        # enough that do, or we've tried 50 of them
+        while len(contact_details) < limit and len(tried) < 50:
+            candidates = get_random_contact_ids(
+                min(limit * 2, 50 - len(tried)), start_date, exclude=tried
+            )
+            if not candidates:
+                break
+            tried.update(candidates)
+
+            for contact_uuid, turn_profile_link, _ in dispatch(
+                get_contact_turn_profile_link,
+                takewhile(lambda _: len(contact_details) < limit, candidates),
+                concurrency=settings.RAPIDPRO_DISPATCH_CONCURRENCY,
+                rate=settings.RAPIDPRO_DISPATCH_RATE,
+            ):
+                if turn_profile_link and len(contact_details) < limit:
+                    rapidpro_link = rapidpro_url.format(contact_uuid)
+                    contact_number = len(contact_details)
 
-                contact_details.append(
-                    f"{contact_number}. <{rapidpro_link}|RapidPro>"
-                    f"    <{turn_profile_link}|Turn>"
-                )
-            else:
-                count += 1
+                    contact_details.append(
+                        f"{contact_number}. <{rapidpro_link}|RapidPro>"
+                        f"    <{turn_profile_link}|Turn>"
+                    )
 
         if contact_details:
             sent = send_slack_message(
@@ -542,6 +908,85 @@ def post_random_contacts_to_slack_channel(
         return {"success": False, "results": contact_details}
 
 
+def sample_contact_ids(model, size, start_date=None, exclude=()):
+    """
+    Returns up to `size` random, distinct contact IDs from the registrations in
+    `model`, registered on or after `start_date`, that aren't in `exclude`.
+
+    For large tables, TABLESAMPLE is used to only read a random selection of the
+    table's pages, instead of sorting the whole table. The sample is sized by the
+    planner's estimate of the rows registered after `start_date`.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    conditions, where_params = [], []
+    if start_date:
+        conditions.append("timestamp >= %s")
+        where_params.append(start_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE relname = %s",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+        estimate = row[0] if row else 0
+
+        sample, params = "", []
+        if estimate > settings.RANDOM_CONTACT_SAMPLE_MIN_ROWS:
+            if where:
+                cursor.execute(
+                    f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} {where}",
+                    where_params,
+                )
+                [plan] = cursor.fetchone()[0]
+                estimate = plan["Plan"]["Plan Rows"]
+            sample = "TABLESAMPLE SYSTEM (%s)"
+            # Oversample, to account for duplicate contacts
+            params.append(min(100.0, 100.0 * size * 10 / max(estimate, 1)))
+        params.extend(where_params)
+        if exclude:
+            conditions.append("NOT contact_id = ANY(%s::uuid[])")
+            params.append(list(exclude))
+            where = f"WHERE {' AND '.join(conditions)}"
+        params.append(size)
+
+        cursor.execute(
+            f"SELECT contact_id FROM {table} {sample} "
+            f"{where} GROUP BY contact_id ORDER BY random() LIMIT %s",
+            params,
+        )
+        return [str(contact_id) for (contact_id,) in cursor.fetchall()]
+
+
+def get_random_contact_ids(size, start_date=None, exclude=()):
+    """
+    Returns up to `size` random contact IDs, sampled from the MomConnect
+    registrations, that aren't in `exclude`
+    """
+    contact_ids = set()
+    for model in (PrebirthRegistration, PostbirthRegistration):
+        contact_ids.update(sample_contact_ids(model, size, start_date, exclude))
+    contact_ids = list(contact_ids)
+    random.shuffle(contact_ids)
+    return contact_ids[:size]
+
+
+def get_contact_turn_profile_link(contact_uuid):
+    """
+    Returns the Turn profile link for the WhatsApp URN of the RapidPro contact, or
+    None if it doesn't have one
+    """
+    contact = _get_rapidpro_contact(contact_uuid)
+    if not contact:
+        return None
+    whatsapp_numbers = [
+        urn.split(":")[1] for urn in contact["urns"] if urn.startswith("whatsapp:")
+    ]
+    if whatsapp_numbers:
+        return get_turn_profile_link(whatsapp_numbers[0])
+
+
 def get_turn_profile_link(contact_number):
     if settings.TURN_URL and settings.TURN_TOKEN:
         turn_header = {
@@ -564,37 +1009,6 @@ def get_turn_profile_link(contact_number):
                 return profile.json().get("chat", {}).get("permalink")
 
 
-def get_random_contact(start_date=None, group=None):
-    # After date must be lass then before date
-    after = get_random_date(start_date)
-    before = after + timedelta(days=1)
-
-    count = 0
-    for contact_batch in rapidpro.get_contacts(
-        after=after, before=before, group=group
-    ).iterfetches(retry_on_rate_exceed=True):
-        for contact in contact_batch:
-            contact_uuid = contact.uuid
-            contact_urns = contact.urns
-
-            if contact_uuid and contact_urns:
-                whatsapp_number = [
-                    i.split(":")[1] for i in contact_urns if "whatsapp" in i
-                ]
-
-                if whatsapp_number:
-                    contact_number = whatsapp_number[0]
-                    profile_link = get_turn_profile_link(contact_number)
-
-                    if profile_link:
-                        return profile_link, contact_uuid
-
-            count += 1
-            if count > 3:
-                return None, None
-    return None, None
-
-
 def get_text_or_caption_from_turn_message(message: dict) -> str:
     """
     Gets the text content of the message, or the caption if it's a media message, and
@@ -778,3 +1192,17 @@ def process_whatsapp_template_send_status():
         status.status = WhatsAppTemplateSendStatus.Status.ACTION_COMPLETED
         status.action_completed_at = timezone.now()
         status.save()
+
+
+@app.task(acks_late=True, soft_time_limit=300, time_limit=330)
+def reconcile_study_arm_counters():
+    """
+    Checks the study arm counters against the study tables, and corrects any that
+    have drifted
+    """
+    for study in StudyArmCounter.Study:
+        for source, province, count, actual in StudyArmCounter.objects.reconcile(study):
+            logger.warning(
+                f"Corrected {study.value} counter for {province} {source}: "
+                f"{count} counted, {actual} actual"
+            )
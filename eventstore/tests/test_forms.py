@@ -1,10 +1,10 @@
 from unittest import mock
 
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from eventstore.forms import MomConnectImportForm
-from eventstore.models import ImportRow, MomConnectImport
+from eventstore.models import ImportRow, ImportStage, MomConnectImport
 from registrations.models import ClinicCode
 
 
@@ -14,12 +14,19 @@ class MomConnectImportFormTests(TestCase):
         patcher = mock.patch("eventstore.models.is_valid_edd_date")
         self.is_valid_edd_date = patcher.start()
         self.is_valid_edd_date.return_value = True
-        patcher = mock.patch("eventstore.forms.validate_momconnect_import")
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("eventstore.tasks.validate_momconnect_import")
         self.validate_momconnect_import = patcher.start()
+        self.addCleanup(patcher.stop)
 
-    def tearDown(self):
-        self.is_valid_edd_date.stop()
-        self.validate_momconnect_import.stop()
+    def save_form(self, form):
+        """
+        Saves the form, and runs the parsing task that is started on commit
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            instance = form.save()
+        instance.refresh_from_db()
+        return instance
 
     def test_missing_columns(self):
         """
@@ -34,7 +41,7 @@ class MomConnectImportFormTests(TestCase):
             data={"source": "MomConnect Import"}, files={"file": file}
         )
         self.assertTrue(form.is_valid())
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -50,7 +57,7 @@ class MomConnectImportFormTests(TestCase):
             data={"source": "MomConnect Import"}, files={"file": file}
         )
         self.assertTrue(form.is_valid())
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(error.error, "File is not a CSV")
@@ -69,7 +76,7 @@ class MomConnectImportFormTests(TestCase):
             data={"source": "MomConnect Import"}, files={"file": file}
         )
         self.assertTrue(form.is_valid())
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.VALIDATING)
         self.assertEqual(instance.errors.count(), 0)
 
@@ -88,6 +95,70 @@ class MomConnectImportFormTests(TestCase):
 
         self.validate_momconnect_import.delay.assert_called_once_with(instance.id)
 
+    @mock.patch("eventstore.forms.parse_momconnect_import")
+    def test_parsed_in_background(self, parse_momconnect_import):
+        """
+        Should store the file, and only start parsing it once the import is committed
+        """
+        file = SimpleUploadedFile(
+            "test.csv",
+            b"msisdn,facility code,id type,id number,messaging consent,edd year,"
+            b"edd month,edd day,baby dob year, baby dob month, baby dob day,language\n"
+            b"+27820001001,123456,said,9001010001088,true,2021,12,1,,,,afr\n",
+        )
+        form = MomConnectImportForm(
+            data={"source": "MomConnect Import"}, files={"file": file}
+        )
+        self.assertTrue(form.is_valid())
+        with self.captureOnCommitCallbacks() as callbacks:
+            instance = form.save()
+        self.assertEqual(instance.rows.count(), 0)
+        self.assertTrue(instance.file.name.startswith("momconnect_imports/"))
+        parse_momconnect_import.delay.assert_not_called()
+
+        callbacks[0]()
+        parse_momconnect_import.delay.assert_called_once_with(instance.id)
+
+    @override_settings(MOMCONNECT_IMPORT_CHUNK_SIZE=2)
+    def test_multiple_chunks(self):
+        """
+        Should validate and save the rows in chunks, with a single query to look up
+        the facility codes, and to write the rows and errors, for each chunk
+        """
+        file = SimpleUploadedFile(
+            "test.csv",
+            b"msisdn,facility code,id type,id number,messaging consent,edd year,"
+            b"edd month,edd day,baby dob year,baby dob month,baby dob day\n"
+            b"+27820001001,123456,said,9001010001088,true,2021,12,1,,,\n"
+            b"+27820001002,654321,said,9001010001088,true,2021,12,1,,,\n"
+            b"+27820001003,123456,said,9001010001088,true,2021,12,1,,,\n",
+        )
+        form = MomConnectImportForm(
+            data={"source": "MomConnect Import"}, files={"file": file}
+        )
+        self.assertTrue(form.is_valid())
+        # Save import, fetch import and create parse stage, then for each chunk: look
+        # up facility codes, and in a savepoint, insert rows, update the stage
+        # progress, and for the first chunk, update the import status and insert the
+        # errors. Then complete the stage, clear the file, and refresh the import
+        with self.assertNumQueries(22):
+            instance = self.save_form(form)
+        self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
+        self.assertEqual(
+            [r.row_number for r in instance.rows.order_by("row_number")], [2, 4]
+        )
+        [error] = instance.errors.all()
+        self.assertEqual(error.row_number, 3)
+        self.assertEqual(
+            error.error, "Field facility_code failed validation: Invalid Facility Code"
+        )
+        self.validate_momconnect_import.delay.assert_not_called()
+
+        [stage] = instance.stages.all()
+        self.assertEqual(stage.stage, ImportStage.Stage.PARSE)
+        self.assertEqual(stage.processed, 3)
+        self.assertEqual(stage.total, 3)
+
     def test_empty_language(self):
         """
         Should save the rows
@@ -102,7 +173,7 @@ class MomConnectImportFormTests(TestCase):
             data={"source": "MomConnect Import"}, files={"file": file}
         )
         self.assertTrue(form.is_valid())
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.VALIDATING)
         self.assertEqual(instance.errors.count(), 0)
 
@@ -125,7 +196,7 @@ class MomConnectImportFormTests(TestCase):
             data={"source": "MomConnect Import"}, files={"file": file}
         )
         self.assertTrue(form.is_valid())
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -146,7 +217,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -164,7 +235,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -181,7 +252,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -205,7 +276,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -229,7 +300,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.VALIDATING)
         self.assertEqual(instance.errors.count(), 0)
         [row] = instance.rows.all()
@@ -249,7 +320,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -273,7 +344,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.VALIDATING)
         self.assertEqual(instance.errors.count(), 0)
         [row] = instance.rows.all()
@@ -292,7 +363,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -309,7 +380,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -325,7 +396,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -347,7 +418,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -364,7 +435,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -381,7 +452,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -401,7 +472,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -418,7 +489,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -438,7 +509,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -458,7 +529,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -478,7 +549,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -501,7 +572,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -519,7 +590,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -540,7 +611,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
@@ -561,7 +632,7 @@ class MomConnectImportFormTests(TestCase):
         form = MomConnectImportForm(
             data={"source": "MomConnect Import"}, files={"file": file}
         )
-        instance = form.save()
+        instance = self.save_form(form)
         self.assertEqual(instance.status, MomConnectImport.Status.ERROR)
         [error] = instance.errors.all()
         self.assertEqual(
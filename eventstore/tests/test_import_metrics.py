@@ -0,0 +1,125 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import CollectorRegistry, generate_latest
+
+from eventstore.import_metrics import ImportStageCollector, ImportStageTracker
+from eventstore.models import ImportStage, MomConnectImport
+
+
+class ImportStageTrackerTests(TestCase):
+    def test_tracker(self):
+        """
+        Should record the progress, rate, and latency histogram of the stage
+        """
+        mcimport = MomConnectImport.objects.create()
+        tracker = ImportStageTracker(mcimport, ImportStage.Stage.VALIDATE, total=10)
+        tracker.observe(0.01)
+        tracker.observe(0.3)
+        tracker.observe(60)
+        self.assertEqual(tracker.timed(lambda x: x * 2)(2), 4)
+        tracker.add(4)
+
+        stage = ImportStage.objects.get(mcimport=mcimport)
+        self.assertEqual(stage.processed, 4)
+        self.assertEqual(stage.total, 10)
+        self.assertGreater(stage.rate, 0)
+        self.assertEqual(stage.latency_buckets, [2, 0, 0, 1, 0, 0, 0, 0, 1])
+        self.assertEqual(stage.latency_count, 4)
+        self.assertGreater(stage.eta, stage.updated)
+
+    def test_resume(self):
+        """
+        A new tracker for the same stage should continue from the saved progress
+        """
+        mcimport = MomConnectImport.objects.create()
+        ImportStageTracker(mcimport, ImportStage.Stage.UPLOAD, total=10).add(4)
+        tracker = ImportStageTracker(mcimport, ImportStage.Stage.UPLOAD, total=10)
+        tracker.add(2)
+        self.assertEqual(ImportStage.objects.get().processed, 6)
+
+
+class ImportStageCollectorTests(TestCase):
+    def test_collect(self):
+        """
+        Should only export the stages of the imports that are still in progress
+        """
+        mcimport = MomConnectImport.objects.create(
+            status=MomConnectImport.Status.UPLOADING
+        )
+        ImportStage.objects.create(
+            mcimport=mcimport,
+            stage=ImportStage.Stage.UPLOAD,
+            processed=10,
+            total=30,
+            rate=2.0,
+            latency_buckets=[1, 2, 0, 0, 0, 0, 0, 0, 1],
+            latency_sum=20.5,
+            latency_count=4,
+        )
+        complete = MomConnectImport.objects.create(
+            status=MomConnectImport.Status.COMPLETE
+        )
+        ImportStage.objects.create(
+            mcimport=complete, stage=ImportStage.Stage.UPLOAD, processed=5
+        )
+
+        registry = CollectorRegistry()
+        registry.register(ImportStageCollector())
+        labels = {"mcimport": str(mcimport.id), "stage": "upload"}
+        self.assertEqual(
+            registry.get_sample_value("momconnect_import_rows_processed", labels), 10
+        )
+        self.assertEqual(
+            registry.get_sample_value("momconnect_import_rows_total", labels), 30
+        )
+        self.assertEqual(
+            registry.get_sample_value("momconnect_import_rows_per_second", labels), 2
+        )
+        self.assertAlmostEqual(
+            registry.get_sample_value("momconnect_import_eta_seconds", labels),
+            10,
+            delta=5,
+        )
+        self.assertEqual(
+            registry.get_sample_value(
+                "momconnect_import_rapidpro_request_seconds_bucket",
+                {**labels, "le": "0.1"},
+            ),
+            3,
+        )
+        self.assertEqual(
+            registry.get_sample_value(
+                "momconnect_import_rapidpro_request_seconds_count", labels
+            ),
+            4,
+        )
+        self.assertNotIn(
+            f'mcimport="{complete.id}"', generate_latest(registry).decode()
+        )
+
+    def test_cached(self):
+        """
+        Should only fetch the stages once per interval
+        """
+        collector = ImportStageCollector()
+        with self.assertNumQueries(1):
+            list(collector.collect())
+            list(collector.collect())
+
+        with override_settings(MOMCONNECT_IMPORT_METRICS_INTERVAL=0):
+            with self.assertNumQueries(1):
+                list(collector.collect())
+
+    @override_settings(MOMCONNECT_IMPORT_METRICS_INTERVAL=0)
+    def test_metrics_endpoint(self):
+        """
+        The collector should be registered on the default registry
+        """
+        mcimport = MomConnectImport.objects.create()
+        ImportStage.objects.create(mcimport=mcimport, stage=ImportStage.Stage.PARSE)
+        response = self.client.get(reverse("metrics"))
+        self.assertIn(
+            f'momconnect_import_rows_processed{{mcimport="{mcimport.id}",'
+            'stage="parse"} 0.0',
+            response.content.decode(),
+        )
@@ -1,11 +1,15 @@
 from unittest.mock import call, patch
 
+from django.conf import settings
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from eventstore.models import (
     ChannelSwitch,
     CHWRegistration,
     Covid19Triage,
+    DBEOnBehalfOfProfile,
     Event,
     HCSStudyBRandomization,
     HealthCheckUserProfile,
@@ -14,6 +18,7 @@ from eventstore.models import (
     OptOut,
     PrebirthRegistration,
     PublicRegistration,
+    StudyArmCounter,
 )
 
 
@@ -191,6 +196,47 @@ class HealthCheckUserProfileTests(TestCase):
         self.assertEqual(profile.last_name, "newlast")
         self.assertEqual(profile.preexisting_condition, "no")
 
+    def test_get_for_update_existing(self):
+        """
+        Should lock and return the existing profile
+        """
+        HealthCheckUserProfile.objects.create(msisdn="+27820001001", city="JHB")
+        with CaptureQueriesContext(connection) as queries:
+            profile = HealthCheckUserProfile.objects.get_for_update("+27820001001")
+        self.assertEqual(profile.city, "JHB")
+        self.assertIn("FOR UPDATE", queries[0]["sql"])
+
+        profile.city = "CPT"
+        with CaptureQueriesContext(connection) as queries:
+            profile.save_changes()
+        [query] = queries
+        self.assertTrue(query["sql"].startswith("UPDATE"))
+        self.assertEqual(HealthCheckUserProfile.objects.get().city, "CPT")
+
+    @override_settings(HEALTHCHECK_PROFILE_PREFILL_ENABLED=True)
+    def test_get_for_update_new(self):
+        """
+        Should build a new profile, prefilled from the historical healthchecks, and
+        insert it in a single query when saved
+        """
+        Covid19Triage.objects.create(
+            msisdn="+27820001001",
+            first_name="oldfirst",
+            fever=False,
+            cough=False,
+            sore_throat=False,
+            tracing=True,
+        )
+        profile = HealthCheckUserProfile.objects.get_for_update("+27820001001")
+        self.assertEqual(profile.first_name, "oldfirst")
+        self.assertFalse(HealthCheckUserProfile.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            profile.save_changes()
+        [query] = queries
+        self.assertTrue(query["sql"].startswith("INSERT"))
+        self.assertEqual(HealthCheckUserProfile.objects.get().first_name, "oldfirst")
+
     def test_get_study_totals_per_province(self):
         HealthCheckUserProfile.objects.create(
             msisdn="+27820001001",
@@ -244,9 +290,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_LOW, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_LOW, "whatsapp_healthcheck"
+            )
 
         self.assertIsNotNone(profile.hcs_study_a_arm)
 
@@ -271,7 +318,8 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(Covid19Triage.RISK_LOW, "USSD")
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(Covid19Triage.RISK_LOW, "USSD")
 
         self.assertIsNone(profile.hcs_study_a_arm)
 
@@ -294,9 +342,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_LOW, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_LOW, "whatsapp_healthcheck"
+            )
 
         self.assertIsNone(profile.hcs_study_c_testing_arm)
         self.assertIsNone(profile.hcs_study_c_quarantine_arm)
@@ -324,9 +373,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
+            )
 
         self.assertIsNone(profile.hcs_study_c_testing_arm)
         self.assertIsNotNone(profile.hcs_study_c_quarantine_arm)
@@ -370,9 +420,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_HIGH, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_HIGH, "whatsapp_healthcheck"
+            )
 
         self.assertIsNotNone(profile.hcs_study_c_testing_arm)
         self.assertIsNone(profile.hcs_study_c_quarantine_arm)
@@ -407,9 +458,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_HIGH, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_HIGH, "whatsapp_healthcheck"
+            )
 
         mock_update_turn_contact.delay.assert_not_called()
 
@@ -429,9 +481,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
+            )
 
         self.assertIsNone(profile.hcs_study_a_arm)
         self.assertIsNone(profile.hcs_study_c_testing_arm)
@@ -458,9 +511,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
+            )
 
         self.assertIsNone(profile.hcs_study_a_arm)
         self.assertIsNone(profile.hcs_study_c_testing_arm)
@@ -489,9 +543,10 @@ class HealthCheckUserProfileTests(TestCase):
             },
         )
 
-        profile.update_post_screening_study_arms(
-            Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.update_post_screening_study_arms(
+                Covid19Triage.RISK_MODERATE, "whatsapp_healthcheck"
+            )
 
         self.assertIsNotNone(profile.hcs_study_a_arm)
 
@@ -564,17 +619,197 @@ class HCSStudyBRandomizationTests(TestCase):
         self.assertEqual(total, 1)
         self.assertEqual(int(percentage), 20)
 
-    @patch("eventstore.models.HCSStudyBRandomization.get_study_totals_per_province")
-    def test_get_random_study_b_arm(self, mock_get_study_totals_per_province):
+    def test_assign_random_study_b_arm(self):
+        """
+        Should assign and count an arm while the province and source are under
+        their targets
+        """
         rand = HCSStudyBRandomization(
             msisdn="+27820001001", province="ZA-WC", source="WhatsApp"
         )
+        counter = StudyArmCounter.objects.create(
+            study=StudyArmCounter.Study.HCS_STUDY_B,
+            province="ZA-WC",
+            source="WhatsApp",
+            count=500,
+        )
+
+        self.assertIsNotNone(rand.assign_random_study_b_arm())
+        counter.refresh_from_db()
+        self.assertEqual(counter.count, 501)
+
+        StudyArmCounter.objects.filter(pk=counter.pk).update(count=2000)
+        self.assertIsNone(rand.assign_random_study_b_arm())
+        counter.refresh_from_db()
+        self.assertEqual(counter.count, 2000)
+
+
+class StudyArmCounterTests(TestCase):
+    def test_increment_on_assignment(self):
+        """
+        The counter should be incremented once, when the arm is first saved
+        """
+        profile = HealthCheckUserProfile.objects.create(
+            msisdn="+27820001001", province="ZA-WC"
+        )
+        self.assertEqual(StudyArmCounter.objects.count(), 0)
+
+        profile.hcs_study_a_arm = HealthCheckUserProfile.ARM_CONTROL
+        profile.save()
+        profile.save()
+        profile = HealthCheckUserProfile.objects.get(msisdn="+27820001001")
+        profile.first_name = "test"
+        profile.save()
+
+        [counter] = StudyArmCounter.objects.all()
+        self.assertEqual(counter.study, StudyArmCounter.Study.HCS_STUDY_A)
+        self.assertEqual(counter.province, "ZA-WC")
+        self.assertEqual(counter.source, "")
+        self.assertEqual(counter.count, 1)
+
+    def test_increment_if_under_target(self):
+        """
+        Should only increment the counter while the province is under either its
+        total or its percentage target, in a single UPDATE
+        """
+        study = StudyArmCounter.Study.HCS_STUDY_A
+        counter = StudyArmCounter.objects.create(
+            study=study, province="ZA-WC", count=10
+        )
+        StudyArmCounter.objects.create(study=study, province="ZA-EC", count=90)
+
+        with self.assertNumQueries(2):
+            self.assertTrue(
+                StudyArmCounter.objects.increment_if_under_target(study, "ZA-WC", 11, 5)
+            )
+        # Over the total target, and 11 of 101 isn't under the percentage target
+        self.assertFalse(
+            StudyArmCounter.objects.increment_if_under_target(study, "ZA-WC", 11, 10)
+        )
+        # Over the total target, but under the percentage target
+        self.assertTrue(
+            StudyArmCounter.objects.increment_if_under_target(study, "ZA-WC", 11, 12)
+        )
+        counter.refresh_from_db()
+        self.assertEqual(counter.count, 12)
 
-        mock_get_study_totals_per_province.return_value = (500, 3)
-        self.assertIsNotNone(rand.get_random_study_b_arm())
+    @patch("eventstore.models.update_turn_contact")
+    def test_assign_on_save(self, mock_update_turn_contact):
+        """
+        Arms assigned when saving should only be counted once
+        """
+        rand = HCSStudyBRandomization.objects.create(
+            msisdn="+27820001001",
+            province="ZA-WC",
+            source="WhatsApp",
+            created_by=settings.HCS_STUDY_B_CREATED_BY[0],
+        )
+        self.assertIsNotNone(rand.study_b_arm)
+        rand.save()
+        [counter] = StudyArmCounter.objects.all()
+        self.assertEqual(counter.study, StudyArmCounter.Study.HCS_STUDY_B)
+        self.assertEqual(counter.count, 1)
 
-        mock_get_study_totals_per_province.return_value = (2000, 10)
-        self.assertIsNone(rand.get_random_study_b_arm())
+    @patch("eventstore.models.update_turn_contact")
+    def test_get_totals_queries(self, mock_update_turn_contact):
+        """
+        Getting the totals should be a single query, no matter how many participants
+        """
+        for i in range(3):
+            HCSStudyBRandomization.objects.create(
+                msisdn=f"+2782000100{i}",
+                province="ZA-WC",
+                source="WhatsApp",
+                study_b_arm=HCSStudyBRandomization.ARM_CONTROL,
+            )
+        rand = HCSStudyBRandomization(province="ZA-WC", source="WhatsApp")
+        with self.assertNumQueries(1):
+            self.assertEqual(rand.get_study_totals_per_province(), (3, 100))
+
+    def test_reconcile(self):
+        """
+        Should correct the counters that don't match the study tables
+        """
+        HealthCheckUserProfile.objects.create(
+            msisdn="+27820001001",
+            province="ZA-WC",
+            hcs_study_a_arm=HealthCheckUserProfile.ARM_CONTROL,
+        )
+        HealthCheckUserProfile.objects.create(
+            msisdn="+27820001002",
+            province="ZA-WC",
+            hcs_study_a_arm=HealthCheckUserProfile.ARM_CONTROL,
+        )
+        StudyArmCounter.objects.filter(province="ZA-WC").update(count=5)
+        StudyArmCounter.objects.create(
+            study=StudyArmCounter.Study.HCS_STUDY_A, province="ZA-EC", count=1
+        )
+
+        self.assertEqual(
+            StudyArmCounter.objects.reconcile(StudyArmCounter.Study.HCS_STUDY_A),
+            [("", "ZA-EC", 1, 0), ("", "ZA-WC", 5, 2)],
+        )
+        self.assertEqual(
+            StudyArmCounter.objects.get_totals(
+                StudyArmCounter.Study.HCS_STUDY_A, "ZA-WC"
+            ),
+            (2, 100),
+        )
+        self.assertEqual(
+            StudyArmCounter.objects.reconcile(StudyArmCounter.Study.HCS_STUDY_A), []
+        )
+
+
+class DBEOnBehalfOfProfileTests(TestCase):
+    def get_healthcheck(self, **data):
+        return Covid19Triage(
+            msisdn="+27820001001",
+            gender=Covid19Triage.GENDER_MALE,
+            province="ZA-WC",
+            city="Cape Town",
+            preexisting_condition=Covid19Triage.EXPOSURE_NO,
+            data={
+                "name": "Child",
+                "age": 12,
+                "school_name": "Bergvliet High School",
+                "school_emis": "105310201",
+                **data,
+            },
+        )
+
+    def test_update_or_create_from_healthcheck_create(self):
+        """
+        Creates a new profile in a single query
+        """
+        with self.assertNumQueries(1):
+            DBEOnBehalfOfProfile.objects.update_or_create_from_healthcheck(
+                self.get_healthcheck(asthma=True)
+            )
+        [profile] = DBEOnBehalfOfProfile.objects.all()
+        self.assertEqual(profile.msisdn, "+27820001001")
+        self.assertEqual(profile.name, "Child")
+        self.assertEqual(profile.age, 12)
+        self.assertEqual(profile.school, "Bergvliet High School")
+        self.assertEqual(profile.asthma, True)
+
+    def test_update_or_create_from_healthcheck_update(self):
+        """
+        Updates the existing profile with the same msisdn and name in a single query
+        """
+        DBEOnBehalfOfProfile.objects.update_or_create_from_healthcheck(
+            self.get_healthcheck(asthma=True)
+        )
+        DBEOnBehalfOfProfile.objects.update_or_create_from_healthcheck(
+            self.get_healthcheck(name="Other child")
+        )
+        with self.assertNumQueries(1):
+            DBEOnBehalfOfProfile.objects.update_or_create_from_healthcheck(
+                self.get_healthcheck(age=13, asthma=False)
+            )
+        self.assertEqual(DBEOnBehalfOfProfile.objects.count(), 2)
+        profile = DBEOnBehalfOfProfile.objects.get(name="Child")
+        self.assertEqual(profile.age, 13)
+        self.assertEqual(profile.asthma, False)
 
 
 class PrebirthRegistrationTests(TestCase):
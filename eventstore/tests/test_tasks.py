@@ -5,18 +5,34 @@ from unittest import mock
 
 import requests
 import responses
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from temba_client.exceptions import TembaHttpError
 from temba_client.v2 import TembaClient
 
 from eventstore import tasks
 from eventstore.models import (
+    Event,
+    ForgetContactJob,
+    HelpdeskTimeout,
     ImportError,
     ImportRow,
+    ImportStage,
+    Message,
     MomConnectImport,
+    MSISDNSwitch,
+    OptOut,
+    PostbirthRegistration,
+    PrebirthRegistration,
+    StudyArmCounter,
     WhatsAppTemplateSendStatus,
 )
 from ndoh_hub import utils
+from registrations.models import ClinicCode
 
 
 def override_get_today():
@@ -108,8 +124,15 @@ class HandleOldWaitingForHelpdeskContactsTests(TestCase):
             responses.POST, "http://turn/v1/chats/27820001001/archive", json={}
         )
 
+        HelpdeskTimeout.objects.create(
+            contact_id=contact_id,
+            message_id="ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            timeout_date=datetime.date(2020, 1, 6),
+        )
+
         tasks.handle_expired_helpdesk_contacts()
 
+        self.assertFalse(HelpdeskTimeout.objects.exists())
         [_, rapidpro_update, turn_archive] = responses.calls
         self.assertEqual(
             json.loads(rapidpro_update.request.body),
@@ -145,6 +168,11 @@ class HandleOldWaitingForHelpdeskContactsTests(TestCase):
         tasks.handle_expired_helpdesk_contacts()
 
         self.assertEqual(len(responses.calls), 1)
+        [timeout] = HelpdeskTimeout.objects.all()
+        self.assertEqual(str(timeout.contact_id), contact_id)
+        self.assertEqual(timeout.wa_id, "27820001001")
+        self.assertEqual(timeout.message_id, "ABGGJ4NjeFMfAgo-sCqKaSQU4UzP")
+        self.assertEqual(timeout.due_date, datetime.date(2020, 1, 20))
 
     @responses.activate
     def test_conversation_fields_not_populated(self):
@@ -197,6 +225,365 @@ class HandleOldWaitingForHelpdeskContactsTests(TestCase):
         )
 
 
+class ProcessDueHelpdeskTimeoutsTests(TestCase):
+    def setUp(self):
+        tasks.get_today = override_get_today
+        tasks.rapidpro = TembaClient("textit.in", "test-token")
+
+    @responses.activate
+    @override_settings(HANDLE_EXPIRED_HELPDESK_CONTACTS_ENABLED=False)
+    def test_disabled(self):
+        HelpdeskTimeout.objects.create(
+            contact_id="9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+            wa_id="27820001001",
+            message_id="ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            timeout_date=datetime.date(2020, 1, 6),
+        )
+
+        tasks.process_due_helpdesk_timeouts()
+
+        self.assertEqual(len(responses.calls), 0)
+        self.assertEqual(HelpdeskTimeout.objects.count(), 1)
+
+    @responses.activate
+    def test_due_timeouts(self):
+        """
+        Should clear the contact fields and archive the conversation for only the
+        timeouts that are due, and remove them from the index
+        """
+        contact_id = "9e12d04c-af25-40b6-aa4f-57c72e8e3f91"
+        HelpdeskTimeout.objects.create(
+            contact_id=contact_id,
+            wa_id="27820001001",
+            message_id="ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            timeout_date=datetime.date(2020, 1, 6),
+        )
+        HelpdeskTimeout.objects.create(
+            contact_id="0b8c1bde-0b0a-4bd1-a3d5-aee43f4e2a3b",
+            wa_id="27820001002",
+            message_id="ABGGJ4NjeFMfAgo-sCqKaSQU4UzQ",
+            timeout_date=datetime.date(2020, 1, 9),
+        )
+        responses.add(
+            responses.POST,
+            f"https://textit.in/api/v2/contacts.json?uuid={contact_id}",
+            json={"uuid": contact_id, "urns": [], "groups": [], "fields": {}},
+        )
+        responses.add(
+            responses.POST, "http://turn/v1/chats/27820001001/archive", json={}
+        )
+
+        tasks.process_due_helpdesk_timeouts()
+
+        [rapidpro_update, turn_archive] = responses.calls
+        self.assertEqual(
+            json.loads(rapidpro_update.request.body),
+            {
+                "fields": {
+                    "helpdesk_timeout": None,
+                    "wait_for_helpdesk": None,
+                    "helpdesk_message_id": None,
+                }
+            },
+        )
+        self.assertEqual(
+            json.loads(turn_archive.request.body),
+            {
+                "before": "ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+                "reason": "Auto archived after 11 days",
+            },
+        )
+        [timeout] = HelpdeskTimeout.objects.all()
+        self.assertEqual(
+            str(timeout.contact_id), "0b8c1bde-0b0a-4bd1-a3d5-aee43f4e2a3b"
+        )
+
+    @mock.patch("eventstore.tasks.update_rapidpro_contact")
+    def test_queue_failure(self, update_rapidpro_contact):
+        """
+        If the tasks can't be queued, the timeouts should be kept for the next run
+        """
+        update_rapidpro_contact.delay.side_effect = ConnectionError()
+        HelpdeskTimeout.objects.create(
+            contact_id="9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+            message_id="ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            timeout_date=datetime.date(2020, 1, 6),
+        )
+
+        with self.assertRaises(ConnectionError):
+            tasks.process_due_helpdesk_timeouts()
+
+        self.assertEqual(HelpdeskTimeout.objects.count(), 1)
+
+    @responses.activate
+    def test_due_timeout_no_wa_id(self):
+        """
+        If we don't have a WhatsApp ID for the contact, we should only clear the
+        contact fields
+        """
+        contact_id = "9e12d04c-af25-40b6-aa4f-57c72e8e3f91"
+        HelpdeskTimeout.objects.create(
+            contact_id=contact_id,
+            message_id="ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            timeout_date=datetime.date(2020, 1, 6),
+        )
+        responses.add(
+            responses.POST,
+            f"https://textit.in/api/v2/contacts.json?uuid={contact_id}",
+            json={"uuid": contact_id, "urns": [], "groups": [], "fields": {}},
+        )
+
+        tasks.process_due_helpdesk_timeouts()
+
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(HelpdeskTimeout.objects.count(), 0)
+
+
+class BulkForgetContactsTests(TestCase):
+    def setUp(self):
+        tasks.rapidpro = TembaClient("textit.in", "test-token")
+
+    def add_rapidpro_contact_response(self, contact_id, urns):
+        responses.add(
+            responses.GET,
+            f"https://textit.in/api/v2/contacts.json?uuid={contact_id}",
+            json={
+                "results": (
+                    [
+                        {
+                            "uuid": contact_id,
+                            "name": "",
+                            "language": "zul",
+                            "groups": [],
+                            "fields": {},
+                            "blocked": False,
+                            "stopped": False,
+                            "created_on": "2015-11-11T08:30:24.922024+00:00",
+                            "modified_on": "2015-11-11T08:30:25.525936+00:00",
+                            "urns": urns,
+                        }
+                    ]
+                    if urns is not None
+                    else []
+                ),
+                "next": None,
+            },
+        )
+
+    @responses.activate
+    @override_settings(BULK_FORGET_CONTACTS_CHUNK_SIZE=2, RAPIDPRO_DISPATCH_RATE=0)
+    def test_bulk_forget_contacts(self):
+        """
+        Should remove the PII for all the contacts, delete the contacts that exist
+        from RapidPro, and record the contacts that couldn't be fetched
+        """
+        found, missing, error = (str(uuid.uuid4()) for _ in range(3))
+        self.add_rapidpro_contact_response(found, ["whatsapp:27820001001"])
+        self.add_rapidpro_contact_response(missing, None)
+        responses.add(
+            responses.GET,
+            f"https://textit.in/api/v2/contacts.json?uuid={error}",
+            status=500,
+        )
+        responses.add(
+            responses.DELETE, f"https://textit.in/api/v2/contacts.json?uuid={found}"
+        )
+
+        switches = [
+            MSISDNSwitch.objects.create(
+                contact_id=contact_id,
+                source="POPI USSD",
+                old_msisdn=f"+2782000{i}000",
+                new_msisdn=f"+2782000{i}001",
+            )
+            for i, contact_id in enumerate((found, missing, error), start=2)
+        ]
+        optout = OptOut.objects.create(
+            contact_id=found,
+            optout_type=OptOut.FORGET_TYPE,
+            reason=OptOut.OTHER_REASON,
+            source="USSD",
+            data={"msisdn": "+27820001001"},
+        )
+        message = Message.objects.create(
+            contact_id="27820001001",
+            message_direction=Message.INBOUND,
+            data={"text": "hi"},
+        )
+        other_message = Message.objects.create(
+            id="other", contact_id="27820001002", message_direction=Message.INBOUND
+        )
+        error_message = Message.objects.create(
+            id="error", contact_id="27820004000", message_direction=Message.INBOUND
+        )
+        event = Event.objects.create(recipient_id="27820001001")
+        job = ForgetContactJob.objects.create(contact_ids=[found, missing, error])
+
+        tasks.bulk_forget_contacts(str(job.id))
+
+        for switch in switches:
+            switch.refresh_from_db()
+            self.assertEqual(switch.old_msisdn, "")
+            self.assertEqual(switch.new_msisdn, "")
+        optout.refresh_from_db()
+        self.assertEqual(optout.data, {})
+        message.refresh_from_db()
+        self.assertEqual(message.contact_id, found)
+        self.assertEqual(message.data, {})
+        other_message.refresh_from_db()
+        self.assertEqual(other_message.contact_id, "27820001002")
+        error_message.refresh_from_db()
+        self.assertEqual(error_message.contact_id, error)
+        event.refresh_from_db()
+        self.assertEqual(event.recipient_id, found)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ForgetContactJob.Status.COMPLETE)
+        self.assertEqual(job.processed, 3)
+        self.assertEqual(job.failed, [error])
+        [delete] = [c for c in responses.calls if c.request.method == "DELETE"]
+        self.assertIn(found, delete.request.url)
+
+    @responses.activate
+    @override_settings(RAPIDPRO_DISPATCH_RATE=0)
+    def test_retried_chunk_failures(self):
+        """
+        Retrying a chunk should replace its failures from the previous attempt,
+        instead of adding them again
+        """
+        fixed, error = str(uuid.uuid4()), str(uuid.uuid4())
+        self.add_rapidpro_contact_response(fixed, None)
+        responses.add(
+            responses.GET,
+            f"https://textit.in/api/v2/contacts.json?uuid={error}",
+            status=500,
+        )
+        job = ForgetContactJob.objects.create(
+            contact_ids=[fixed, error], failed=[fixed, error]
+        )
+
+        tasks.bulk_forget_contacts(str(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.failed, [error])
+
+    @responses.activate
+    def test_resumes_from_last_processed(self):
+        """
+        Contacts that were already processed shouldn't be processed again
+        """
+        done, todo = str(uuid.uuid4()), str(uuid.uuid4())
+        self.add_rapidpro_contact_response(todo, None)
+        job = ForgetContactJob.objects.create(contact_ids=[done, todo], processed=1)
+
+        tasks.bulk_forget_contacts(str(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ForgetContactJob.Status.COMPLETE)
+        self.assertEqual(job.processed, 2)
+        [call] = responses.calls
+        self.assertIn(todo, call.request.url)
+
+
+class ParseMomConnectImportTests(TestCase):
+    CSV = (
+        b"msisdn,facility code,id type,id number,messaging consent,edd year,"
+        b"edd month,edd day,baby dob year,baby dob month,baby dob day\n"
+        b"+27820001001,123456,said,9001010001088,true,2021,12,1,,,\n"
+        b"+27820001002,123456,said,9001010001088,true,2021,12,1,,,\n"
+    )
+
+    def setUp(self):
+        ClinicCode.objects.create(value="123456")
+        patcher = mock.patch("eventstore.models.is_valid_edd_date")
+        patcher.start().return_value = True
+        self.addCleanup(patcher.stop)
+
+    def create_import(self):
+        mcimport = MomConnectImport.objects.create()
+        mcimport.file.save("test.csv", ContentFile(self.CSV))
+        return mcimport
+
+    @mock.patch("eventstore.tasks.validate_momconnect_import")
+    def test_parse(self, validate_momconnect_import):
+        """
+        Should create the rows from the file, delete the file, and start validation
+        """
+        mcimport = self.create_import()
+        name = mcimport.file.name
+        tasks.parse_momconnect_import(mcimport.id)
+
+        mcimport.refresh_from_db()
+        self.assertEqual(
+            [r.msisdn for r in mcimport.rows.order_by("row_number")],
+            ["+27820001001", "+27820001002"],
+        )
+        self.assertFalse(mcimport.file)
+        self.assertFalse(default_storage.exists(name))
+        validate_momconnect_import.delay.assert_called_once_with(mcimport.id)
+
+    @mock.patch("eventstore.tasks.validate_momconnect_import")
+    def test_resume(self, validate_momconnect_import):
+        """
+        If the task was interrupted, should skip the rows that were already written
+        """
+        mcimport = self.create_import()
+        ImportStage.objects.create(
+            mcimport=mcimport, stage=ImportStage.Stage.PARSE, processed=1
+        )
+        tasks.parse_momconnect_import(mcimport.id)
+
+        [row] = mcimport.rows.all()
+        self.assertEqual(row.row_number, 3)
+        [stage] = mcimport.stages.all()
+        self.assertEqual(stage.processed, 2)
+        self.assertEqual(stage.total, 2)
+
+    @mock.patch("eventstore.tasks.validate_momconnect_import")
+    def test_invalid_csv(self, validate_momconnect_import):
+        """
+        If the file can't be parsed, should mark the import as an error, and delete
+        the file
+        """
+        mcimport = MomConnectImport.objects.create()
+        mcimport.file.save("test.csv", ContentFile(self.CSV + b'"+2782\0",1\n'))
+        name = mcimport.file.name
+        tasks.parse_momconnect_import(mcimport.id)
+
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.ERROR)
+        [error] = mcimport.errors.all()
+        self.assertEqual(error.error_type, ImportError.ErrorType.INVALID_FILETYPE)
+        self.assertFalse(mcimport.file)
+        self.assertFalse(default_storage.exists(name))
+        validate_momconnect_import.delay.assert_not_called()
+
+    @mock.patch("eventstore.tasks.validate_momconnect_import")
+    def test_missing_file(self, validate_momconnect_import):
+        """
+        If the file is missing from storage, should mark the import as an error
+        """
+        mcimport = self.create_import()
+        default_storage.delete(mcimport.file.name)
+        tasks.parse_momconnect_import(mcimport.id)
+
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.ERROR)
+        self.assertEqual(mcimport.errors.count(), 1)
+        self.assertFalse(mcimport.file)
+        validate_momconnect_import.delay.assert_not_called()
+
+    @mock.patch("eventstore.tasks.validate_momconnect_import")
+    def test_already_parsed(self, validate_momconnect_import):
+        """
+        If the file has already been parsed, should do nothing
+        """
+        mcimport = MomConnectImport.objects.create()
+        tasks.parse_momconnect_import(mcimport.id)
+        self.assertEqual(mcimport.rows.count(), 0)
+        validate_momconnect_import.delay.assert_not_called()
+
+
 class ValidateMomConnectImportTests(TestCase):
     @mock.patch("eventstore.tasks.upload_momconnect_import")
     @responses.activate
@@ -370,6 +757,93 @@ class ValidateMomConnectImportTests(TestCase):
         self.assertEqual(error.error_type, ImportError.ErrorType.ALREADY_REGISTERED)
 
 
+class ValidateMomConnectImportResumeTests(TestCase):
+    def setUp(self):
+        tasks.rapidpro = TembaClient("textit.in", "test-token")
+
+    def add_contact_response(self, msisdn, fields, status=200):
+        responses.add(
+            responses.GET,
+            f"https://textit.in/api/v2/contacts.json?urn=whatsapp%3A{msisdn}",
+            json={
+                "results": [
+                    {
+                        "uuid": "contact-uuid",
+                        "name": "",
+                        "language": "zul",
+                        "groups": [],
+                        "fields": fields,
+                        "blocked": False,
+                        "stopped": False,
+                        "created_on": "2015-11-11T08:30:24.922024+00:00",
+                        "modified_on": "2015-11-11T08:30:25.525936+00:00",
+                        "urns": [f"whatsapp:{msisdn}"],
+                    }
+                ],
+                "next": None,
+            },
+            status=status,
+        )
+
+    @override_settings(MOMCONNECT_IMPORT_CHUNK_SIZE=2)
+    @responses.activate
+    def test_resume(self):
+        """
+        If a request fails, the progress and errors up until that row should be
+        saved, and the retry should continue from there
+        """
+        mcimport = MomConnectImport.objects.create()
+        for i in range(2, 5):
+            mcimport.rows.create(
+                row_number=i,
+                msisdn=f"+2782000100{i}",
+                messaging_consent=True,
+                facility_code="123456",
+                edd_year=2021,
+                edd_month=12,
+                edd_day=13,
+                id_type=ImportRow.IDType.SAID,
+            )
+        self.add_contact_response("27820001002", {"opted_out": "TRUE"})
+        self.add_contact_response("27820001003", {})
+        self.add_contact_response("27820001004", {}, status=500)
+
+        with self.assertRaises(TembaHttpError):
+            tasks.validate_momconnect_import(mcimport.id)
+
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.VALIDATING)
+        self.assertEqual(mcimport.last_validated_row, 3)
+        [stage] = mcimport.stages.all()
+        self.assertEqual(stage.stage, ImportStage.Stage.VALIDATE)
+        self.assertEqual((stage.processed, stage.total), (2, 3))
+        self.assertGreater(stage.rate, 0)
+        self.assertEqual(stage.latency_count, 3)
+        self.assertEqual(sum(stage.latency_buckets), 3)
+        [error] = mcimport.errors.all()
+        self.assertEqual(error.row_number, 2)
+        self.assertEqual(error.error_type, ImportError.ErrorType.OPTED_OUT_ERROR)
+
+        responses.reset()
+        self.add_contact_response("27820001004", {"postbirth_messaging": "TRUE"})
+        tasks.validate_momconnect_import(mcimport.id)
+
+        self.assertEqual(len(responses.calls), 1)
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.ERROR)
+        self.assertEqual(mcimport.last_validated_row, 4)
+        [stage] = mcimport.stages.all()
+        self.assertEqual((stage.processed, stage.total), (3, 3))
+        self.assertEqual(stage.latency_count, 4)
+        self.assertEqual(
+            [(e.row_number, e.error_type) for e in mcimport.errors.order_by("id")],
+            [
+                (2, ImportError.ErrorType.OPTED_OUT_ERROR),
+                (4, ImportError.ErrorType.ALREADY_REGISTERED),
+            ],
+        )
+
+
 @override_settings(
     RAPIDPRO_PREBIRTH_CLINIC_FLOW="prebirth-clinic-flow-uuid",
     RAPIDPRO_POSTBIRTH_CLINIC_FLOW="postbirth-clinic-flow-uuid",
@@ -589,56 +1063,188 @@ class UploadMomConnectImportTests(TestCase):
         )
 
 
-class PostRandomContactsToSlackTests(TestCase):
+@override_settings(
+    RAPIDPRO_PREBIRTH_CLINIC_FLOW="prebirth-clinic-flow-uuid",
+    MOMCONNECT_IMPORT_UPLOAD_CHECKPOINT=2,
+)
+class UploadMomConnectImportResumeTests(TestCase):
     def setUp(self):
         tasks.rapidpro = TembaClient("textit.in", "test-token")
 
+    def create_import(self, rows):
+        mcimport = MomConnectImport.objects.create(
+            status=MomConnectImport.Status.VALIDATED
+        )
+        for i in range(2, rows + 2):
+            mcimport.rows.create(
+                row_number=i,
+                msisdn=f"+2782000100{i}",
+                messaging_consent=True,
+                facility_code="123456",
+                edd_year=2021,
+                edd_month=12,
+                edd_day=13,
+                id_type=ImportRow.IDType.SAID,
+                id_number="9001010001088",
+            )
+        return mcimport
+
+    def add_flow_start_callback(self, failing_urns=()):
+        def callback(request):
+            [urn] = json.loads(request.body)["urns"]
+            if urn in failing_urns:
+                return (500, {}, "")
+            return (
+                201,
+                {},
+                json.dumps(
+                    {
+                        "uuid": "flow-start-uuid",
+                        "flow": {"uuid": "prebirth-clinic-flow-uuid", "name": ""},
+                        "groups": [],
+                        "contacts": [],
+                        "extra": {},
+                        "restart_participants": True,
+                        "status": "complete",
+                        "created_on": "2015-11-11T08:30:24.922024+00:00",
+                        "modified_on": "2015-11-11T08:30:24.922024+00:00",
+                    }
+                ),
+            )
+
+        responses.add_callback(
+            responses.POST, "https://textit.in/api/v2/flow_starts.json", callback
+        )
+
+    @responses.activate
+    def test_resume(self):
+        """
+        If a flow start fails, the progress up until that row should be saved, and
+        the retry should continue from there
+        """
+        mcimport = self.create_import(3)
+        self.add_flow_start_callback(failing_urns={"whatsapp:27820001004"})
+
+        with self.assertRaises(TembaHttpError):
+            tasks.upload_momconnect_import(mcimport.id)
+
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.UPLOADING)
+        self.assertEqual(mcimport.last_uploaded_row, 3)
+
+        responses.reset()
+        self.add_flow_start_callback()
+        tasks.upload_momconnect_import(mcimport.id)
+
+        [call] = responses.calls
+        self.assertEqual(
+            json.loads(call.request.body)["urns"], ["whatsapp:27820001004"]
+        )
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.COMPLETE)
+        self.assertEqual(mcimport.last_uploaded_row, 4)
+        [stage] = mcimport.stages.all()
+        self.assertEqual(stage.stage, ImportStage.Stage.UPLOAD)
+        self.assertEqual((stage.processed, stage.total), (3, 3))
+
     @responses.activate
     @override_settings(
-        TURN_URL="https://turn/",
-        TURN_TOKEN="token",
-        EXTERNAL_REGISTRATIONS_V2=True,
-        SLACK_CHANNEL="test-slack",
-        SLACK_URL="http://slack.com",
-        RAPIDPRO_URL="rapidpro",
-        RAPIDPRO_TOKEN="rapidpro-token",
-        SLACK_TOKEN="slack-token",
+        MOMCONNECT_IMPORT_UPLOAD_CHECKPOINT=10, RAPIDPRO_DISPATCH_CONCURRENCY=4
     )
-    def test_post_random_contacts_to_slack_channel(self):
+    def test_resume_concurrent(self):
+        """
+        Rows after the failed row that were already started shouldn't be uploaded
+        again when retrying
+        """
+        mcimport = self.create_import(6)
+        self.add_flow_start_callback(failing_urns={"whatsapp:27820001004"})
+
+        with self.assertRaises(TembaHttpError):
+            tasks.upload_momconnect_import(mcimport.id)
+
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.last_uploaded_row, 3)
+        self.assertEqual(mcimport.uploaded_rows, [5, 6, 7])
+
+        responses.reset()
+        self.add_flow_start_callback()
+        tasks.upload_momconnect_import(mcimport.id)
+
+        [call] = responses.calls
+        self.assertEqual(
+            json.loads(call.request.body)["urns"], ["whatsapp:27820001004"]
+        )
+        mcimport.refresh_from_db()
+        self.assertEqual(mcimport.status, MomConnectImport.Status.COMPLETE)
+        self.assertEqual(mcimport.last_uploaded_row, 7)
+        self.assertEqual(mcimport.uploaded_rows, [])
+
+
+class PostRandomContactsToSlackTests(TestCase):
+    def setUp(self):
+        tasks.rapidpro = TembaClient("textit.in", "test-token")
+
+    def create_registration(self, contact_id, model=PrebirthRegistration, **kwargs):
+        fields = {
+            "contact_id": contact_id,
+            "device_contact_id": contact_id,
+            "id_type": "dob",
+            "language": "eng",
+        }
+        if model is PrebirthRegistration:
+            fields.update({"edd": datetime.date(2020, 6, 1), "facility_code": "123456"})
+        else:
+            fields["baby_dob"] = datetime.date(2020, 6, 1)
+        fields.update(kwargs)
+        return model.objects.create(**fields)
+
+    def add_rapidpro_contact_response(self, contact_id, urns):
         responses.add(
             responses.GET,
-            "https://textit.in/api/v2/contacts.json",
+            f"https://textit.in/api/v2/contacts.json?uuid={contact_id}",
             json={
                 "results": [
                     {
-                        "uuid": "148947f5-a3b6-4b6b-9e9b-25058b1b7800",
+                        "uuid": contact_id,
                         "name": "",
                         "language": "eng",
                         "groups": [],
-                        "fields": {"helpdesk_timeout": None},
+                        "fields": {},
                         "blocked": False,
                         "stopped": False,
                         "created_on": "2015-11-11T08:30:24.922024+00:00",
                         "modified_on": "2015-11-11T08:30:25.525936+00:00",
-                        "urns": ["whatsapp:27712345682"],
-                    },
-                    {
-                        "uuid": "128947f5-a3b6-4b3b-9e9b-25058b1b7801",
-                        "name": "",
-                        "language": "zul",
-                        "groups": [],
-                        "fields": "",
-                        "blocked": False,
-                        "stopped": False,
-                        "created_on": "2020-11-11T08:30:24.922024+00:00",
-                        "modified_on": "2021-11-11T08:30:25.525936+00:00",
-                        "urns": ["whatsapp:27720001010", "tel:0102584697"],
-                    },
+                        "urns": urns,
+                    }
                 ],
                 "next": None,
             },
         )
 
+    @responses.activate
+    @override_settings(
+        TURN_URL="https://turn/",
+        TURN_TOKEN="token",
+        SLACK_CHANNEL="test-slack",
+        SLACK_URL="http://slack.com",
+        RAPIDPRO_URL="rapidpro",
+        RAPIDPRO_TOKEN="rapidpro-token",
+        SLACK_TOKEN="slack-token",
+    )
+    def test_post_random_contacts_to_slack_channel(self):
+        """
+        Should only post the sampled contacts that have a Turn profile link
+        """
+        self.create_registration("148947f5-a3b6-4b6b-9e9b-25058b1b7800")
+        self.create_registration(
+            "128947f5-a3b6-4b3b-9e9b-25058b1b7801", model=PostbirthRegistration
+        )
+        self.add_rapidpro_contact_response(
+            "148947f5-a3b6-4b6b-9e9b-25058b1b7800", ["whatsapp:27712345682"]
+        )
+        self.add_rapidpro_contact_response(
+            "128947f5-a3b6-4b3b-9e9b-25058b1b7801", ["tel:+27720001010"]
+        )
         responses.add(
             responses.GET,
             "https://turn/v1/contacts/27712345682/messages",
@@ -651,7 +1257,6 @@ class PostRandomContactsToSlackTests(TestCase):
                 }
             },
         )
-
         responses.add(
             responses.POST, "http://slack.com/api/chat.postMessage", json={"ok": True}
         )
@@ -662,8 +1267,7 @@ class PostRandomContactsToSlackTests(TestCase):
         slack_body = requests.utils.unquote(slack_message.request.body)
 
         self.assertTrue(response["success"])
-        self.assertEqual(len(response.get("results")), 10)
-        self.assertEqual(slack_message.request.method, "POST")
+        self.assertEqual(len(response.get("results")), 2)
         self.assertEqual(
             slack_message.request.url, "http://slack.com/api/chat.postMessage"
         )
@@ -678,32 +1282,135 @@ class PostRandomContactsToSlackTests(TestCase):
         )
 
     @responses.activate
-    @override_settings(TURN_URL="https://turn/", TURN_TOKEN="token")
-    def test_get_random_contact(self):
+    @override_settings(
+        SLACK_CHANNEL="test-slack",
+        SLACK_URL="http://slack.com",
+        RAPIDPRO_URL="rapidpro",
+        RAPIDPRO_TOKEN="rapidpro-token",
+        SLACK_TOKEN="slack-token",
+        RANDOM_CONTACT_LIMIT=3,
+        RAPIDPRO_DISPATCH_RATE=0,
+    )
+    @mock.patch("eventstore.tasks.get_turn_profile_link")
+    def test_post_random_contacts_most_without_whatsapp(self, get_turn_profile_link):
+        """
+        If most of the sampled contacts don't have a WhatsApp URN, should keep
+        sampling until there are enough contacts that do
+        """
+        get_turn_profile_link.side_effect = lambda number: f"https://turn/{number}"
+        for i in range(20):
+            contact_id = f"148947f5-a3b6-4b6b-9e9b-25058b1b78{i:02}"
+            self.create_registration(contact_id)
+            urn = f"whatsapp:277123456{i:02}" if i in (3, 17) else "tel:+27720001010"
+            self.add_rapidpro_contact_response(contact_id, [urn])
         responses.add(
-            responses.GET,
-            "https://textit.in/api/v2/contacts.json",
-            json={"next": None, "previous": None, "results": []},
+            responses.POST, "http://slack.com/api/chat.postMessage", json={"ok": True}
         )
 
+        response = tasks.post_random_contacts_to_slack_channel()
+
+        self.assertTrue(response["success"])
+        self.assertEqual(len(response["results"]), 3)
+        self.assertEqual(
+            sorted(call.args for call in get_turn_profile_link.call_args_list),
+            [("27712345603",), ("27712345617",)],
+        )
+
+    @responses.activate
+    @override_settings(
+        SLACK_CHANNEL="test-slack",
+        SLACK_URL="http://slack.com",
+        RAPIDPRO_URL="rapidpro",
+        RAPIDPRO_TOKEN="rapidpro-token",
+        SLACK_TOKEN="slack-token",
+        RAPIDPRO_DISPATCH_RATE=0,
+    )
+    def test_post_random_contacts_attempts_limited(self):
+        """
+        Should stop sampling after trying 50 contacts
+        """
+        for i in range(60):
+            contact_id = f"148947f5-a3b6-4b6b-9e9b-25058b1b78{i:02}"
+            self.create_registration(contact_id)
+            self.add_rapidpro_contact_response(contact_id, ["tel:+27720001010"])
         responses.add(
-            responses.GET,
-            "http://turn/v1/contacts/27781234567/messages",
-            json={
-                "chat": {
-                    "owner": "+27836378500",
-                    "permalink": "https://app.turn.io/c/68cc14-462-8ed-c5df",
-                    "uuid": "68cc14b3-6a4e-4962-82ed-c572c6836fdd",
-                }
-            },
+            responses.POST, "http://slack.com/api/chat.postMessage", json={"ok": True}
         )
 
-        data, response = tasks.get_random_contact()
+        response = tasks.post_random_contacts_to_slack_channel()
 
-        contacts = responses.calls[-1]
+        self.assertEqual(response["results"], ["MomConnect Contacts for investigation"])
+        self.assertEqual(len(responses.calls), 51)
 
-        self.assertEqual(contacts.request.body, None)
-        self.assertEqual(response, None)
+    def test_sample_contact_ids(self):
+        """
+        Should return distinct contact IDs registered after the start date
+        """
+        self.create_registration("148947f5-a3b6-4b6b-9e9b-25058b1b7800")
+        self.create_registration("148947f5-a3b6-4b6b-9e9b-25058b1b7800")
+        self.create_registration(
+            "128947f5-a3b6-4b3b-9e9b-25058b1b7801",
+            timestamp=datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+
+        self.assertEqual(
+            sorted(tasks.sample_contact_ids(PrebirthRegistration, 5)),
+            [
+                "128947f5-a3b6-4b3b-9e9b-25058b1b7801",
+                "148947f5-a3b6-4b6b-9e9b-25058b1b7800",
+            ],
+        )
+        self.assertEqual(
+            tasks.sample_contact_ids(
+                PrebirthRegistration, 5, datetime.date(2020, 1, 1)
+            ),
+            ["148947f5-a3b6-4b6b-9e9b-25058b1b7800"],
+        )
+        self.assertEqual(len(tasks.sample_contact_ids(PrebirthRegistration, 1)), 1)
+        self.assertEqual(
+            tasks.sample_contact_ids(
+                PrebirthRegistration,
+                5,
+                exclude={"128947f5-a3b6-4b3b-9e9b-25058b1b7801"},
+            ),
+            ["148947f5-a3b6-4b6b-9e9b-25058b1b7800"],
+        )
+
+    @override_settings(RANDOM_CONTACT_SAMPLE_MIN_ROWS=0)
+    def test_sample_contact_ids_tablesample(self):
+        """
+        For large tables, should sample using TABLESAMPLE
+        """
+        self.create_registration("148947f5-a3b6-4b6b-9e9b-25058b1b7800")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE eventstore_prebirthregistration")
+
+        with CaptureQueriesContext(connection) as queries:
+            contact_ids = tasks.sample_contact_ids(PrebirthRegistration, 5)
+        self.assertEqual(contact_ids, ["148947f5-a3b6-4b6b-9e9b-25058b1b7800"])
+        self.assertIn("TABLESAMPLE SYSTEM (100.0)", queries[-1]["sql"])
+
+    @override_settings(RANDOM_CONTACT_SAMPLE_MIN_ROWS=0)
+    def test_sample_contact_ids_tablesample_start_date(self):
+        """
+        The sample should be sized by the rows registered after the start date, not
+        the whole table
+        """
+        for i in range(50):
+            self.create_registration(
+                f"148947f5-a3b6-4b6b-9e9b-25058b1b78{i:02}",
+                timestamp=datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc),
+            )
+        self.create_registration("128947f5-a3b6-4b3b-9e9b-25058b1b7801")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE eventstore_prebirthregistration")
+
+        with CaptureQueriesContext(connection) as queries:
+            contact_ids = tasks.sample_contact_ids(
+                PrebirthRegistration, 1, datetime.date(2020, 1, 1)
+            )
+        self.assertEqual(contact_ids, ["128947f5-a3b6-4b3b-9e9b-25058b1b7801"])
+        self.assertIn("TABLESAMPLE SYSTEM (100.0)", queries[-1]["sql"])
 
 
 class GetTurnContactProfileTests(TestCase):
@@ -927,3 +1634,26 @@ class ProcessWhatsAppTemplateSendStatusTests(TestCase):
             self.status_expired.status,
             WhatsAppTemplateSendStatus.Status.ACTION_COMPLETED,
         )
+
+
+class ReconcileStudyArmCountersTests(TestCase):
+    def test_reconcile(self):
+        """
+        Should correct and log the counters that don't match the study tables
+        """
+        StudyArmCounter.objects.create(
+            study=StudyArmCounter.Study.HCS_STUDY_B,
+            source="USSD",
+            province="ZA-WC",
+            count=3,
+        )
+        with self.assertLogs("eventstore.tasks", level="WARNING") as logs:
+            tasks.reconcile_study_arm_counters()
+        self.assertEqual(
+            logs.output,
+            [
+                "WARNING:eventstore.tasks:Corrected hcs_study_b counter for ZA-WC "
+                "USSD: 3 counted, 0 actual"
+            ],
+        )
+        self.assertEqual(StudyArmCounter.objects.get().count, 0)
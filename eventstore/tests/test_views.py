@@ -9,7 +9,9 @@ from urllib.parse import urlencode
 import responses
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from pytz import UTC
@@ -34,8 +36,10 @@ from eventstore.models import (
     EddSwitch,
     Event,
     Feedback,
+    ForgetContactJob,
     HCSStudyBRandomization,
     HealthCheckUserProfile,
+    HelpdeskTimeout,
     IdentificationSwitch,
     LanguageSwitch,
     Message,
@@ -46,6 +50,7 @@ from eventstore.models import (
     PrebirthRegistration,
     PublicRegistration,
     ResearchOptinSwitch,
+    StudyArmCounter,
     WhatsAppTemplateSendStatus,
 )
 from eventstore.serializers import (
@@ -267,6 +272,131 @@ class ForgetContactViewTests(APITestCase):
         )
 
 
+class ForgetContactJobViewSetTests(APITestCase):
+    url = reverse("forgetcontactjob-list")
+
+    def test_unauthorized(self):
+        user = get_user_model().objects.create_user("test")
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            self.url, {"contact_ids": ["9e12d04c-af25-40b6-aa4f-57c72e8e3f91"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @mock.patch("eventstore.views.bulk_forget_contacts")
+    def test_invalid_data(self, mock_bulk_forget_contacts):
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(
+            Permission.objects.get(codename="add_forgetcontactjob")
+        )
+        self.client.force_authenticate(user)
+        response = self.client.post(self.url, {"contact_ids": ["123"]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"contact_ids": {"0": ["Must be a valid UUID."]}}
+        )
+        mock_bulk_forget_contacts.apply_async.assert_not_called()
+
+    @mock.patch("eventstore.views.bulk_forget_contacts")
+    def test_successful_request(self, mock_bulk_forget_contacts):
+        """
+        Should create a job with the unique contact IDs, and queue the task
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(
+            Permission.objects.get(codename="add_forgetcontactjob")
+        )
+        user.user_permissions.add(
+            Permission.objects.get(codename="view_forgetcontactjob")
+        )
+        self.client.force_authenticate(user)
+        contact_ids = [
+            "9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+            "0b8c1bde-0b0a-4bd1-a3d5-aee43f4e2a3b",
+            "9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+        ]
+        response = self.client.post(
+            self.url, {"contact_ids": contact_ids}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        [job] = ForgetContactJob.objects.all()
+        self.assertEqual(job.contact_ids, contact_ids[:2])
+        self.assertEqual(job.created_by, "test")
+        mock_bulk_forget_contacts.apply_async.assert_called_once_with(
+            countdown=600, args=[str(job.id)]
+        )
+
+        response = self.client.get(
+            reverse("forgetcontactjob-detail", args=[str(job.id)])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data["status"], ForgetContactJob.Status.PENDING)
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(data["processed"], 0)
+        self.assertEqual(data["failed"], [])
+
+
+class HelpdeskTimeoutViewSetTests(APITestCase):
+    url = reverse("helpdesktimeout-list")
+
+    def test_unauthorized(self):
+        user = get_user_model().objects.create_user("test")
+        self.client.force_authenticate(user)
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_data(self):
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(
+            Permission.objects.get(codename="add_helpdesktimeout")
+        )
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            self.url,
+            {
+                "contact_id": "9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+                "msisdn": "invalid",
+                "message_id": "ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.json().keys()), ["msisdn"])
+
+    def test_successful_request(self):
+        """
+        Should create the timeout with its due date, and update it if the contact
+        starts waiting again
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(
+            Permission.objects.get(codename="add_helpdesktimeout")
+        )
+        self.client.force_authenticate(user)
+        data = {
+            "contact_id": "9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+            "msisdn": "+27820001001",
+            "message_id": "ABGGJ4NjeFMfAgo-sCqKaSQU4UzP",
+            "timeout_date": "2020-01-06",
+        }
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["due_date"], "2020-01-17")
+
+        [timeout] = HelpdeskTimeout.objects.all()
+        self.assertEqual(timeout.wa_id, "27820001001")
+        self.assertEqual(timeout.message_id, "ABGGJ4NjeFMfAgo-sCqKaSQU4UzP")
+        self.assertEqual(timeout.due_date, date(2020, 1, 17))
+        self.assertEqual(timeout.created_by, "test")
+
+        data["timeout_date"] = "2020-01-10"
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [timeout] = HelpdeskTimeout.objects.all()
+        self.assertEqual(timeout.due_date, date(2020, 1, 21))
+
+
 class BabySwitchViewSetTests(APITestCase, BaseEventTestCase):
     url = reverse("babyswitch-list")
 
@@ -2054,6 +2184,49 @@ class Covid19TriageViewSetTests(APITestCase, BaseEventTestCase):
             Covid19Triage.RISK_LOW, user.username
         )
 
+    def test_profile_created_concurrently(self):
+        """
+        If a concurrent HealthCheck creates the user's profile first, it should
+        update that profile instead
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(Permission.objects.get(codename="add_covid19triage"))
+        self.client.force_authenticate(user)
+        HealthCheckUserProfile.objects.create(
+            msisdn="+27820001001", first_name="concurrent", data={"key": "value"}
+        )
+        # The first fetch happens before the concurrent HealthCheck commits
+        profiles = [
+            HealthCheckUserProfile(msisdn="+27820001001"),
+            HealthCheckUserProfile.objects.get(msisdn="+27820001001"),
+        ]
+        with mock.patch.object(
+            HealthCheckUserProfile.objects, "get_for_update", side_effect=profiles
+        ):
+            response = self.client.post(
+                self.url,
+                {
+                    "msisdn": "27820001001",
+                    "source": "USSD",
+                    "province": "ZA-WC",
+                    "city": "cape town",
+                    "age": Covid19Triage.AGE_18T40,
+                    "fever": False,
+                    "cough": False,
+                    "sore_throat": False,
+                    "exposure": Covid19Triage.EXPOSURE_NO,
+                    "tracing": True,
+                    "risk": Covid19Triage.RISK_LOW,
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Covid19Triage.objects.count(), 1)
+        profile = HealthCheckUserProfile.objects.get(msisdn="+27820001001")
+        self.assertEqual(profile.first_name, "concurrent")
+        self.assertEqual(profile.data, {"key": "value"})
+        self.assertEqual(profile.city, "cape town")
+
     def test_creates_dbe_user_profile(self):
         """
         If this is a DBE healthcheck from a parent profile, then a DBE user profile
@@ -2200,27 +2373,12 @@ class Covid19TriageV2ViewSetTests(Covid19TriageViewSetTests):
     def test_returning_user(self, mock_update_post_screening_study_arms):
         """
         Should create a new Covid19Triage object in the database using information
-        from the first entry in the database
+        from the user's profile
         """
         user = get_user_model().objects.create_user("test")
         user.user_permissions.add(Permission.objects.get(codename="add_covid19triage"))
-        Covid19Triage.objects.create(
-            msisdn="+27820001001",
-            province="ZA-WC",
-            city="cape town",
-            fever=False,
-            cough=False,
-            sore_throat=False,
-            tracing=True,
-        )
-        Covid19Triage.objects.create(
-            msisdn="+27820001001",
-            province="ZA-GT",
-            city="sandton",
-            fever=False,
-            cough=False,
-            sore_throat=False,
-            tracing=True,
+        HealthCheckUserProfile.objects.create(
+            msisdn="+27820001001", province="ZA-WC", city="cape town"
         )
 
         self.client.force_authenticate(user)
@@ -2249,6 +2407,87 @@ class Covid19TriageV2ViewSetTests(Covid19TriageViewSetTests):
             Covid19Triage.RISK_LOW, user.username
         )
 
+    @override_settings(HEALTHCHECK_PROFILE_PREFILL_ENABLED=True)
+    def test_returning_user_profile_fetched_once(self):
+        """
+        The profile used to fill in the returning user fields should be locked, and
+        be the same one that's updated, so that the user's history is only replayed
+        once
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(Permission.objects.get(codename="add_covid19triage"))
+        Covid19Triage.objects.create(
+            msisdn="+27820001001",
+            first_name="testname",
+            province="ZA-WC",
+            city="cape town",
+            fever=False,
+            cough=False,
+            sore_throat=False,
+            tracing=True,
+        )
+
+        self.client.force_authenticate(user)
+        prefill = HealthCheckUserProfile.objects.prefill
+        with mock.patch.object(
+            HealthCheckUserProfile.objects, "prefill", side_effect=prefill
+        ) as mock_prefill, mock.patch.object(
+            HealthCheckUserProfile.objects, "get_or_build"
+        ) as mock_get_or_build, CaptureQueriesContext(
+            connection
+        ) as queries:
+            response = self.client.post(
+                self.url,
+                {
+                    "msisdn": "27820001001",
+                    "source": "USSD",
+                    "age": Covid19Triage.AGE_18T40,
+                    "fever": False,
+                    "cough": False,
+                    "sore_throat": False,
+                    "exposure": Covid19Triage.EXPOSURE_NO,
+                    "tracing": True,
+                    "risk": Covid19Triage.RISK_LOW,
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_prefill.assert_called_once()
+        mock_get_or_build.assert_not_called()
+        self.assertEqual(
+            len([q for q in queries if "FOR UPDATE" in q["sql"]]), 1, queries
+        )
+
+        profile = HealthCheckUserProfile.objects.get(msisdn="+27820001001")
+        self.assertEqual(profile.first_name, "testname")
+        self.assertEqual(profile.city, "cape town")
+
+    def test_returning_user_no_profile(self):
+        """
+        If the user skipped the returning user fields, but doesn't have a profile,
+        then the fields should be required as usual
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(Permission.objects.get(codename="add_covid19triage"))
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            self.url,
+            {
+                "msisdn": "27820001001",
+                "source": "USSD",
+                "age": Covid19Triage.AGE_18T40,
+                "fever": False,
+                "cough": False,
+                "sore_throat": False,
+                "exposure": Covid19Triage.EXPOSURE_NO,
+                "tracing": True,
+                "risk": Covid19Triage.RISK_LOW,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("province", response.data)
+
 
 class Covid19TriageV3ViewSetTests(Covid19TriageViewSetTests):
     url = reverse("covid19triagev3-list")
@@ -2338,6 +2577,51 @@ class Covid19TriageV3ViewSetTests(Covid19TriageViewSetTests):
 class Covid19TriageV4ViewSetTests(Covid19TriageViewSetTests):
     url = reverse("covid19triagev4-list")
 
+    # The maximum number of queries for creating a HealthCheck: 2 for permissions,
+    # lock profile, insert HealthCheck, study totals, update profile, and the
+    # transaction savepoint and release
+    CREATE_QUERY_BUDGET = 8
+
+    def test_create_query_budget(self):
+        """
+        Creating a HealthCheck for a returning user should stay within the query
+        budget, and only send the tasks once the HealthCheck is committed
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(Permission.objects.get(codename="add_covid19triage"))
+        self.client.force_authenticate(user)
+        HealthCheckUserProfile.objects.create(
+            msisdn="+27820001001", province="ZA-WC", city="cape town"
+        )
+
+        with mock.patch("eventstore.models.update_turn_contact") as task:
+            with self.captureOnCommitCallbacks() as callbacks:
+                with self.assertNumQueries(self.CREATE_QUERY_BUDGET):
+                    response = self.client.post(
+                        self.url,
+                        {
+                            "msisdn": "27820001001",
+                            "source": "USSD",
+                            "age": Covid19Triage.AGE_18T40,
+                            "fever": False,
+                            "cough": False,
+                            "sore_throat": False,
+                            "exposure": Covid19Triage.EXPOSURE_NO,
+                            "tracing": True,
+                            "risk": Covid19Triage.RISK_HIGH,
+                        },
+                        format="json",
+                    )
+                task.delay.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["profile"]["province"], "ZA-WC")
+
+        for callback in callbacks:
+            callback()
+        task.delay.assert_called_once_with("+27820001001", "hcs_study_c_arm", mock.ANY)
+        profile = HealthCheckUserProfile.objects.get(msisdn="+27820001001")
+        self.assertIsNotNone(profile.hcs_study_c_testing_arm)
+
     def test_get_list(self):
         """
         Should return the data, filtered by the querystring
@@ -2640,13 +2924,14 @@ class HealthCheckUserProfileViewSetTests(APITestCase, BaseEventTestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    @override_settings(HEALTHCHECK_PROFILE_PREFILL_ENABLED=True)
     @mock.patch(
         "eventstore.models.HealthCheckUserProfile.update_post_screening_study_arms"
     )
     def test_existing_healthchecks(self, mock_update_post_screening_study_arms):
         """
-        If there's no profile, but existing healthchecks, then it should construct the
-        profile from those healthchecks
+        If there's no profile, but existing healthchecks, and prefilling is enabled,
+        then it should construct the profile from those healthchecks
         """
         Covid19Triage.objects.create(
             msisdn="+27820001001",
@@ -2668,6 +2953,29 @@ class HealthCheckUserProfileViewSetTests(APITestCase, BaseEventTestCase):
 
         mock_update_post_screening_study_arms.assert_not_called()
 
+    @override_settings(HEALTHCHECK_PROFILE_PREFILL_ENABLED=False)
+    def test_existing_healthchecks_no_prefill(self):
+        """
+        If there's no profile, and prefilling is disabled, it shouldn't look at the
+        existing healthchecks
+        """
+        Covid19Triage.objects.create(
+            msisdn="+27820001001",
+            first_name="testname",
+            fever=False,
+            cough=False,
+            sore_throat=False,
+            tracing=True,
+        )
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(
+            Permission.objects.get(codename="view_healthcheckuserprofile")
+        )
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_existing_profile(self):
         """
         It should return the existing profile
@@ -2806,9 +3114,9 @@ class DBEOnBehalfOfProfileTests(APITestCase):
         )
         self.client.force_authenticate(user)
 
-        self.create_profile(msisdn="+27820001001")
-        self.create_profile(msisdn="+27820001001")
-        self.create_profile(msisdn="+27820001002")
+        self.create_profile(msisdn="+27820001001", name="Child 1")
+        self.create_profile(msisdn="+27820001001", name="Child 2")
+        self.create_profile(msisdn="+27820001002", name="Child 1")
 
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -8,7 +8,7 @@ from django.utils import timezone
 from temba_client.v2 import TembaClient
 
 from eventstore import tasks
-from eventstore.models import DeliveryFailure, Event
+from eventstore.models import DeliveryFailure, Event, HelpdeskTimeout
 from eventstore.whatsapp_actions import (
     handle_edd_message,
     handle_event,
@@ -109,8 +109,14 @@ class HandleOperatorMessageTests(DjangoTestCase):
             json={},
         )
         responses.add(responses.POST, "http://jembi/ws/rest/v1/helpdesk", json={})
+        HelpdeskTimeout.objects.create(
+            contact_id="9e12d04c-af25-40b6-aa4f-57c72e8e3f91",
+            wa_id="27820001001",
+            message_id="ABGGJ3EVEUV_AhALwhRTSopsSmF7IxgeYIBz",
+        )
 
         handle_operator_message(message)
+        self.assertFalse(HelpdeskTimeout.objects.exists())
         [jembi_request] = JembiSubmission.objects.all()
         jembi_request.request_data.pop("eid")
         self.assertEqual(
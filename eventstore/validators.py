@@ -2,11 +2,11 @@ import functools
 import re
 from datetime import date, datetime
 
-import phonenumbers
 from django.core.exceptions import ValidationError
 from iso6709 import Location
 
-from registrations.models import ClinicCode
+from ndoh_hub.msisdn import validate_msisdn
+from registrations.facility_codes import is_valid_facility_code
 
 
 def validate_true(value):
@@ -49,7 +49,7 @@ def validate_sa_id_number(value):
 
 
 def validate_facility_code(value):
-    if not ClinicCode.objects.filter(value=value).exists():
+    if not is_valid_facility_code(value):
         raise ValidationError("Invalid Facility Code")
 
 
@@ -68,14 +68,9 @@ def geographic_coordinate(value):
 
 
 def _phone_number(value, country):
-    try:
-        number = phonenumbers.parse(value, country)
-    except phonenumbers.NumberParseException as e:
-        raise ValidationError(str(e))
-    if not phonenumbers.is_possible_number(number):
-        raise ValidationError("Not a possible phone number")
-    if not phonenumbers.is_valid_number(number):
-        raise ValidationError("Not a valid phone number")
+    msisdn = validate_msisdn(value, country)
+    if msisdn.error:
+        raise ValidationError(msisdn.message)
 
 
 za_phone_number = functools.partial(_phone_number, country="ZA")
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.http import Http404, JsonResponse
 from django_filters import rest_framework as filters
 from pytz import UTC
@@ -32,8 +32,10 @@ from eventstore.models import (
     EddSwitch,
     Event,
     Feedback,
+    ForgetContactJob,
     HCSStudyBRandomization,
     HealthCheckUserProfile,
+    HelpdeskTimeout,
     IdentificationSwitch,
     LanguageSwitch,
     Message,
@@ -62,9 +64,11 @@ from eventstore.serializers import (
     EddSwitchSerializer,
     EventSerializer,
     FeedbackSerializer,
+    ForgetContactJobSerializer,
     ForgetContactSerializer,
     HCSStudyBRandomizationSerializer,
     HealthCheckUserProfileSerializer,
+    HelpdeskTimeoutSerializer,
     IdentificationSwitchSerializer,
     LanguageSwitchSerializer,
     MSISDNSerializer,
@@ -79,8 +83,13 @@ from eventstore.serializers import (
     WhatsAppTemplateSendStatusSerializer,
     WhatsAppWebhookSerializer,
 )
-from eventstore.tasks import forget_contact, reset_delivery_failure
+from eventstore.tasks import (
+    bulk_forget_contacts,
+    forget_contact,
+    reset_delivery_failure,
+)
 from eventstore.whatsapp_actions import handle_event, increment_failure_count
+from ndoh_hub.db_routers import use_replica
 from ndoh_hub.utils import TokenAuthQueryString, validate_signature
 
 
@@ -249,7 +258,18 @@ class EventFilter(filters.FilterSet):
         fields: list = ["message_id"]
 
 
-class WhatsAppEventsViewSet(GenericViewSet, ListModelMixin):
+class ReplicaListMixin:
+    """
+    Reads lists from the replica database, if there is one, so that reporting
+    consumers don't compete with ingestion on the primary
+    """
+
+    def list(self, request, *args, **kwargs):
+        with use_replica():
+            return super().list(request, *args, **kwargs)
+
+
+class WhatsAppEventsViewSet(ReplicaListMixin, GenericViewSet, ListModelMixin):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = (DjangoViewModelPermissions,)
@@ -285,6 +305,22 @@ class ForgetContactView(generics.GenericAPIView):
         return Response({}, status=status.HTTP_200_OK)
 
 
+class ForgetContactJobViewSet(GenericViewSet, CreateModelMixin, RetrieveModelMixin):
+    """
+    Forgets a batch of contacts. The progress can be tracked by fetching the job.
+    """
+
+    queryset = ForgetContactJob.objects.all()
+    serializer_class = ForgetContactJobSerializer
+    permission_classes = (DjangoViewModelPermissions,)
+
+    def perform_create(self, serializer):
+        job = serializer.save()
+        bulk_forget_contacts.apply_async(
+            countdown=settings.FORGET_OPTOUT_TASK_COUNTDOWN, args=[str(job.id)]
+        )
+
+
 class BabySwitchViewSet(GenericViewSet, CreateModelMixin):
     queryset = BabySwitch.objects.all()
     serializer_class = BabySwitchSerializer
@@ -400,7 +436,9 @@ class HCSStudyBRandomizationFilter(filters.FilterSet):
         fields: list = []
 
 
-class Covid19TriageViewSet(GenericViewSet, CreateModelMixin, ListModelMixin):
+class Covid19TriageViewSet(
+    ReplicaListMixin, GenericViewSet, CreateModelMixin, ListModelMixin
+):
     queryset = Covid19Triage.objects.all()
     serializer_class = Covid19TriageSerializer
     permission_classes = (DjangoViewModelPermissions,)
@@ -410,14 +448,22 @@ class Covid19TriageViewSet(GenericViewSet, CreateModelMixin, ListModelMixin):
 
     def perform_create(self, serializer):
         """
-        Mark turn healthcheck complete, and update the user profile
+        Mark turn healthcheck complete, and update the user profile, in the
+        transaction opened by create. Any tasks are only sent once the transaction
+        is committed.
         """
         instance = serializer.save()
 
-        profile = HealthCheckUserProfile.objects.get_or_prefill(msisdn=instance.msisdn)
-        profile.update_from_healthcheck(instance)
-        profile.update_post_screening_study_arms(instance.risk, instance.created_by)
-        profile.save()
+        if self.get_profile(instance.msisdn)._state.adding:
+            try:
+                with transaction.atomic():
+                    self.update_profile(instance)
+            except IntegrityError:
+                # A concurrent HealthCheck created the profile first, so update that
+                del self._profiles[instance.msisdn]
+                self.update_profile(instance)
+        else:
+            self.update_profile(instance)
 
         if (
             instance.created_by == "whatsapp_dbe_healthcheck"
@@ -427,9 +473,34 @@ class Covid19TriageViewSet(GenericViewSet, CreateModelMixin, ListModelMixin):
 
         return instance
 
+    def update_profile(self, healthcheck):
+        profile = self.get_profile(healthcheck.msisdn)
+        profile.update_from_healthcheck(healthcheck)
+        profile.update_post_screening_study_arms(
+            healthcheck.risk, healthcheck.created_by
+        )
+        profile.save_changes()
+
+    def get_profile(self, msisdn):
+        """
+        Gets the user profile, only fetching it once per request. When creating, it
+        is locked until the end of the transaction, so that it can't change between
+        being used to fill in the HealthCheck and being updated from it.
+        """
+        if not hasattr(self, "_profiles"):
+            self._profiles = {}
+        if msisdn not in self._profiles:
+            if self.action == "create":
+                profile = HealthCheckUserProfile.objects.get_for_update(msisdn)
+            else:
+                profile = HealthCheckUserProfile.objects.get_or_build(msisdn=msisdn)
+            self._profiles[msisdn] = profile
+        return self._profiles[msisdn]
+
     def create(self, *args, **kwargs):
         try:
-            return super().create(*args, **kwargs)
+            with transaction.atomic():
+                return super().create(*args, **kwargs)
         except IntegrityError:
             # We already have this entry
             return Response(status=status.HTTP_200_OK)
@@ -464,21 +535,20 @@ class Covid19TriageV2ViewSet(Covid19TriageViewSet):
         serializer.is_valid(raise_exception=True)
         return serializer.validated_data["msisdn"]
 
-    def _update_data(self, data, triage):
-        """Updates the data from the values in triage"""
+    def _update_data(self, data, profile):
+        """Updates the data from the values in the user's profile"""
         for field in self.returning_user_skipped_fields:
-            value = getattr(triage, field)
+            value = getattr(profile, field)
             if value:
                 data[field] = value
 
     def create(self, request, *args, **kwargs):
         # If all of the returning user skipped fields are missing
         if all(not request.data.get(f) for f in self.returning_user_skipped_fields):
-            # Get those fields from a previous completed HealthCheck
+            # Get those fields from the profile, which has the latest values from
+            # their previous HealthChecks, and which we need to update anyway
             msisdn = self._get_msisdn(request.data)
-            triage = Covid19Triage.objects.filter(msisdn=msisdn).earliest("timestamp")
-            if triage:
-                self._update_data(request.data, triage)
+            self._update_data(request.data, self.get_profile(msisdn))
         return super().create(request, *args, **kwargs)
 
 
@@ -496,7 +566,9 @@ class Covid19TriageV4ViewSet(Covid19TriageV3ViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class Covid19TriageStartViewSet(GenericViewSet, CreateModelMixin, ListModelMixin):
+class Covid19TriageStartViewSet(
+    ReplicaListMixin, GenericViewSet, CreateModelMixin, ListModelMixin
+):
     queryset = Covid19TriageStart.objects.all()
     serializer_class = Covid19TriageStartSerializer
     permission_classes = (DjangoViewModelPermissions,)
@@ -505,7 +577,9 @@ class Covid19TriageStartViewSet(GenericViewSet, CreateModelMixin, ListModelMixin
     filterset_class = Covid19TriageStartFilter
 
 
-class HCSStudyBRandomizationViewSet(GenericViewSet, CreateModelMixin, ListModelMixin):
+class HCSStudyBRandomizationViewSet(
+    ReplicaListMixin, GenericViewSet, CreateModelMixin, ListModelMixin
+):
     queryset = HCSStudyBRandomization.objects.all()
     serializer_class = HCSStudyBRandomizationSerializer
     permission_classes = (DjangoViewModelPermissions,)
@@ -537,7 +611,7 @@ class HealthCheckUserProfileViewSet(GenericViewSet, RetrieveModelMixin):
     permission_classes = (DjangoViewModelPermissions,)
 
     def get_object(self):
-        obj = HealthCheckUserProfile.objects.get_or_prefill(msisdn=self.kwargs["pk"])
+        obj = HealthCheckUserProfile.objects.get_or_build(msisdn=self.kwargs["pk"])
         if not obj.pk:
             raise Http404()
         self.check_object_permissions(self.request, obj)
@@ -550,7 +624,7 @@ class CDUAddressUpdateViewSet(GenericViewSet, CreateModelMixin):
     permission_classes = (DjangoViewModelPermissions,)
 
 
-class DBEOnBehalfOfProfileViewSet(GenericViewSet, ListModelMixin):
+class DBEOnBehalfOfProfileViewSet(ReplicaListMixin, GenericViewSet, ListModelMixin):
     queryset = DBEOnBehalfOfProfile.objects.all()
     serializer_class = DBEOnBehalfOfProfileSerializer
     permission_classes = (DjangoViewModelPermissions,)
@@ -564,6 +638,29 @@ class DBEOnBehalfOfProfileViewSet(GenericViewSet, ListModelMixin):
         return queryset
 
 
+class HelpdeskTimeoutViewSet(GenericViewSet, CreateModelMixin):
+    """
+    Records that a contact is waiting for a reply from the helpdesk, so that their
+    conversation can be archived if the wait expires without a reply
+    """
+
+    queryset = HelpdeskTimeout.objects.all()
+    serializer_class = HelpdeskTimeoutSerializer
+    permission_classes = (DjangoViewModelPermissions,)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        contact_id = data.pop("contact_id")
+        data["created_by"] = request.user.username
+        obj, created = HelpdeskTimeout.objects.update_or_create(
+            contact_id=contact_id, defaults=data
+        )
+        code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        return Response(self.get_serializer(obj).data, status=code)
+
+
 class DeliveryFailureViewSet(GenericViewSet, CreateModelMixin, RetrieveModelMixin):
     queryset = DeliveryFailure.objects.all()
     serializer_class = DeliveryFailureSerializer
@@ -1,7 +1,13 @@
 from celery import chain
 from django.conf import settings
 
-from eventstore.models import SMS_CHANNELTYPE, DeliveryFailure, Event, OptOut
+from eventstore.models import (
+    SMS_CHANNELTYPE,
+    DeliveryFailure,
+    Event,
+    HelpdeskTimeout,
+    OptOut,
+)
 from eventstore.tasks import (
     async_create_flow_start,
     get_rapidpro_contact_by_msisdn,
@@ -39,6 +45,7 @@ def handle_operator_message(message):
     update_rapidpro_contact.delay(
         f"whatsapp:{msisdn.lstrip('+')}", {"wait_for_helpdesk": ""}
     )
+    HelpdeskTimeout.objects.filter(wa_id=msisdn.lstrip("+")).delete()
 
 
 def handle_inbound(message):
@@ -1,16 +1,120 @@
-from functools import partial
+import logging
+import threading
+import time
 
+from django.conf import settings
 from django.core.cache import caches
+from django_redis import get_redis_connection
+from prometheus_client import Counter
+from redis.exceptions import RedisError
 from rest_framework.authentication import TokenAuthentication
 
-locmem_cache = caches["locmem"]
+logger = logging.getLogger(__name__)
+
+local_cache = caches["authtoken"]
+redis_cache = caches["redis"]
+
+REVOCATION_CHANNEL = "authtoken:revoked"
+
+TOKEN_CACHE_REQUESTS = Counter(
+    "auth_token_cache_requests_total",
+    "Token authentication cache lookups, by cache tier and result",
+    ["tier", "result"],
+)
+
+
+def get_cache_key(key):
+    return "authtoken:{}".format(key)
+
+
+def revoke_token(key):
+    """
+    Removes the token from the shared cache, and tells all the processes to remove
+    it from their local caches
+    """
+    local_cache.delete(get_cache_key(key))
+    try:
+        redis_cache.delete(get_cache_key(key))
+        get_redis_connection("redis").publish(REVOCATION_CHANNEL, key)
+    except RedisError:
+        logger.exception("Cannot revoke cached token")
+
+
+class TokenRevocationListener:
+    """
+    Removes revoked tokens from this process's local cache, as they're published.
+    Runs in a background thread, which is only started once the cache is used, so
+    that it starts after gunicorn forks the workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="authtoken-revocations", daemon=True
+                )
+                self.thread.start()
+
+    def listen(self):
+        pubsub = get_redis_connection("redis").pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(REVOCATION_CHANNEL)
+        # Any tokens revoked before we subscribed might have been missed
+        local_cache.clear()
+        for message in pubsub.listen():
+            local_cache.delete(get_cache_key(message["data"].decode()))
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except RedisError:
+                logger.exception("Token revocation listener disconnected")
+                time.sleep(5)
+
+
+revocation_listener = TokenRevocationListener()
 
 
 class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Caches the user for each token in a local cache, in front of a cache in Redis
+    that is shared between all the processes. Revoked tokens are removed from both.
+    """
+
+    def get_from_redis(self, cache_key):
+        try:
+            return redis_cache.get(cache_key)
+        except RedisError:
+            logger.exception("Cannot get cached token")
+            return None
+
+    def set_in_redis(self, cache_key, value):
+        try:
+            redis_cache.set(cache_key, value, settings.AUTH_TOKEN_REDIS_CACHE_TTL)
+        except RedisError:
+            logger.exception("Cannot cache token")
+
     def authenticate_credentials(self, key):
         """
         Does a cached lookup for a user for the given token
         """
-        return locmem_cache.get_or_set(
-            "authtoken:{}".format(key), partial(super().authenticate_credentials, key)
-        )
+        revocation_listener.start()
+        cache_key = get_cache_key(key)
+
+        value = local_cache.get(cache_key)
+        TOKEN_CACHE_REQUESTS.labels("local", "miss" if value is None else "hit").inc()
+        if value is not None:
+            return value
+
+        value = self.get_from_redis(cache_key)
+        TOKEN_CACHE_REQUESTS.labels("redis", "miss" if value is None else "hit").inc()
+        if value is None:
+            value = super().authenticate_credentials(key)
+            self.set_in_redis(cache_key, value)
+
+        local_cache.set(cache_key, value, settings.AUTH_TOKEN_LOCAL_CACHE_TTL)
+        return value
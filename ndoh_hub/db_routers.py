@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+_use_replica = ContextVar("use_replica", default=False)
+
+# How many seconds the replica is behind the primary, and NULL if the database isn't a
+# replica. Zero if it is streaming from the primary and has replayed all the changes
+# it has received. If it isn't streaming, it could be any amount behind, so the time
+# since the last replayed transaction is used. The WAL receiver's status is only
+# visible to roles with pg_read_all_stats, otherwise a running receiver is assumed to
+# be streaming.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            AND EXISTS (
+                SELECT FROM pg_stat_wal_receiver
+                WHERE COALESCE(status, 'streaming') = 'streaming'
+            )
+            THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float,
+            'Infinity'
+        )
+    END
+"""
+
+
+@contextmanager
+def use_replica():
+    """
+    Sends all the reads inside this block to the replica database, if there is one
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaLagCheck:
+    """
+    Checks whether the replica is up to date enough to read from, at most once every
+    REPLICA_LAG_CHECK_INTERVAL seconds
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.fresh = False
+
+    def get_lag(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            (lag,) = cursor.fetchone()
+        return lag
+
+    def is_fresh(self, alias):
+        with self.lock:
+            now = time.monotonic()
+            if (
+                self.checked is not None
+                and now - self.checked < settings.REPLICA_LAG_CHECK_INTERVAL
+            ):
+                return self.fresh
+
+            try:
+                lag = self.get_lag(alias)
+                self.fresh = lag is None or lag <= settings.REPLICA_MAX_LAG
+                if not self.fresh:
+                    logger.warning(f"Replica is {lag:.0f}s behind, using primary")
+            except DatabaseError:
+                logger.exception("Cannot check replica lag, using primary")
+                self.fresh = False
+            self.checked = now
+            return self.fresh
+
+
+lag_check = ReplicaLagCheck()
+
+
+class ReplicaRouter:
+    """
+    Sends the reads inside `use_replica` blocks to the REPLICA_DATABASE, unless it is
+    lagging more than REPLICA_MAX_LAG seconds behind the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = settings.REPLICA_DATABASE
+        if alias and _use_replica.get() and lag_check.is_fresh(alias):
+            return alias
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket rate limiter.
+
+    Tokens are added at `rate` per second, up to a maximum of `capacity`, and every
+    call to `acquire` blocks until it can take a token.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RedisTokenBucket:
+    """
+    A token bucket rate limiter, with its state stored in Redis, so that the rate
+    limit is shared between all the processes that use the same `key`.
+    """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local time = redis.call("TIME")
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+    redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, redis, key: str, rate: float, capacity: Optional[float] = None):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.script = redis.register_script(self.SCRIPT)
+
+    def acquire(self) -> None:
+        while True:
+            wait = float(self.script(keys=[self.key], args=[self.rate, self.capacity]))
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+def dispatch(
+    func: Callable,
+    items: Iterable,
+    concurrency: int = 1,
+    rate: Optional[float] = None,
+    limiter=None,
+) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """
+    Calls `func` for each of `items` on a pool of `concurrency` threads, with at most
+    `rate` calls starting per second if a rate is given. A shared `limiter`, such as
+    a RedisTokenBucket, can be given instead of a rate.
+
+    Yields an (item, result, exception) tuple for every item, in the same order as
+    `items`, so that callers can checkpoint their progress.
+
+    Items are only taken from `items` as results are yielded, with at most twice
+    `concurrency` calls submitted at a time. Closing the generator early, eg. by
+    breaking out of the loop, cancels the calls that haven't started and waits for
+    the ones that have. Callers that need the result of every call that was made
+    should stop supplying items instead, and consume the remaining results.
+    """
+    if limiter is None and rate:
+        limiter = TokenBucket(rate)
+
+    def call(item):
+        if limiter:
+            limiter.acquire()
+        return func(item)
+
+    concurrency = max(concurrency, 1)
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending: Deque[Tuple[object, Future]] = deque()
+
+    def submit(count):
+        for item in islice(items, count):
+            pending.append((item, executor.submit(call, item)))
+
+    try:
+        submit(concurrency * 2)
+        while pending:
+            item, future = pending.popleft()
+            try:
+                result = item, future.result(), None
+            except Exception as e:
+                result = item, None, e
+            submit(1)
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
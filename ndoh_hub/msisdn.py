@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import phonenumbers
+from phonenumbers import (
+    NumberParseException,
+    PhoneMetadata,
+    PhoneNumber,
+    PhoneNumberFormat,
+)
+
+# The number of distinct inputs to remember the results for. Each entry is a few
+# hundred bytes.
+CACHE_SIZE = 50000
+
+# South African numbers in E164 format, or unformatted national or international
+# format, which can skip parsing. A leading zero in the national number would be
+# dropped by parsing, so isn't matched.
+ZA_MSISDN = re.compile(r"(?:\+27|27|0)([1-9]\d{8})")
+
+# The number types that phonenumbers considers valid
+NUMBER_TYPES = (
+    "fixed_line",
+    "mobile",
+    "toll_free",
+    "premium_rate",
+    "shared_cost",
+    "personal_number",
+    "voip",
+    "pager",
+    "uan",
+    "voicemail",
+)
+
+
+def get_national_number_pattern(region, length):
+    """
+    Combines the patterns for all the valid types of national numbers of `length`
+    in the phonenumbers metadata for `region`, so that numbers can be validated
+    without being parsed
+    """
+    metadata = PhoneMetadata.metadata_for_region(region)
+    patterns = []
+    for number_type in NUMBER_TYPES:
+        desc = getattr(metadata, number_type)
+        if desc is None or not desc.national_number_pattern:
+            continue
+        if length in (desc.possible_length or metadata.general_desc.possible_length):
+            patterns.append(f"(?:{desc.national_number_pattern})")
+    return re.compile(
+        f"(?=(?:{metadata.general_desc.national_number_pattern})$)"
+        f"(?:{'|'.join(patterns)})"
+    )
+
+
+ZA_NATIONAL_NUMBER = get_national_number_pattern("ZA", 9)
+
+
+class ValidatedMSISDN(NamedTuple):
+    """
+    The result of validating an MSISDN. `error` is one of "cannot_parse",
+    "not_possible" or "not_valid", with a description in `message`.
+    """
+
+    e164: Optional[str]
+    error: Optional[str] = None
+    message: Optional[str] = None
+    number: Optional[PhoneNumber] = None
+
+    def to_phonenumber(self) -> PhoneNumber:
+        """
+        Returns a copy of the parsed number, so that the cached one isn't modified
+        """
+        number = PhoneNumber()
+        number.merge_from(self.number)
+        return number
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalise_msisdn(msisdn: str, country: Optional[str]) -> str:
+    return phonenumbers.format_number(
+        phonenumbers.parse(msisdn, country), PhoneNumberFormat.E164
+    )
+
+
+def get_za_national_number(msisdn: str, country: Optional[str]) -> Optional[str]:
+    """
+    Returns the national number of a South African MSISDN that doesn't need to be
+    parsed, or None
+    """
+    match = ZA_MSISDN.fullmatch(msisdn)
+    # Only E164 numbers are South African regardless of the default country
+    if match and (country == "ZA" or msisdn[0] == "+"):
+        return match.group(1)
+    return None
+
+
+def normalise_msisdn(msisdn: str, country: Optional[str] = "ZA") -> str:
+    """
+    Takes the MSISDN input, and normalises it to E164 format
+    """
+    national_number = get_za_national_number(msisdn, country)
+    if national_number:
+        return f"+27{national_number}"
+    return _normalise_msisdn(msisdn, country)
+
+
+def msisdn_to_whatsapp_id(msisdn: str) -> str:
+    """
+    Takes MSISDN input, normalises it and formats it as a whatsapp ID
+    """
+    return normalise_msisdn(msisdn).replace("+", "")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def validate_msisdn(msisdn: str, country: Optional[str] = "ZA") -> ValidatedMSISDN:
+    """
+    Parses and validates the MSISDN input, returning it in E164 format, or the
+    reason that it isn't valid
+    """
+    national_number = get_za_national_number(msisdn, country)
+    if national_number and ZA_NATIONAL_NUMBER.fullmatch(national_number):
+        number = PhoneNumber(country_code=27, national_number=int(national_number))
+        return ValidatedMSISDN(f"+27{national_number}", number=number)
+
+    try:
+        number = phonenumbers.parse(msisdn, country)
+    except NumberParseException as e:
+        return ValidatedMSISDN(None, "cannot_parse", str(e))
+
+    e164 = phonenumbers.format_number(number, PhoneNumberFormat.E164)
+    if not phonenumbers.is_possible_number(number):
+        return ValidatedMSISDN(e164, "not_possible", "Not a possible phone number")
+    if not phonenumbers.is_valid_number(number):
+        return ValidatedMSISDN(e164, "not_valid", "Not a valid phone number")
+    return ValidatedMSISDN(e164, number=number)
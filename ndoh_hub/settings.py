@@ -125,6 +125,18 @@ DATABASES = {
     )
 }
 
+# A read replica for the list endpoints and admin changelists, used while it is less
+# than REPLICA_MAX_LAG seconds behind the primary
+REPLICA_DATABASE = None
+if os.environ.get("HUB_REPLICA_DATABASE"):
+    REPLICA_DATABASE = "replica"
+    DATABASES[REPLICA_DATABASE] = dj_database_url.config(
+        env="HUB_REPLICA_DATABASE", engine="django_prometheus.db.backends.postgresql"
+    )
+REPLICA_MAX_LAG = env.float("REPLICA_MAX_LAG", 30.0)
+REPLICA_LAG_CHECK_INTERVAL = env.float("REPLICA_LAG_CHECK_INTERVAL", 5.0)
+DATABASE_ROUTERS = ["ndoh_hub.db_routers.ReplicaRouter"]
+
 PROMETHEUS_EXPORT_MIGRATIONS = False
 
 
@@ -179,6 +191,11 @@ STATIC_URL = "/static/"
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
+# Uploaded MomConnect import files are stored here until they have been parsed, so it
+# must be shared between the web and batch celery workers, like the media volume in
+# docker-compose.yml
+MEDIA_ROOT = env.str("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -214,7 +231,7 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
-    "DEFAULT_THROTTLE_CLASSES": ["rest_framework.throttling.ScopedRateThrottle"],
+    "DEFAULT_THROTTLE_CLASSES": ["ndoh_hub.throttling.RedisScopedRateThrottle"],
     "DEFAULT_THROTTLE_RATES": {
         "covid19triage.create": os.environ.get(
             "COVID19_TRIAGE_CREATE_THROTTLE_RATE", "30/second"
@@ -228,8 +245,60 @@ REST_FRAMEWORK = {
 # Celery configuration options
 CELERY_BROKER_URL = os.environ.get("BROKER_URL", "redis://localhost:6379/0")
 
+# Tasks are split into a queue per workload, so that a backlog in one, eg. a large
+# import or an outage of an external API, doesn't delay the others. Each queue has its
+# own workers, see docs/celery-queues.md. Tasks that aren't routed go to the default
+# queue.
 CELERY_TASK_DEFAULT_QUEUE = "ndoh_hub"
-CELERY_TASK_QUEUES = (Queue("ndoh_hub", Exchange("ndoh_hub"), routing_key="ndoh_hub"),)
+CELERY_WORKLOAD_QUEUES = {
+    # Short database writes from the webhooks
+    "ingestion": (
+        "eventstore.batch_tasks.bulk_insert_events",
+        "eventstore.batch_tasks.update_or_create_message",
+        "eventstore.tasks.store_jembi_request",
+        "eventstore.tasks.update_whatsapp_template_send_status",
+    ),
+    # Requests to external APIs, which spend most of their time waiting
+    "outbound": (
+        "aaq.tasks.send_feedback_task",
+        "aaq.tasks.send_feedback_task_v2",
+        "eventstore.hcs_tasks.start_study_c_registration_flow",
+        "eventstore.hcs_tasks.update_turn_contact",
+        "eventstore.tasks.archive_turn_conversation",
+        "eventstore.tasks.async_create_flow_start",
+        "eventstore.tasks.delete_rapidpro_contact_by_uuid",
+        "eventstore.tasks.get_engage_inbound_and_reply",
+        "eventstore.tasks.get_rapidpro_contact_by_msisdn",
+        "eventstore.tasks.get_rapidpro_contact_by_uuid",
+        "eventstore.tasks.push_to_jembi_api",
+        "eventstore.tasks.reset_delivery_failure",
+        "eventstore.tasks.send_helpdesk_response_to_dhis2",
+        "eventstore.tasks.update_rapidpro_contact",
+        "registrations.tasks.check_whatsapp_contacts",
+    ),
+    # Long running tasks, that can take up to an hour
+    "batch": (
+        "eventstore.tasks.bulk_forget_contacts",
+        "eventstore.tasks.delete_contact_pii",
+        "eventstore.tasks.parse_momconnect_import",
+        "eventstore.tasks.upload_momconnect_import",
+        "eventstore.tasks.validate_momconnect_import",
+    ),
+    # Periodic tasks, started by celery beat
+    "scheduled": (
+        "celery.backend_cleanup",
+        "eventstore.tasks.handle_expired_helpdesk_contacts",
+        "eventstore.tasks.post_random_mc_contacts_to_slack_channel",
+        "eventstore.tasks.process_due_helpdesk_timeouts",
+        "eventstore.tasks.process_whatsapp_template_send_status",
+        "eventstore.tasks.reconcile_study_arm_counters",
+        "registrations.tasks.prune_whatsapp_contacts",
+    ),
+}
+CELERY_TASK_QUEUES = tuple(
+    Queue(name, Exchange(name), routing_key=name)
+    for name in (CELERY_TASK_DEFAULT_QUEUE, *CELERY_WORKLOAD_QUEUES)
+)
 
 CELERY_TASK_ALWAYS_EAGER = False
 
@@ -238,8 +307,9 @@ CELERY_IMPORTS = ("eventstore.tasks",)
 
 CELERY_TASK_CREATE_MISSING_QUEUES = True
 CELERY_TASK_ROUTES = {
-    "celery.backend_cleanup": {"queue": "mediumpriority"},
-    "ndoh_hub.changes.tasks.validate_implement": {"queue": "mediumpriority"},
+    task: {"queue": queue}
+    for queue, tasks in CELERY_WORKLOAD_QUEUES.items()
+    for task in tasks
 }
 
 CELERY_TASK_SERIALIZER = "json"
@@ -252,15 +322,24 @@ HANDLE_EXPIRED_HELPDESK_CONTACTS_ENABLED = env.bool(
 HANDLE_EXPIRED_HELPDESK_CONTACTS_HOUR = env.str(
     "HANDLE_EXPIRED_HELPDESK_CONTACTS_HOUR", "3"
 )
+PROCESS_DUE_HELPDESK_TIMEOUTS_INTERVAL = env.float(
+    "PROCESS_DUE_HELPDESK_TIMEOUTS_INTERVAL", 900.0
+)
 
 RANDOM_CONTACTS_HOUR = env.str("RANDOM_CONTACTS_HOUR", "2")
 RANDOM_CONTACTS_DAY_OF_WEEK = env.str("RANDOM_CONTACTS_DAY_OF_WEEK", "4")
 
 CELERY_BEAT_SCHEDULE = {
+    # Reconciles the helpdesk timeout index with the RapidPro group, for contacts
+    # whose wait wasn't recorded by the flows
     "handle-expired-helpdesk-contacts": {
         "task": "eventstore.tasks.handle_expired_helpdesk_contacts",
         "schedule": crontab(minute="0", hour=HANDLE_EXPIRED_HELPDESK_CONTACTS_HOUR),
     },
+    "process-due-helpdesk-timeouts": {
+        "task": "eventstore.tasks.process_due_helpdesk_timeouts",
+        "schedule": PROCESS_DUE_HELPDESK_TIMEOUTS_INTERVAL,
+    },
     "post-random-mc-contacts-to-slack-channel": {
         "task": "eventstore.tasks.post_random_mc_contacts_to_slack_channel",
         "schedule": crontab(
@@ -273,6 +352,14 @@ CELERY_BEAT_SCHEDULE = {
         "task": "eventstore.tasks.process_whatsapp_template_send_status",
         "schedule": 300.0,
     },
+    "reconcile-study-arm-counters": {
+        "task": "eventstore.tasks.reconcile_study_arm_counters",
+        "schedule": crontab(minute="30", hour="2"),
+    },
+    "prune-whatsapp-contacts": {
+        "task": "registrations.tasks.prune_whatsapp_contacts",
+        "schedule": crontab(minute="0", hour="3"),
+    },
 }
 
 BULK_INSERT_EVENTS_ENABLED = env.bool("BULK_INSERT_EVENTS_ENABLED", False)
@@ -285,6 +372,11 @@ METRICS_REALTIME = []  # type: ignore
 METRICS_SCHEDULED = []  # type: ignore
 METRICS_SCHEDULED_TASKS = []  # type: ignore
 
+# Whether the WhatsApp contact check endpoint checks the contacts with the WhatsApp
+# API, instead of assuming that all valid phone numbers are on WhatsApp
+WHATSAPP_CONTACT_CHECK_ENABLED = env.bool("WHATSAPP_CONTACT_CHECK_ENABLED", False)
+WHATSAPP_CONTACT_CHECK_TTL_DAYS = env.int("WHATSAPP_CONTACT_CHECK_TTL_DAYS", 7)
+
 PREBIRTH_MIN_WEEKS = int(os.environ.get("PREBIRTH_MIN_WEEKS", "4"))
 WHATSAPP_EXPIRY_SMS_BOUNCE_DAYS = int(
     os.environ.get("WHATSAPP_EXPIRY_SMS_BOUNCE_DAYS", "30")
@@ -329,7 +421,7 @@ ENABLE_JEMBI_EVENTS = env.bool("ENABLE_JEMBI_EVENTS", True)
 
 CACHES = {
     "default": env.cache(default="locmemcache://"),
-    "locmem": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "authtoken": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
     "redis": env.cache(
         "REDIS_URL", default=REDIS_URL, backend="django_redis.cache.RedisCache"
     ),
@@ -391,7 +483,8 @@ RAPIDPRO_TOKEN = env.str("RAPIDPRO_TOKEN", None)
 SLACK_URL = env.str("SLACK_URL", None)
 SLACK_TOKEN = env.str("SLACK_TOKEN", None)
 SLACK_CHANNEL = env.str("SLACK_CHANNEL", None)
-RANDOM_CONTACT_LIMIT = env.str("RANDOM_CONTACT_LIMIT", 10)
+RANDOM_CONTACT_LIMIT = env.int("RANDOM_CONTACT_LIMIT", 10)
+RANDOM_CONTACT_SAMPLE_MIN_ROWS = env.int("RANDOM_CONTACT_SAMPLE_MIN_ROWS", 10000)
 
 # AAQ-Beta
 AAQ_CORE_API_URL = env.str("AAQ_CORE_API_URL", None)
@@ -408,3 +501,28 @@ ALERT_OPTOUT_PHRASE = env.str("ALERT_OPTOUT_PHRASE", "Opt out of alerts")
 WHATSAPP_TEMPLATE_SEND_TIMEOUT_HOURS = env.int(
     "WHATSAPP_TEMPLATE_SEND_TIMEOUT_HOURS", 3
 )
+
+RAPIDPRO_DISPATCH_CONCURRENCY = env.int("RAPIDPRO_DISPATCH_CONCURRENCY", 5)
+RAPIDPRO_DISPATCH_RATE = env.float("RAPIDPRO_DISPATCH_RATE", 10)
+BULK_FORGET_CONTACTS_CHUNK_SIZE = env.int("BULK_FORGET_CONTACTS_CHUNK_SIZE", 500)
+MOMCONNECT_IMPORT_CHUNK_SIZE = env.int("MOMCONNECT_IMPORT_CHUNK_SIZE", 1000)
+MOMCONNECT_IMPORT_UPLOAD_CHECKPOINT = env.int(
+    "MOMCONNECT_IMPORT_UPLOAD_CHECKPOINT", 100
+)
+MOMCONNECT_IMPORT_METRICS_INTERVAL = env.float(
+    "MOMCONNECT_IMPORT_METRICS_INTERVAL", 30.0
+)
+
+FACILITY_CODE_CACHE_ENABLED = env.bool("FACILITY_CODE_CACHE_ENABLED", True)
+FACILITY_CODE_CACHE_INTERVAL = env.float("FACILITY_CODE_CACHE_INTERVAL", 5.0)
+
+# How long authenticated tokens are cached for, in seconds. Revoked tokens are removed
+# from both caches, the TTLs only bound how long a missed revocation can last for.
+AUTH_TOKEN_LOCAL_CACHE_TTL = env.int("AUTH_TOKEN_LOCAL_CACHE_TTL", 60)
+AUTH_TOKEN_REDIS_CACHE_TTL = env.int("AUTH_TOKEN_REDIS_CACHE_TTL", 600)
+
+# Replay the historical healthchecks for users without a profile. Only needed until
+# the backfill_healthcheck_user_profiles command has been run, then it can be disabled
+HEALTHCHECK_PROFILE_PREFILL_ENABLED = env.bool(
+    "HEALTHCHECK_PROFILE_PREFILL_ENABLED", True
+)
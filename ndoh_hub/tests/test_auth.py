@@ -0,0 +1,159 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.test import TestCase
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from ndoh_hub import auth
+from ndoh_hub.auth import CachedTokenAuthentication, TokenRevocationListener
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(auth.revocation_listener, "start")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user("test")
+        self.token = Token.objects.create(user=self.user)
+        self.cache_key = auth.get_cache_key(self.token.key)
+        self.addCleanup(auth.redis_cache.delete, self.cache_key)
+        self.addCleanup(auth.local_cache.delete, self.cache_key)
+
+    def get_requests(self, tier, result):
+        return (
+            REGISTRY.get_sample_value(
+                "auth_token_cache_requests_total", {"tier": tier, "result": result}
+            )
+            or 0
+        )
+
+    def test_cache_tiers(self):
+        """
+        Should look up the token in the local cache, then in redis, then in the
+        database, filling the caches that missed
+        """
+        local_misses = self.get_requests("local", "miss")
+        redis_misses = self.get_requests("redis", "miss")
+        redis_hits = self.get_requests("redis", "hit")
+        local_hits = self.get_requests("local", "hit")
+
+        with self.assertNumQueries(1):
+            user, token = CachedTokenAuthentication().authenticate_credentials(
+                self.token.key
+            )
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+        self.assertEqual(self.get_requests("local", "miss"), local_misses + 1)
+        self.assertEqual(self.get_requests("redis", "miss"), redis_misses + 1)
+        self.assertEqual(auth.redis_cache.get(self.cache_key), (user, token))
+
+        with self.assertNumQueries(0):
+            CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual(self.get_requests("local", "hit"), local_hits + 1)
+
+        auth.local_cache.delete(self.cache_key)
+        with self.assertNumQueries(0):
+            user, _ = CachedTokenAuthentication().authenticate_credentials(
+                self.token.key
+            )
+        self.assertEqual(user, self.user)
+        self.assertEqual(self.get_requests("redis", "hit"), redis_hits + 1)
+        self.assertEqual(auth.local_cache.get(self.cache_key), (user, self.token))
+
+    def test_invalid_token_not_cached(self):
+        """
+        Failed authentications shouldn't be cached
+        """
+        with self.assertRaises(AuthenticationFailed):
+            CachedTokenAuthentication().authenticate_credentials("invalid")
+        self.assertIsNone(auth.local_cache.get(auth.get_cache_key("invalid")))
+        self.assertIsNone(auth.redis_cache.get(auth.get_cache_key("invalid")))
+
+    def test_redis_unavailable(self):
+        """
+        If redis is unavailable, should fall back to the database
+        """
+        with mock.patch.object(
+            auth.redis_cache, "get", side_effect=ConnectionError()
+        ), mock.patch.object(auth.redis_cache, "set", side_effect=ConnectionError()):
+            user, _ = CachedTokenAuthentication().authenticate_credentials(
+                self.token.key
+            )
+        self.assertEqual(user, self.user)
+        self.assertIsNotNone(auth.local_cache.get(self.cache_key))
+
+    def test_token_deleted(self):
+        """
+        Deleting a token should remove it from the caches, and publish the
+        revocation
+        """
+        key = self.token.key
+        CachedTokenAuthentication().authenticate_credentials(key)
+        with mock.patch(
+            "ndoh_hub.auth.get_redis_connection"
+        ) as get_connection, self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            get_connection.return_value.publish.assert_not_called()
+        get_connection.return_value.publish.assert_called_once_with(
+            auth.REVOCATION_CHANNEL, key
+        )
+        self.assertIsNone(auth.local_cache.get(self.cache_key))
+        self.assertIsNone(auth.redis_cache.get(self.cache_key))
+        with self.assertRaises(AuthenticationFailed):
+            CachedTokenAuthentication().authenticate_credentials(key)
+
+    def test_user_changed(self):
+        """
+        Changing a user should revoke their cached tokens, so that the change is
+        seen on the next request
+        """
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+            self.assertIsNotNone(auth.redis_cache.get(self.cache_key))
+        self.assertIsNone(auth.local_cache.get(self.cache_key))
+        self.assertIsNone(auth.redis_cache.get(self.cache_key))
+        with self.assertRaises(AuthenticationFailed):
+            CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+    def test_user_login(self):
+        """
+        Updating the user's last login shouldn't revoke their cached tokens
+        """
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            update_last_login(None, self.user)
+        self.assertEqual(callbacks, [])
+        self.assertIsNotNone(auth.redis_cache.get(self.cache_key))
+
+
+class TokenRevocationListenerTests(TestCase):
+    def test_revoked_token_removed_from_local_cache(self):
+        """
+        Revocations published by other processes should be removed from the local
+        cache, and the local cache cleared when subscribing
+        """
+        auth.local_cache.set("authtoken:stale", 1)
+        auth.local_cache.set("authtoken:revoked", 1)
+        self.addCleanup(auth.local_cache.clear)
+        pubsub = mock.Mock()
+
+        def listen():
+            auth.local_cache.set("authtoken:fresh", 1)
+            auth.local_cache.set("authtoken:revoked", 1)
+            yield {"data": b"revoked"}
+
+        pubsub.listen.side_effect = listen
+        with mock.patch("ndoh_hub.auth.get_redis_connection") as get_connection:
+            get_connection.return_value.pubsub.return_value = pubsub
+            TokenRevocationListener().listen()
+
+        pubsub.subscribe.assert_called_once_with(auth.REVOCATION_CHANNEL)
+        self.assertIsNone(auth.local_cache.get("authtoken:stale"))
+        self.assertIsNone(auth.local_cache.get("authtoken:revoked"))
+        self.assertEqual(auth.local_cache.get("authtoken:fresh"), 1)
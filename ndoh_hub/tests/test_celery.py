@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+import aaq.tasks  # noqa: F401
+import eventstore.batch_tasks  # noqa: F401
+import eventstore.hcs_tasks  # noqa: F401
+import eventstore.tasks  # noqa: F401
+import registrations.tasks  # noqa: F401
+from ndoh_hub.celery import app
+
+
+class TaskRoutingTests(SimpleTestCase):
+    def get_tasks(self):
+        return {
+            name
+            for name in app.tasks
+            if name.split(".")[0] in settings.INSTALLED_APPS
+            or name == "celery.backend_cleanup"
+        }
+
+    def test_all_tasks_routed(self):
+        """
+        Every task should be routed to one of the workload queues
+        """
+        queues = {queue.name for queue in app.conf.task_queues}
+        for name in self.get_tasks():
+            with self.subTest(task=name):
+                queue = app.amqp.router.route({}, name)["queue"]
+                self.assertIn(queue.name, settings.CELERY_WORKLOAD_QUEUES)
+                self.assertIn(queue.name, queues)
+
+    def test_routes_exist(self):
+        """
+        Every route should be for a task that exists, so that renamed tasks aren't
+        silently sent to the default queue
+        """
+        self.assertLessEqual(set(app.conf.task_routes), self.get_tasks())
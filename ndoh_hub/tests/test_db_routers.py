@@ -0,0 +1,148 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import DatabaseError, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from eventstore.models import Covid19TriageStart
+from ndoh_hub.db_routers import ReplicaLagCheck, ReplicaRouter, lag_check, use_replica
+
+
+@override_settings(
+    REPLICA_DATABASE="replica", REPLICA_MAX_LAG=30, REPLICA_LAG_CHECK_INTERVAL=60
+)
+class ReplicaRouterTests(TestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        patcher = mock.patch.object(lag_check, "get_lag", return_value=0)
+        self.get_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        lag_check.checked = None
+
+    def test_outside_block(self):
+        """
+        Reads outside of use_replica should go to the primary
+        """
+        self.assertIsNone(self.router.db_for_read(Covid19TriageStart))
+        self.get_lag.assert_not_called()
+
+    def test_no_replica(self):
+        """
+        If there is no replica configured, should read from the primary
+        """
+        with override_settings(REPLICA_DATABASE=None), use_replica():
+            self.assertIsNone(self.router.db_for_read(Covid19TriageStart))
+
+    def test_fresh_replica(self):
+        """
+        Reads inside use_replica should go to the replica if it's up to date
+        """
+        with use_replica():
+            self.assertEqual(self.router.db_for_read(Covid19TriageStart), "replica")
+            self.assertEqual(Covid19TriageStart.objects.all().db, "replica")
+        self.assertEqual(Covid19TriageStart.objects.all().db, "default")
+
+    def test_stale_replica(self):
+        """
+        If the replica is lagging too far behind, should read from the primary
+        """
+        self.get_lag.return_value = 31
+        with use_replica(), self.assertLogs("ndoh_hub.db_routers", "WARNING"):
+            self.assertIsNone(self.router.db_for_read(Covid19TriageStart))
+
+    def test_replica_error(self):
+        """
+        If we can't check the replica, should read from the primary
+        """
+        self.get_lag.side_effect = DatabaseError()
+        with use_replica(), self.assertLogs("ndoh_hub.db_routers", "ERROR"):
+            self.assertIsNone(self.router.db_for_read(Covid19TriageStart))
+
+    def test_allow_migrate(self):
+        """
+        Should never migrate the replica
+        """
+        self.assertFalse(self.router.allow_migrate("replica", "eventstore"))
+        self.assertIsNone(self.router.allow_migrate("default", "eventstore"))
+
+
+@override_settings(REPLICA_MAX_LAG=30, REPLICA_LAG_CHECK_INTERVAL=60)
+class ReplicaLagCheckTests(TestCase):
+    databases = {"default", "replica"}
+
+    def test_not_a_replica(self):
+        """
+        If the database isn't a replica, it has no lag
+        """
+        self.assertIsNone(ReplicaLagCheck().get_lag("replica"))
+
+    def test_unknown_lag(self):
+        """
+        If the replica isn't streaming and has never replayed a transaction, it
+        should be treated as infinitely behind
+        """
+        check = ReplicaLagCheck()
+        with mock.patch.object(check, "get_lag", return_value=float("inf")):
+            self.assertFalse(check.is_fresh("replica"))
+
+    def test_cached(self):
+        """
+        Should only check the lag once per interval
+        """
+        check = ReplicaLagCheck()
+        with mock.patch.object(check, "get_lag", return_value=0) as get_lag:
+            self.assertTrue(check.is_fresh("replica"))
+            self.assertTrue(check.is_fresh("replica"))
+            get_lag.assert_called_once_with("replica")
+
+
+@override_settings(REPLICA_DATABASE="replica")
+class ReplicaListTests(APITestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        lag_check.checked = None
+
+    def test_list_from_replica(self):
+        """
+        The list endpoints should read from the replica
+        """
+        user = get_user_model().objects.create_user("test")
+        user.user_permissions.add(
+            Permission.objects.get(codename="view_covid19triagestart")
+        )
+        self.client.force_authenticate(user)
+
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            with CaptureQueriesContext(connections["default"]) as default_queries:
+                response = self.client.get(reverse("covid19triagestart-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            any("eventstore_covid19triagestart" in q["sql"] for q in replica_queries)
+        )
+        self.assertFalse(
+            any("eventstore_covid19triagestart" in q["sql"] for q in default_queries)
+        )
+
+    def test_admin_changelist_from_replica(self):
+        """
+        The admin changelists should read from the replica
+        """
+        user = get_user_model().objects.create_superuser("admin")
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            response = self.client.get(
+                reverse("admin:eventstore_covid19triage_changelist")
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            any("eventstore_covid19triage" in q["sql"] for q in replica_queries)
+        )
@@ -0,0 +1,116 @@
+import threading
+import time
+from itertools import takewhile
+from unittest import TestCase
+
+from ndoh_hub.dispatch import RedisTokenBucket, TokenBucket, dispatch
+from ndoh_hub.utils import redis
+
+
+class DispatchTests(TestCase):
+    def test_results_in_order(self):
+        """
+        Results and exceptions should be returned in the same order as the input
+        """
+
+        def func(item):
+            if item == 3:
+                raise ValueError("bad item")
+            time.sleep(0.01 * (5 - item))
+            return item * 2
+
+        results = list(dispatch(func, range(5), concurrency=5))
+        self.assertEqual([r[0] for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual([r[1] for r in results], [0, 2, 4, None, 8])
+        self.assertIsInstance(results[3][2], ValueError)
+        self.assertEqual([r[2] for r in results if r[0] != 3], [None] * 4)
+
+    def test_close_cancels_pending(self):
+        """
+        Breaking out of the results should cancel the calls that haven't started,
+        and wait for the ones that have
+        """
+        calls = []
+        lock = threading.Lock()
+
+        def func(item):
+            with lock:
+                calls.append(item)
+            time.sleep(0.01)
+            if item == 3:
+                raise ValueError("bad item")
+
+        for item, _, error in dispatch(func, range(100), concurrency=4):
+            if error is not None:
+                break
+        self.assertEqual(item, 3)
+        self.assertLessEqual(len(calls), 12)
+
+    def test_stop_supplying_items(self):
+        """
+        If the caller stops supplying items, every call that was made should still
+        have its result yielded
+        """
+        calls = []
+        lock = threading.Lock()
+        failed = False
+
+        def func(item):
+            with lock:
+                calls.append(item)
+            time.sleep(0.01)
+            if item == 3:
+                raise ValueError("bad item")
+
+        results = []
+        for item, _, error in dispatch(
+            func, takewhile(lambda _: not failed, range(100)), concurrency=4
+        ):
+            failed = failed or error is not None
+            results.append(item)
+        self.assertEqual(sorted(calls), results)
+        self.assertLessEqual(len(calls), 12)
+
+
+class TokenBucketTests(TestCase):
+    def test_rate_limited(self):
+        """
+        Once the burst capacity is used up, tokens should only be available at the
+        configured rate
+        """
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+
+
+class RedisTokenBucketTests(TestCase):
+    def setUp(self):
+        redis.delete("test_rate_limit")
+
+    def tearDown(self):
+        redis.delete("test_rate_limit")
+
+    def test_rate_limited(self):
+        """
+        The rate limit should be shared between all the buckets using the same key
+        """
+        buckets = [RedisTokenBucket(redis, "test_rate_limit", rate=100, capacity=1)]
+        buckets.append(RedisTokenBucket(redis, "test_rate_limit", rate=100, capacity=1))
+        start = time.monotonic()
+        for _ in range(3):
+            for bucket in buckets:
+                bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+        self.assertGreater(redis.ttl("test_rate_limit"), 0)
+
+    def test_dispatch_limiter(self):
+        """
+        dispatch should use the given limiter
+        """
+        bucket = RedisTokenBucket(redis, "test_rate_limit", rate=100, capacity=1)
+        start = time.monotonic()
+        results = list(dispatch(lambda i: i, range(6), concurrency=3, limiter=bucket))
+        self.assertEqual([r[1] for r in results], list(range(6)))
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
@@ -0,0 +1,89 @@
+from random import Random
+from unittest import TestCase
+
+import phonenumbers
+
+from ndoh_hub.msisdn import (
+    ValidatedMSISDN,
+    msisdn_to_whatsapp_id,
+    normalise_msisdn,
+    validate_msisdn,
+)
+
+
+def slow_validate(msisdn, country="ZA"):
+    """
+    Validates the MSISDN with the phonenumbers library only, without the fast path
+    or caching
+    """
+    try:
+        number = phonenumbers.parse(msisdn, country)
+    except phonenumbers.NumberParseException as e:
+        return ValidatedMSISDN(None, "cannot_parse", str(e))
+    e164 = phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+    if not phonenumbers.is_possible_number(number):
+        return ValidatedMSISDN(e164, "not_possible", "Not a possible phone number")
+    if not phonenumbers.is_valid_number(number):
+        return ValidatedMSISDN(e164, "not_valid", "Not a valid phone number")
+    return ValidatedMSISDN(e164, number=number)
+
+
+class MSISDNTests(TestCase):
+    def test_normalise_msisdn(self):
+        """
+        Should return the E164 format of the number
+        """
+        self.assertEqual(normalise_msisdn("+27820001001"), "+27820001001")
+        self.assertEqual(normalise_msisdn("082 000 1001"), "+27820001001")
+        self.assertEqual(normalise_msisdn("27820001001"), "+27820001001")
+        self.assertEqual(normalise_msisdn("+270820001001"), "+27820001001")
+        self.assertEqual(normalise_msisdn("+1 202 555 0100", None), "+12025550100")
+        self.assertEqual(msisdn_to_whatsapp_id("0820001001"), "27820001001")
+        with self.assertRaises(phonenumbers.NumberParseException):
+            normalise_msisdn("invalid")
+
+    def test_validate_msisdn(self):
+        """
+        Should return the E164 format of valid numbers, and the reason for invalid
+        numbers
+        """
+        self.assertEqual(validate_msisdn("0820001001").e164, "+27820001001")
+        self.assertIsNone(validate_msisdn("0820001001").error)
+        self.assertEqual(validate_msisdn("invalid").error, "cannot_parse")
+        self.assertEqual(validate_msisdn("+2782").error, "not_possible")
+        self.assertEqual(validate_msisdn("+27200000000").error, "not_valid")
+        self.assertEqual(
+            validate_msisdn("+27200000000").message, "Not a valid phone number"
+        )
+
+    def test_fast_path_matches_phonenumbers(self):
+        """
+        The E164 fast path should give the same results as parsing the numbers
+        """
+        random = Random(42)
+        numbers = [random.randint(100000000, 999999999) for _ in range(3000)]
+        for number in numbers:
+            for msisdn in (f"+27{number}", f"27{number}", f"0{number}"):
+                self.assertEqual(normalise_msisdn(msisdn), slow_validate(msisdn).e164)
+                result, expected = validate_msisdn(msisdn), slow_validate(msisdn)
+                self.assertEqual(
+                    (result.e164, result.error, result.number),
+                    (expected.e164, expected.error, expected.number),
+                )
+
+    def test_fast_path_other_countries(self):
+        """
+        Numbers that aren't in E164 format should only use the fast path for South
+        African defaults
+        """
+        self.assertEqual(normalise_msisdn("0820001001", "GB"), "+44820001001")
+        self.assertEqual(validate_msisdn("0820001001", None).error, "cannot_parse")
+        self.assertEqual(validate_msisdn("+27820001001", None).e164, "+27820001001")
+
+    def test_to_phonenumber_copies(self):
+        """
+        Changes to the returned number shouldn't change the cached result
+        """
+        number = validate_msisdn("+27820001001").to_phonenumber()
+        number.raw_input = "changed"
+        self.assertIsNone(validate_msisdn("+27820001001").to_phonenumber().raw_input)
@@ -0,0 +1,76 @@
+import time
+from unittest import mock
+
+from django.test import TestCase
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError
+from rest_framework.test import APIRequestFactory
+
+from ndoh_hub.throttling import RedisScopedRateThrottle
+from ndoh_hub.utils import redis
+
+
+class View:
+    throttle_scope = "test.scope"
+
+
+class RedisScopedRateThrottleTests(TestCase):
+    def setUp(self):
+        redis.delete("throttle:test.scope:127.0.0.1")
+        self.addCleanup(redis.delete, "throttle:test.scope:127.0.0.1")
+        self.request = APIRequestFactory().get("/")
+        self.request.user = None
+
+    def get_throttle(self, rate):
+        throttle = RedisScopedRateThrottle()
+        throttle.THROTTLE_RATES = {"test.scope": rate}
+        return throttle
+
+    def get_throttled(self):
+        return REGISTRY.get_sample_value(
+            "throttled_requests_total", {"scope": "test.scope"}
+        )
+
+    def test_no_scope(self):
+        """
+        Views without a throttle scope shouldn't be throttled
+        """
+        throttle = self.get_throttle("1/minute")
+        self.assertTrue(throttle.allow_request(self.request, object()))
+        self.assertTrue(throttle.allow_request(self.request, object()))
+
+    def test_rate_limited(self):
+        """
+        Should allow a burst of up to the rate, and then throttle requests until the
+        next one is due, across all the throttle instances
+        """
+        throttled = self.get_throttled() or 0
+        for _ in range(3):
+            throttle = self.get_throttle("3/minute")
+            self.assertTrue(throttle.allow_request(self.request, View()))
+        self.assertFalse(throttle.allow_request(self.request, View()))
+        self.assertAlmostEqual(throttle.wait(), 20, delta=1)
+        self.assertEqual(self.get_throttled(), throttled + 1)
+        self.assertGreater(redis.pttl("throttle:test.scope:127.0.0.1"), 0)
+
+    def test_requests_allowed_at_rate(self):
+        """
+        Once the burst is used up, requests should be allowed at the configured rate
+        """
+        throttle = self.get_throttle("20/second")
+        for _ in range(20):
+            self.assertTrue(throttle.allow_request(self.request, View()))
+        self.assertFalse(throttle.allow_request(self.request, View()))
+        time.sleep(throttle.wait())
+        self.assertTrue(throttle.allow_request(self.request, View()))
+
+    def test_redis_unavailable(self):
+        """
+        If redis is unavailable, requests should be allowed
+        """
+        throttle = self.get_throttle("1/minute")
+        with mock.patch.object(
+            RedisScopedRateThrottle, "script", side_effect=ConnectionError()
+        ):
+            self.assertTrue(throttle.allow_request(self.request, View()))
+            self.assertTrue(throttle.allow_request(self.request, View()))
@@ -1,3 +1,5 @@
+import tempfile
+
 from ndoh_hub.settings import *  # noqa: F403 # flake8: noqa
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -23,6 +25,18 @@ HCS_STUDY_C_ACTIVE = True
 
 HANDLE_EXPIRED_HELPDESK_CONTACTS_ENABLED = True
 
+# Test transactions are rolled back without any signals, which would leave stale
+# codes in the cache
+FACILITY_CODE_CACHE_ENABLED = False
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
 AAQ_CORE_API_URL = "http://aaqcore"
 AAQ_UD_API_URL = "http://aaqud"
 AAQ_V2_API_URL = "http://aaq_v2"
+
+# Tests that use the replica enable it with REPLICA_DATABASE
+DATABASES["replica"] = {  # noqa: F405
+    **DATABASES["default"],  # noqa: F405
+    "TEST": {"MIRROR": "default"},
+}
@@ -0,0 +1,90 @@
+import logging
+
+from django_redis import get_redis_connection
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+from rest_framework.throttling import ScopedRateThrottle
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_REQUESTS = Counter(
+    "throttled_requests_total",
+    "Requests rejected by the rate limit for their throttle scope",
+    ["scope"],
+)
+THROTTLE_ERRORS = Counter(
+    "throttle_errors_total",
+    "Requests allowed without a rate limit check, because Redis was unavailable",
+    ["scope"],
+)
+
+
+class RedisScopedRateThrottle(ScopedRateThrottle):
+    """
+    A ScopedRateThrottle that does the rate limit check in a single atomic Redis
+    call, instead of reading and rewriting the request history in the cache.
+
+    Uses the generic cell rate algorithm (GCRA), which only stores the time that the
+    next request is theoretically due, and allows the same burst of `num_requests`
+    per `duration` as the sliding window of the ScopedRateThrottle.
+    """
+
+    # Times are in milliseconds, so that they can be represented exactly in Lua
+    SCRIPT = """
+    local interval = tonumber(ARGV[2]) * 1000 / tonumber(ARGV[1])
+    local period = tonumber(ARGV[2]) * 1000
+    local time = redis.call("TIME")
+    local now = tonumber(time[1]) * 1000 + tonumber(time[2]) / 1000
+    local tat = math.max(tonumber(redis.call("GET", KEYS[1])) or now, now)
+    local allow_at = tat + interval - period
+    if now < allow_at then
+        return tostring((allow_at - now) / 1000)
+    end
+    tat = tat + interval
+    redis.call("SET", KEYS[1], string.format("%.3f", tat), "PX", math.ceil(tat - now))
+    return "0"
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s"
+    script = None
+
+    def get_script(self):
+        if RedisScopedRateThrottle.script is None:
+            redis = get_redis_connection("redis")
+            RedisScopedRateThrottle.script = redis.register_script(self.SCRIPT)
+        return RedisScopedRateThrottle.script
+
+    def allow_request(self, request, view):
+        self.delay = None
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        try:
+            self.delay = float(
+                self.get_script()(
+                    keys=[self.key], args=[self.num_requests, self.duration]
+                )
+            )
+        except RedisError:
+            # Rather let requests through than fail them while Redis is down
+            logger.exception("Cannot check the rate limit for %s", self.scope)
+            THROTTLE_ERRORS.labels(self.scope).inc()
+            return True
+
+        if self.delay > 0:
+            THROTTLED_REQUESTS.labels(self.scope).inc()
+            return False
+        return True
+
+    def wait(self):
+        """
+        Returns the number of seconds until the next request will be allowed
+        """
+        return self.delay
@@ -22,9 +22,11 @@ from eventstore.views import (
     DeliveryFailureViewSet,
     EddSwitchViewSet,
     FeedbackViewSet,
+    ForgetContactJobViewSet,
     ForgetContactView,
     HCSStudyBRandomizationViewSet,
     HealthCheckUserProfileViewSet,
+    HelpdeskTimeoutViewSet,
     IdentificationSwitchViewSet,
     LanguageSwitchViewSet,
     MessagesViewSet,
@@ -70,6 +72,8 @@ v2router.register("dbeonbehalfofprofile", DBEOnBehalfOfProfileViewSet)
 v2router.register("deliveryfailure", DeliveryFailureViewSet)
 v2router.register("events", WhatsAppEventsViewSet)
 v2router.register("whatsapptemplatesendstatus", WhatsAppTemplateSendStatusViewSet)
+v2router.register("forgetcontactjobs", ForgetContactJobViewSet)
+v2router.register("helpdesktimeouts", HelpdeskTimeoutViewSet)
 
 v3router = routers.DefaultRouter()
 v3router.register("covid19triage", Covid19TriageV2ViewSet, basename="covid19triagev2")
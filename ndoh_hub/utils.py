@@ -5,11 +5,9 @@ import datetime
 import hmac
 import json
 import logging
-import random
 from hashlib import sha256
 from urllib.parse import urljoin
 
-import phonenumbers
 import pkg_resources
 import requests
 import six
@@ -21,6 +19,7 @@ from temba_client.v2 import TembaClient
 from eventstore import models
 from ndoh_hub.auth import CachedTokenAuthentication
 from ndoh_hub.constants import ID_TYPES, LANGUAGES, PASSPORT_ORIGINS  # noqa:F401
+from ndoh_hub.msisdn import msisdn_to_whatsapp_id, normalise_msisdn  # noqa:F401
 
 rapidpro = None
 if settings.EXTERNAL_REGISTRATIONS_V2:
@@ -156,22 +155,6 @@ def json_decode(data):
     return json.loads(data)
 
 
-def msisdn_to_whatsapp_id(msisdn: str) -> str:
-    """
-    Takes MSISDN input, normalises it and formats it as a whatsapp ID
-    """
-    return normalise_msisdn(msisdn).replace("+", "")
-
-
-def normalise_msisdn(msisdn: str) -> str:
-    """
-    Takes the MSISDN input, and normalises it to E164 format
-    """
-    return phonenumbers.format_number(
-        phonenumbers.parse(msisdn, "ZA"), phonenumbers.PhoneNumberFormat.E164
-    )
-
-
 class TokenAuthQueryString(CachedTokenAuthentication):
     """
     Look for the token in the querystring parameter "token"
@@ -184,19 +167,6 @@ class TokenAuthQueryString(CachedTokenAuthentication):
         return None
 
 
-def get_random_date(start_date=None):
-    if not start_date:
-        start_date = datetime.date(2020, 1, 1)
-    end_date = datetime.date.today()
-
-    time_between_dates = end_date - start_date
-    days_between_dates = time_between_dates.days
-
-    random_number_of_days = random.randrange(days_between_dates)
-
-    return start_date + datetime.timedelta(days=random_number_of_days)
-
-
 def send_slack_message(channel, text):
     # Send message to slack
     if settings.SLACK_URL and settings.SLACK_TOKEN:
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ndoh_hub.settings")
 
 application = get_wsgi_application()
+
+from registrations.facility_codes import load_facility_codes  # noqa: E402
+
+load_facility_codes()
@@ -4,3 +4,6 @@ from django.db.models.signals import post_save, pre_save  # noqa
 
 class RegistrationsAppConfig(AppConfig):
     name = "registrations"
+
+    def ready(self):
+        import registrations.signals  # noqa
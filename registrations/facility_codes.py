@@ -0,0 +1,311 @@
+import heapq
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models.functions import Cos, Power, Radians, Sin
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from registrations.models import ClinicCode
+from registrations.spatial import KDTree, chord_to_km, to_unit_vector
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "facility_codes_version"
+
+# The fields that facilities can be looked up by, and are returned by the
+# FacilityCheck endpoint
+FACILITY_CHECK_FIELDS = ("code", "value", "uid", "name")
+FACILITY_CHECK_HEADERS = [
+    {
+        "hidden": False,
+        "meta": False,
+        "name": field,
+        "column": field,
+        "type": "java.lang.String",
+    }
+    for field in FACILITY_CHECK_FIELDS
+]
+
+
+def to_json(data):
+    """
+    Encodes `data` the same way as the API's JSON renderer
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def facility_check_json(rows):
+    """
+    Builds the FacilityCheck response from the JSON encoded `rows`
+    """
+    return b"".join(
+        [
+            b'{"title":"FacilityCheck","headers":',
+            to_json(FACILITY_CHECK_HEADERS),
+            b',"rows":[',
+            b",".join(rows),
+            b'],"width":%d,"height":%d}' % (len(FACILITY_CHECK_FIELDS), len(rows)),
+        ]
+    )
+
+
+def get_trigrams(text):
+    """
+    Returns the set of trigrams in `text`, the same way as pg_trgm: lowercased,
+    split into alphanumeric words, with each word padded by two spaces in front
+    and one behind
+    """
+    trigrams = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        word = f"  {word} "
+        trigrams.update(map("".join, zip(word, word[1:], word[2:])))
+    return frozenset(trigrams)
+
+
+class FacilityIndex:
+    """
+    An immutable index of all the clinic codes, by each of the
+    FACILITY_CHECK_FIELDS, with the API responses prebuilt as JSON
+    """
+
+    def __init__(self, clinics):
+        rows = {field: {} for field in FACILITY_CHECK_FIELDS}
+        details = {}
+        self.clinics = []
+        trigrams = {}
+        for clinic in clinics:
+            name_trigrams = get_trigrams(clinic["name"])
+            for trigram in name_trigrams:
+                trigrams.setdefault(trigram, []).append(len(self.clinics))
+            self.clinics.append((clinic, len(name_trigrams)))
+            row = [clinic[field] for field in FACILITY_CHECK_FIELDS]
+            row_json = to_json(row)
+            for field, value in zip(FACILITY_CHECK_FIELDS, row):
+                rows[field].setdefault(value, []).append(row_json)
+            details.setdefault(clinic["value"], to_json(clinic))
+
+        self.codes = frozenset(details)
+        self.details = details
+        self.facility_checks = {
+            field: {value: facility_check_json(r) for value, r in values.items()}
+            for field, values in rows.items()
+        }
+        self.empty_facility_check = facility_check_json([])
+        self.trigrams = {trigram: tuple(c) for trigram, c in trigrams.items()}
+        self.locations = KDTree(
+            (to_unit_vector(clinic["latitude"], clinic["longitude"]), clinic)
+            for clinic, _ in self.clinics
+            if clinic["latitude"] is not None and clinic["longitude"] is not None
+        )
+
+    def get_details(self, value):
+        """
+        Returns the JSON details of the clinic with the code `value`, or None
+        """
+        return self.details.get(value)
+
+    def get_facility_check(self, field, value):
+        """
+        Returns the JSON FacilityCheck response for the clinics where `field` is
+        `value`
+        """
+        return self.facility_checks[field].get(value, self.empty_facility_check)
+
+    def nearest(self, latitude, longitude, limit=10):
+        """
+        Returns up to `limit` (clinic, distance in km) pairs for the clinics closest
+        to the coordinates, closest first
+        """
+        return [
+            (clinic, chord_to_km(chord))
+            for chord, clinic in self.locations.nearest(
+                to_unit_vector(latitude, longitude), limit
+            )
+        ]
+
+    def search(self, query, limit=10, province=None, district=None):
+        """
+        Returns up to `limit` (clinic, similarity) pairs for the clinics whose names
+        are most similar to `query`, best match first. The similarity is the
+        fraction of trigrams shared between the names, like pg_trgm's similarity.
+        """
+        query_trigrams = get_trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+
+        def results():
+            for i, count in shared.items():
+                clinic, clinic_trigrams = self.clinics[i]
+                if province is not None and clinic["province"] != province:
+                    continue
+                if district is not None and clinic["district"] != district:
+                    continue
+                similarity = count / (len(query_trigrams) + clinic_trigrams - count)
+                yield similarity, -i, clinic
+
+        return [
+            (clinic, similarity)
+            for similarity, _, clinic in heapq.nlargest(limit, results())
+        ]
+
+
+class FacilityCodeCache:
+    """
+    A process local index of all the clinic codes.
+
+    The version of the clinic codes is stored in Redis, and is bumped whenever a
+    ClinicCode changes. Each process checks the version at most once every
+    FACILITY_CODE_CACHE_INTERVAL seconds, and if it has changed, builds a new index
+    and swaps it in for the old one.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.checked = 0.0
+
+    def get_version(self):
+        return get_redis_connection("redis").get(VERSION_KEY)
+
+    def load(self):
+        return FacilityIndex(ClinicCode.objects.order_by("uid").values().iterator())
+
+    def get(self):
+        index = self.index
+        if (
+            index is not None
+            and time.monotonic() - self.checked < settings.FACILITY_CODE_CACHE_INTERVAL
+        ):
+            return index
+
+        with self.lock:
+            now = time.monotonic()
+            if (
+                self.index is not None
+                and now - self.checked < settings.FACILITY_CODE_CACHE_INTERVAL
+            ):
+                return self.index
+
+            try:
+                version = self.get_version()
+            except RedisError:
+                logger.exception("Cannot get facility codes version, reloading")
+                self.index = self.load()
+            else:
+                if self.index is None or version != self.version:
+                    self.index = self.load()
+                    self.version = version
+            self.checked = now
+            return self.index
+
+    def invalidate(self):
+        with self.lock:
+            self.index = None
+
+
+facility_codes = FacilityCodeCache()
+
+
+def bump_facility_codes_version():
+    """
+    Causes all processes to reload their facility codes
+    """
+    facility_codes.invalidate()
+    try:
+        get_redis_connection("redis").incr(VERSION_KEY)
+    except RedisError:
+        logger.exception("Cannot bump facility codes version")
+
+
+def is_valid_facility_code(value):
+    if not settings.FACILITY_CODE_CACHE_ENABLED:
+        return ClinicCode.objects.filter(value=value).exists()
+    return value in facility_codes.get().codes
+
+
+def search_facilities(query, limit=10, province=None, district=None):
+    """
+    Returns up to `limit` (clinic, similarity) pairs for the clinics whose names
+    are most similar to `query`, like FacilityIndex.search. If the cache is
+    disabled, the similarities are calculated for each of the matching clinics in
+    the database, instead of building the whole index for every search.
+    """
+    if settings.FACILITY_CODE_CACHE_ENABLED:
+        return facility_codes.get().search(query, limit, province, district)
+
+    clinics = ClinicCode.objects.order_by("uid")
+    if province is not None:
+        clinics = clinics.filter(province=province)
+    if district is not None:
+        clinics = clinics.filter(district=district)
+    query_trigrams = get_trigrams(query)
+
+    def results():
+        for i, clinic in enumerate(clinics.values().iterator()):
+            clinic_trigrams = get_trigrams(clinic["name"])
+            count = len(query_trigrams & clinic_trigrams)
+            if count:
+                similarity = count / (
+                    len(query_trigrams) + len(clinic_trigrams) - count
+                )
+                yield similarity, -i, clinic
+
+    return [
+        (clinic, similarity)
+        for similarity, _, clinic in heapq.nlargest(limit, results())
+    ]
+
+
+def nearest_facilities(latitude, longitude, limit=10):
+    """
+    Returns up to `limit` (clinic, distance in km) pairs for the clinics closest to
+    the coordinates, like FacilityIndex.nearest. If the cache is disabled, the
+    database orders the clinics by their distance, instead of building the whole
+    index for every lookup.
+    """
+    if settings.FACILITY_CODE_CACHE_ENABLED:
+        return facility_codes.get().nearest(latitude, longitude, limit)
+
+    x, y, z = to_unit_vector(latitude, longitude)
+    lat, lng = Radians("latitude"), Radians("longitude")
+    chord_squared = (
+        Power(Cos(lat) * Cos(lng) - x, 2)
+        + Power(Cos(lat) * Sin(lng) - y, 2)
+        + Power(Sin(lat) - z, 2)
+    )
+    clinics = (
+        ClinicCode.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .annotate(chord_squared=chord_squared)
+        .order_by("chord_squared", "uid")
+        .values()[:limit]
+    )
+    return [
+        (clinic, chord_to_km(math.sqrt(clinic.pop("chord_squared"))))
+        for clinic in clinics
+    ]
+
+
+def load_facility_codes():
+    """
+    Loads the facility codes on startup, so that the first requests don't have to.
+    The database connection is closed afterwards, since this can run before the
+    server forks its workers, which mustn't share it.
+    """
+    if not settings.FACILITY_CODE_CACHE_ENABLED:
+        return
+    try:
+        facility_codes.get()
+    except DatabaseError:
+        logger.exception("Cannot load facility codes on startup")
+    finally:
+        connections.close_all()
@@ -1,6 +1,8 @@
 import phonenumbers
 from rest_framework import serializers
 
+from ndoh_hub.msisdn import validate_msisdn
+
 
 class PhoneNumberField(serializers.Field):
     """
@@ -21,13 +23,9 @@ class PhoneNumberField(serializers.Field):
         return phonenumbers.format_number(obj, phonenumbers.PhoneNumberFormat.E164)
 
     def to_internal_value(self, data):
-        try:
-            p = phonenumbers.parse(data, self.country_code)
-        except phonenumbers.phonenumberutil.NumberParseException as e:
-            self.fail("cannot_parse", error=str(e))
-        if not phonenumbers.is_possible_number(p):
-            self.fail("not_possible")
-        if not phonenumbers.is_valid_number(p):
-            self.fail("not_valid")
+        msisdn = validate_msisdn(data, self.country_code)
+        if msisdn.error:
+            self.fail(msisdn.error, error=msisdn.message)
+        p = msisdn.to_phonenumber()
         p.raw_input = data
         return p
@@ -1,3 +1,6 @@
+from io import StringIO
+from unittest.mock import patch
+
 from django.core.management import call_command
 from django.test import TestCase
 
@@ -25,3 +28,79 @@ class UpdateClinicsTestCase(TestCase):
         self.assertIsNone(new_clinic)
 
         self.assertEqual(ClinicCode.objects.count(), 1)
+
+    def call_bulk(self, *args):
+        stdout = StringIO()
+        call_command(
+            "update_clinics",
+            "./registrations/management/commands/tests/test_clinic_list.csv",
+            "--bulk",
+            *args,
+            stdout=stdout,
+        )
+        return stdout.getvalue()
+
+    @patch(
+        "registrations.management.commands.update_clinics.bump_facility_codes_version"
+    )
+    def test_bulk_update_clinics(self, bump_facility_codes_version):
+        """
+        Should update the existing clinics, create the new ones, and report the
+        changes
+        """
+        existing_clinic = ClinicCode.objects.create(
+            uid="rICptExz4NW", code="110533", value="110533", unit_type="Clinic"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            output = self.call_bulk()
+
+        existing_clinic.refresh_from_db()
+        self.assertEqual(existing_clinic.area_type, "Urban")
+        self.assertEqual(existing_clinic.district, "Sarah Baartman DM")
+        self.assertEqual(existing_clinic.municipality, "Sundays River Valley LM")
+        self.assertIsNone(existing_clinic.location)
+
+        new_clinic = ClinicCode.objects.get(uid="QYdJjvibz4e")
+        self.assertEqual(new_clinic.code, "429442")
+        self.assertEqual(new_clinic.value, "429442")
+        self.assertEqual(new_clinic.name, "Test Clinic 2")
+        self.assertEqual(new_clinic.province, "ZA-EC")
+        self.assertEqual(new_clinic.district, "Amathole DM")
+        self.assertEqual(new_clinic.location, "-32.69994+026.29404/")
+        self.assertEqual(
+            (new_clinic.latitude, new_clinic.longitude), (-32.69994, 26.29404)
+        )
+        bump_facility_codes_version.assert_called_once_with()
+
+        self.assertEqual(
+            output,
+            "\n".join(
+                [
+                    "Created: 1",
+                    "Updated: 1",
+                    "  area_type: 1",
+                    "  district: 1",
+                    "  municipality: 1",
+                    "Unchanged: 0",
+                    "",
+                ]
+            ),
+        )
+
+        with self.assertNumQueries(1):
+            output = self.call_bulk()
+        self.assertIn("Created: 0\nUpdated: 0\nUnchanged: 2\n", output)
+
+    def test_bulk_dry_run(self):
+        """
+        A dry run should report the changes without making them
+        """
+        ClinicCode.objects.create(uid="rICptExz4NW", code="110533", value="110533")
+
+        output = self.call_bulk("--dry-run")
+
+        self.assertIn("Created: 1\nUpdated: 1\n", output)
+        self.assertIn("Dry run, no changes were saved", output)
+        self.assertEqual(ClinicCode.objects.count(), 1)
+        self.assertIsNone(ClinicCode.objects.get().district)
@@ -1,9 +1,14 @@
 import csv
+import json
+from collections import Counter
 
 import pycountry
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from registrations.facility_codes import bump_facility_codes_version
 from registrations.models import ClinicCode
+from registrations.spatial import parse_location
 
 
 def clean_name(name):
@@ -16,9 +21,29 @@ PROVINCES = {
 
 
 class Command(BaseCommand):
+    UPDATE_FIELDS = ("area_type", "unit_type", "district", "municipality")
 
     def add_arguments(self, parser):
         parser.add_argument("csv_file", nargs="+", type=str)
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help=(
+                "Compare the files against all the existing clinics, creating any new "
+                "clinics and updating the changed ones in bulk"
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="With --bulk, report the changes without saving them",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="With --bulk, the number of clinics to create or update per query",
+        )
 
     def format_location(self, latitude, longitude):
         """
@@ -44,12 +69,96 @@ class Command(BaseCommand):
         return PROVINCES[clean_name(row["OU2short"])]
 
     def get_location(self, row):
-        if row["longitude"] and row["latitude"]:
+        if row.get("longitude") and row.get("latitude"):
             lng = float(row["longitude"])
             lat = float(row["latitude"])
             return self.format_location(lat, lng)
+        # DHIS2 exports have the coordinates as a [longitude, latitude] point
+        try:
+            lng, lat = json.loads(row.get("coordinates") or "")
+            return self.format_location(float(lat), float(lng))
+        except (TypeError, ValueError):
+            return None
+
+    def get_update_values(self, row):
+        return {
+            "area_type": row["OrgUnitRuralUrban"],
+            "unit_type": row["OrgUnitType"],
+            "district": row["OU3short"],
+            "municipality": row["OU4short"],
+        }
+
+    def build_clinic(self, row):
+        location = self.get_location(row)
+        latitude, longitude = parse_location(location)
+        return ClinicCode(
+            uid=row["OU5uid"],
+            code=row["OU5code"],
+            value=row["OU5code"],
+            name=row["organisationunitname"],
+            province=PROVINCES.get(clean_name(row["OU2short"])),
+            location=location,
+            latitude=latitude,
+            longitude=longitude,
+            **self.get_update_values(row),
+        )
+
+    def bulk_update_clinics(self, csv_files, dry_run, batch_size):
+        """
+        Diffs the files against a map of all the existing clinics, and applies the
+        changes in batches
+        """
+        existing = ClinicCode.objects.in_bulk()
+        created, updated, changes = {}, {}, Counter()
+        unchanged = 0
+
+        for csv_file in csv_files:
+            with open(csv_file) as f:
+                for row in csv.DictReader(f):
+                    uid = row["OU5uid"]
+                    clinic = existing.get(uid)
+                    if clinic is None:
+                        if uid not in created:
+                            created[uid] = self.build_clinic(row)
+                        continue
+
+                    changed = False
+                    for field, value in self.get_update_values(row).items():
+                        if getattr(clinic, field) != value:
+                            setattr(clinic, field, value)
+                            changes[field] += 1
+                            changed = True
+                    if changed:
+                        updated[uid] = clinic
+                    else:
+                        unchanged += 1
+
+        if not dry_run and (created or updated):
+            with transaction.atomic():
+                ClinicCode.objects.bulk_create(created.values(), batch_size=batch_size)
+                ClinicCode.objects.bulk_update(
+                    updated.values(), self.UPDATE_FIELDS, batch_size=batch_size
+                )
+                # bulk_create and bulk_update don't send the signals that would
+                # usually bump the version
+                transaction.on_commit(bump_facility_codes_version)
+
+        self.stdout.write(f"Created: {len(created)}")
+        self.stdout.write(f"Updated: {len(updated)}")
+        for field, count in sorted(changes.items()):
+            self.stdout.write(f"  {field}: {count}")
+        self.stdout.write(f"Unchanged: {unchanged}")
+        if dry_run:
+            self.stdout.write("Dry run, no changes were saved")
 
     def handle(self, *args, **options):
+        if options["dry_run"] and not options["bulk"]:
+            raise CommandError("--dry-run is only supported with --bulk")
+        if options["bulk"]:
+            return self.bulk_update_clinics(
+                options["csv_file"], options["dry_run"], options["batch_size"]
+            )
+
         for csv_file in options["csv_file"]:
             reader = csv.DictReader(open(csv_file))
 
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+from registrations.spatial import parse_location
+
+
+def parse_locations(apps, schema_editor):
+    ClinicCode = apps.get_model("registrations", "ClinicCode")
+    clinics = []
+    for clinic in ClinicCode.objects.exclude(location=None).exclude(location=""):
+        clinic.latitude, clinic.longitude = parse_location(clinic.location)
+        clinics.append(clinic)
+    ClinicCode.objects.bulk_update(clinics, ["latitude", "longitude"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registrations", "0030_cliniccode_area_type_cliniccode_district_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cliniccode",
+            name="latitude",
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="cliniccode",
+            name="longitude",
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(parse_locations, migrations.RunPython.noop),
+    ]
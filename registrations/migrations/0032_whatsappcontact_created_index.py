@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registrations", "0031_cliniccode_latitude_longitude"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="whatsappcontact",
+            index=models.Index(
+                fields=["created"], name="registratio_created_e0a20e_idx"
+            ),
+        ),
+    ]
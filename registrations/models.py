@@ -4,6 +4,8 @@ from django.contrib.auth.models import User
 from django.db import models
 from simple_history.models import HistoricalRecords
 
+from registrations.spatial import parse_location
+
 
 class Source(models.Model):
     """The source from which a registation originates.
@@ -235,7 +237,7 @@ class WhatsAppContact(models.Model):
     class Meta:
         permissions = (("can_prune_whatsappcontact", "Can prune WhatsApp contact"),)
         verbose_name = "WhatsApp Contact"
-        indexes = [models.Index(fields=["msisdn"])]
+        indexes = [models.Index(fields=["msisdn"]), models.Index(fields=["created"])]
 
 
 class ClinicCode(models.Model):
@@ -249,10 +251,17 @@ class ClinicCode(models.Model):
     unit_type = models.CharField(max_length=50, blank=True, null=True, default=None)
     district = models.CharField(max_length=50, blank=True, null=True, default=None)
     municipality = models.CharField(max_length=50, blank=True, null=True, default=None)
+    # Parsed from location, for finding the nearest clinics
+    latitude = models.FloatField(blank=True, null=True, default=None)
+    longitude = models.FloatField(blank=True, null=True, default=None)
 
     class Meta:
         indexes = [models.Index(fields=["value"])]
 
+    def save(self, *args, **kwargs):
+        self.latitude, self.longitude = parse_location(self.location)
+        return super().save(*args, **kwargs)
+
 
 class JembiSubmission(models.Model):
     path = models.CharField(max_length=255)
@@ -0,0 +1,38 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from ndoh_hub.auth import revoke_token
+from registrations.facility_codes import bump_facility_codes_version
+from registrations.models import ClinicCode
+
+
+@receiver(post_save, sender=ClinicCode)
+@receiver(post_delete, sender=ClinicCode)
+def clinic_code_changed(sender, **kwargs):
+    # Other processes could reload the old codes if they're told before the commit
+    transaction.on_commit(bump_facility_codes_version)
+
+
+# The user fields that the cached tokens depend on
+TOKEN_USER_FIELDS = {"is_active", "is_staff", "is_superuser", "password"}
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # If revoked before the commit, a concurrent request could cache it again
+    transaction.on_commit(partial(revoke_token, instance.key))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # The cached tokens include the user, so they need to be refreshed. Updates to
+    # other fields, like last_login on every login, don't affect authentication.
+    if created or (update_fields and TOKEN_USER_FIELDS.isdisjoint(update_fields)):
+        return
+    for key in Token.objects.filter(user=instance).values_list("key", flat=True):
+        transaction.on_commit(partial(revoke_token, key))
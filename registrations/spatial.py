@@ -0,0 +1,99 @@
+import heapq
+import math
+
+from iso6709 import Location
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def parse_location(value):
+    """
+    Returns the (latitude, longitude) of an ISO6709 location string, or
+    (None, None) if it is empty or invalid
+    """
+    if not value:
+        return None, None
+    try:
+        location = Location(value)
+        return float(location.lat.decimal), float(location.lng.decimal)
+    except (AttributeError, ValueError, TypeError):
+        return None, None
+
+
+def to_unit_vector(latitude, longitude):
+    """
+    Returns the point on the unit sphere for the coordinates, so that straight line
+    distances between points are in the same order as distances along the surface
+    """
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    return (
+        math.cos(lat) * math.cos(lng),
+        math.cos(lat) * math.sin(lng),
+        math.sin(lat),
+    )
+
+
+def chord_to_km(chord):
+    """
+    Converts a straight line distance between unit vectors to kilometres along the
+    surface of the earth
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """
+    An immutable k-d tree of points, for finding the nearest neighbours of a point.
+
+    `points` is an iterable of (coordinates, item) pairs.
+    """
+
+    def __init__(self, points):
+        points = list(points)
+        self.size = len(points)
+        self.root = self.build(points, 0)
+
+    def build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % len(points[0][0])
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        left, (point, *right) = points[:mid], points[mid:]
+        return (
+            point,
+            axis,
+            self.build(left, depth + 1),
+            self.build(right, depth + 1),
+        )
+
+    def nearest(self, coordinates, n):
+        """
+        Returns the (distance, item) pairs of the `n` points closest to
+        `coordinates`, closest first
+        """
+        # Max heap of the closest points found so far, by negative squared distance
+        heap = []
+
+        def visit(node):
+            if node is None:
+                return
+            (point, item), axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(coordinates, point))
+            if len(heap) < n:
+                heapq.heappush(heap, (-distance, id(item), item))
+            elif distance < -heap[0][0]:
+                heapq.heapreplace(heap, (-distance, id(item), item))
+
+            diff = coordinates[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            # Only search the other side if it could contain closer points
+            if len(heap) < n or diff * diff < -heap[0][0]:
+                visit(far)
+
+        if n > 0:
+            visit(self.root)
+        return [
+            (math.sqrt(-distance), item) for distance, _, item in sorted(heap)[::-1]
+        ]
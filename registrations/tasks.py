@@ -0,0 +1,130 @@
+import logging
+from datetime import timedelta
+from itertools import islice
+from urllib.parse import urljoin
+
+import requests
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+from requests.exceptions import RequestException
+
+from ndoh_hub.celery import app
+from ndoh_hub.utils import redis
+from registrations.models import WhatsAppContact
+
+logger = logging.getLogger(__name__)
+
+# The number of contacts to check in each WhatsApp API request
+CONTACT_CHECK_BATCH_SIZE = 500
+# How long to wait for a queued check before queueing the contact again
+CONTACT_CHECK_PENDING_SECONDS = 300
+# The number of expired contacts to delete in each query
+PRUNE_BATCH_SIZE = 5000
+
+
+def chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_cached_contacts(msisdns):
+    """
+    Returns the unexpired WhatsAppContacts for `msisdns`, by msisdn, in a single
+    query
+    """
+    cutoff = timezone.now() - timedelta(days=settings.WHATSAPP_CONTACT_CHECK_TTL_DAYS)
+    contacts = WhatsAppContact.objects.filter(
+        msisdn__in=msisdns, created__gte=cutoff
+    ).order_by("created")
+    # If a contact has been checked more than once, the latest check wins
+    return {contact.msisdn: contact for contact in contacts}
+
+
+def check_contacts(msisdns):
+    """
+    Checks `msisdns` with the WhatsApp API in batches, and caches the results.
+    Returns the new WhatsAppContacts, by msisdn.
+    """
+    headers = {
+        "Authorization": f"Bearer {settings.TURN_TOKEN}",
+        "Content-Type": "application/json",
+    }
+    contacts = {}
+    for batch in chunks(msisdns, CONTACT_CHECK_BATCH_SIZE):
+        response = requests.post(
+            urljoin(settings.TURN_URL, "v1/contacts"),
+            json={"blocking": "wait", "contacts": batch},
+            headers=headers,
+            timeout=30,
+        )
+        response.raise_for_status()
+        for result in response.json()["contacts"]:
+            contacts[result["input"]] = WhatsAppContact(
+                msisdn=result["input"],
+                whatsapp_id=(
+                    result.get("wa_id", "") if result["status"] == "valid" else ""
+                ),
+            )
+    WhatsAppContact.objects.bulk_create(contacts.values())
+    return contacts
+
+
+def queue_contact_checks(msisdns):
+    """
+    Queues background checks for `msisdns`, skipping any that are already queued
+    """
+    msisdns = list(msisdns)
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for msisdn in msisdns:
+            pipe.set(
+                f"whatsapp_contact_check:{msisdn}",
+                1,
+                nx=True,
+                ex=CONTACT_CHECK_PENDING_SECONDS,
+            )
+        msisdns = [msisdn for msisdn, new in zip(msisdns, pipe.execute()) if new]
+    except RedisError:
+        logger.exception("Cannot check for queued contact checks")
+
+    for batch in chunks(msisdns, CONTACT_CHECK_BATCH_SIZE):
+        check_whatsapp_contacts.delay(batch)
+
+
+@app.task(
+    autoretry_for=(RequestException, SoftTimeLimitExceeded),
+    retry_backoff=True,
+    max_retries=15,
+    acks_late=True,
+    soft_time_limit=60,
+    time_limit=90,
+)
+def check_whatsapp_contacts(msisdns):
+    check_contacts(msisdns)
+
+
+@app.task(acks_late=True, soft_time_limit=600, time_limit=630)
+def prune_whatsapp_contacts():
+    """
+    Deletes the expired WhatsAppContacts in batches, to keep each query and
+    transaction short
+    """
+    cutoff = timezone.now() - timedelta(days=settings.WHATSAPP_CONTACT_CHECK_TTL_DAYS)
+    deleted = 0
+    while True:
+        ids = list(
+            WhatsAppContact.objects.filter(created__lt=cutoff).values_list(
+                "id", flat=True
+            )[:PRUNE_BATCH_SIZE]
+        )
+        if not ids:
+            break
+        deleted += WhatsAppContact.objects.filter(id__in=ids).delete()[0]
+    logger.info(f"Pruned {deleted} expired WhatsApp contacts")
+    return deleted
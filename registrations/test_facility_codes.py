@@ -0,0 +1,313 @@
+import json
+import math
+from random import Random
+from unittest import mock
+
+from django.forms.models import model_to_dict
+from django.test import TestCase, override_settings
+from redis.exceptions import ConnectionError
+
+from ndoh_hub.utils import redis
+from registrations.facility_codes import (
+    VERSION_KEY,
+    FacilityCodeCache,
+    bump_facility_codes_version,
+    facility_codes,
+    get_trigrams,
+    is_valid_facility_code,
+    load_facility_codes,
+    nearest_facilities,
+    search_facilities,
+)
+from registrations.models import ClinicCode
+from registrations.spatial import KDTree, to_unit_vector
+
+
+@override_settings(FACILITY_CODE_CACHE_ENABLED=True, FACILITY_CODE_CACHE_INTERVAL=60)
+class FacilityCodeCacheTests(TestCase):
+    def setUp(self):
+        redis.delete(VERSION_KEY)
+        facility_codes.invalidate()
+
+    def tearDown(self):
+        redis.delete(VERSION_KEY)
+        facility_codes.invalidate()
+
+    def test_valid(self):
+        """
+        Should return whether the facility code exists
+        """
+        ClinicCode.objects.create(value="123456")
+        self.assertTrue(is_valid_facility_code("123456"))
+        self.assertFalse(is_valid_facility_code("654321"))
+
+    @mock.patch("registrations.facility_codes.connections")
+    def test_load_on_startup(self, connections):
+        """
+        Should load the facility codes, and close the database connection so that
+        it isn't shared with forked workers
+        """
+        ClinicCode.objects.create(value="123456")
+        load_facility_codes()
+        connections.close_all.assert_called_once_with()
+        with self.assertNumQueries(0):
+            self.assertTrue(is_valid_facility_code("123456"))
+
+    def test_no_queries_when_cached(self):
+        """
+        Once loaded, checks within the interval shouldn't hit the database
+        """
+        ClinicCode.objects.create(value="123456")
+        is_valid_facility_code("123456")
+        with self.assertNumQueries(0):
+            self.assertTrue(is_valid_facility_code("123456"))
+            self.assertFalse(is_valid_facility_code("654321"))
+
+    def test_version_bump_reloads(self):
+        """
+        Another process bumping the version should cause the codes to be reloaded
+        the next time the version is checked
+        """
+        cache = FacilityCodeCache()
+        self.assertEqual(cache.get().codes, frozenset())
+        ClinicCode.objects.bulk_create([ClinicCode(value="123456")])
+        redis.incr(VERSION_KEY)
+
+        self.assertEqual(cache.get().codes, frozenset())
+        cache.checked = 0
+        self.assertEqual(cache.get().codes, frozenset(["123456"]))
+
+    def test_unchanged_version_doesnt_reload(self):
+        """
+        If the version hasn't changed, the codes shouldn't be reloaded
+        """
+        cache = FacilityCodeCache()
+        cache.get()
+        cache.checked = 0
+        with self.assertNumQueries(0):
+            cache.get()
+
+    def test_clinic_code_changes_bump_version(self):
+        """
+        Saving or deleting a ClinicCode should bump the version and clear the local
+        cache, once the transaction is committed
+        """
+        self.assertFalse(is_valid_facility_code("123456"))
+        with self.captureOnCommitCallbacks(execute=True):
+            clinic = ClinicCode.objects.create(value="123456")
+            self.assertIsNone(redis.get(VERSION_KEY))
+            self.assertFalse(is_valid_facility_code("123456"))
+        self.assertEqual(redis.get(VERSION_KEY), b"1")
+        self.assertTrue(is_valid_facility_code("123456"))
+        with self.captureOnCommitCallbacks(execute=True):
+            clinic.delete()
+        self.assertEqual(redis.get(VERSION_KEY), b"2")
+        self.assertFalse(is_valid_facility_code("123456"))
+
+    def test_redis_unavailable(self):
+        """
+        If redis is unavailable, the codes should be reloaded from the database
+        """
+        cache = FacilityCodeCache()
+        ClinicCode.objects.create(value="123456")
+        with mock.patch(
+            "registrations.facility_codes.get_redis_connection"
+        ) as get_redis_connection:
+            get_redis_connection.return_value.get.side_effect = ConnectionError()
+            get_redis_connection.return_value.incr.side_effect = ConnectionError()
+            self.assertEqual(cache.get().codes, frozenset(["123456"]))
+            bump_facility_codes_version()
+
+
+class FacilityIndexTests(TestCase):
+    def setUp(self):
+        ClinicCode.objects.create(code="1", value="123456", uid="cc1", name="Clinic")
+        ClinicCode.objects.create(code="2", value="123456", uid="cc2", name="Clinic")
+        ClinicCode.objects.create(code="3", value="654321", uid="cc3", name="Kliniek é")
+        self.index = FacilityCodeCache().load()
+
+    def test_codes(self):
+        """
+        Should contain all the facility codes
+        """
+        self.assertEqual(self.index.codes, frozenset(["123456", "654321"]))
+
+    def test_get_details(self):
+        """
+        Should return the JSON details for the first clinic with the code
+        """
+        self.assertEqual(
+            json.loads(self.index.get_details("654321")),
+            model_to_dict(ClinicCode.objects.get(uid="cc3")),
+        )
+        self.assertEqual(json.loads(self.index.get_details("123456"))["uid"], "cc1")
+        self.assertIsNone(self.index.get_details("000000"))
+
+    def test_get_facility_check(self):
+        """
+        Should return the JSON FacilityCheck response for all matching clinics
+        """
+        response = json.loads(self.index.get_facility_check("name", "Clinic"))
+        self.assertEqual(response["title"], "FacilityCheck")
+        self.assertEqual(len(response["headers"]), 4)
+        self.assertEqual(
+            response["rows"],
+            [["1", "123456", "cc1", "Clinic"], ["2", "123456", "cc2", "Clinic"]],
+        )
+        self.assertEqual((response["width"], response["height"]), (4, 2))
+
+        response = json.loads(self.index.get_facility_check("uid", "cc4"))
+        self.assertEqual((response["rows"], response["height"]), ([], 0))
+
+
+class FacilitySearchTests(TestCase):
+    def setUp(self):
+        clinics = [
+            ("cc1", "Bergvliet Clinic", "ZA-WC", "Cape Town"),
+            ("cc2", "Bergville Clinic", "ZA-NL", "Uthukela"),
+            ("cc3", "Groote Schuur Hospital", "ZA-WC", "Cape Town"),
+            ("cc4", "Berg Clinic", "ZA-WC", "West Coast"),
+        ]
+        for uid, name, province, district in clinics:
+            ClinicCode.objects.create(
+                code=uid,
+                value=uid,
+                uid=uid,
+                name=name,
+                province=province,
+                district=district,
+            )
+        self.index = FacilityCodeCache().load()
+
+    def search(self, *args, **kwargs):
+        return [clinic["uid"] for clinic, _ in self.index.search(*args, **kwargs)]
+
+    def test_get_trigrams(self):
+        """
+        Should split the text into padded, lowercase words like pg_trgm
+        """
+        self.assertEqual(get_trigrams("A-Bc"), {"  a", " a ", "  b", " bc", "bc "})
+        self.assertEqual(get_trigrams(" -- "), set())
+
+    def test_ranked(self):
+        """
+        Should return the closest matches first, even if they're misspelt
+        """
+        self.assertEqual(self.search("bergvleit clinic"), ["cc1", "cc4", "cc2"])
+        self.assertEqual(self.search("GROOTE SCHUUR")[0], "cc3")
+        [(clinic, similarity)] = self.index.search("Berg Clinic", limit=1)
+        self.assertEqual((clinic["uid"], similarity), ("cc4", 1))
+
+    def test_limit(self):
+        """
+        Should return at most `limit` results
+        """
+        self.assertEqual(self.search("clinic", limit=2), ["cc4", "cc1"])
+
+    def test_filters(self):
+        """
+        Should only return the clinics in the province and district
+        """
+        self.assertEqual(self.search("berg", province="ZA-NL"), ["cc2"])
+        self.assertEqual(
+            self.search("berg", province="ZA-WC", district="Cape Town"), ["cc1"]
+        )
+
+    def test_no_matches(self):
+        """
+        Should return nothing if no names share any trigrams with the query
+        """
+        self.assertEqual(self.search("xyz"), [])
+
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=False)
+    def test_uncached(self):
+        """
+        With the cache disabled, should return the same results by querying the
+        database, without loading the index
+        """
+        searches = [
+            ("bergvleit clinic",),
+            ("clinic", 2),
+            ("berg", 10, "ZA-WC", "Cape Town"),
+            ("xyz",),
+        ]
+        with mock.patch.object(facility_codes, "load") as load:
+            for args in searches:
+                with self.subTest(args=args), self.assertNumQueries(1):
+                    self.assertEqual(search_facilities(*args), self.index.search(*args))
+        load.assert_not_called()
+
+
+class FacilityNearestTests(TestCase):
+    def setUp(self):
+        clinics = [
+            ("cc1", "-33.92584+018.42322/"),  # Cape Town
+            ("cc2", "-29.85868+031.02184/"),  # Durban
+            ("cc3", "-26.20410+028.04731/"),  # Johannesburg
+            ("cc4", "-33.96109+025.61494/"),  # Gqeberha
+            ("cc5", None),
+        ]
+        for uid, location in clinics:
+            ClinicCode.objects.create(
+                code=uid, value=uid, uid=uid, name=uid, location=location
+            )
+        self.index = FacilityCodeCache().load()
+
+    def test_parsed_location(self):
+        """
+        Saving a clinic should parse its location into its latitude and longitude
+        """
+        clinic = ClinicCode.objects.get(uid="cc1")
+        self.assertEqual((clinic.latitude, clinic.longitude), (-33.92584, 18.42322))
+        clinic = ClinicCode.objects.get(uid="cc5")
+        self.assertEqual((clinic.latitude, clinic.longitude), (None, None))
+
+    def test_nearest(self):
+        """
+        Should return the closest clinics with locations, closest first, with their
+        distance in km
+        """
+        results = self.index.nearest(-33.9, 18.6, limit=2)
+        self.assertEqual([clinic["uid"] for clinic, _ in results], ["cc1", "cc4"])
+        self.assertAlmostEqual(results[0][1], 16.7, delta=0.5)
+        self.assertAlmostEqual(results[1][1], 649, delta=5)
+
+        results = self.index.nearest(-26.1, 28.0, limit=10)
+        self.assertEqual(
+            [clinic["uid"] for clinic, _ in results], ["cc3", "cc2", "cc4", "cc1"]
+        )
+
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=False)
+    def test_uncached(self):
+        """
+        With the cache disabled, should return the same results by querying the
+        database, without loading the index
+        """
+        with mock.patch.object(facility_codes, "load") as load:
+            for args in [(-33.9, 18.6, 2), (-26.1, 28.0, 10)]:
+                with self.subTest(args=args), self.assertNumQueries(1):
+                    results = nearest_facilities(*args)
+                    expected = self.index.nearest(*args)
+                    self.assertEqual([c for c, _ in results], [c for c, _ in expected])
+                    for (_, distance), (_, expected_distance) in zip(results, expected):
+                        self.assertAlmostEqual(distance, expected_distance)
+        load.assert_not_called()
+
+    def test_matches_brute_force(self):
+        """
+        Should find the same nearest clinics as comparing the distances to all of
+        them
+        """
+        random = Random(42)
+        points = [
+            ((random.uniform(-35, -22), random.uniform(16, 33)), i) for i in range(500)
+        ]
+        tree = KDTree((to_unit_vector(*p), i) for p, i in points)
+        for _ in range(20):
+            point = to_unit_vector(random.uniform(-35, -22), random.uniform(16, 33))
+            expected = sorted(
+                (math.dist(point, to_unit_vector(*p)), i) for p, i in points
+            )[:5]
+            self.assertEqual(
+                [i for _, i in tree.nearest(point, 5)], [i for _, i in expected]
+            )
@@ -0,0 +1,106 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+import responses
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ndoh_hub.utils import redis
+from registrations import tasks
+from registrations.models import WhatsAppContact
+
+
+def add_contacts_response(statuses):
+    """
+    Mocks the WhatsApp contacts API, with `statuses` mapping msisdn to wa_id, or to
+    None for invalid contacts
+    """
+
+    def callback(request):
+        contacts = json.loads(request.body)["contacts"]
+        results = []
+        for msisdn in contacts:
+            if statuses.get(msisdn):
+                results.append(
+                    {"input": msisdn, "status": "valid", "wa_id": statuses[msisdn]}
+                )
+            else:
+                results.append({"input": msisdn, "status": "invalid"})
+        return (200, {}, json.dumps({"contacts": results}))
+
+    responses.add_callback(responses.POST, "http://turn/v1/contacts", callback=callback)
+
+
+@override_settings(TURN_URL="http://turn", WHATSAPP_CONTACT_CHECK_TTL_DAYS=7)
+class ContactCheckTests(TestCase):
+    def tearDown(self):
+        for msisdn in ("+27820001001", "+27820001002"):
+            redis.delete(f"whatsapp_contact_check:{msisdn}")
+
+    @responses.activate
+    def test_check_contacts(self):
+        """
+        Should check the contacts with the WhatsApp API in batches, and cache the
+        results
+        """
+        add_contacts_response({"+27820001001": "27820001001"})
+        with patch.object(tasks, "CONTACT_CHECK_BATCH_SIZE", 1):
+            contacts = tasks.check_contacts(["+27820001001", "+27820001002"])
+
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(contacts["+27820001001"].whatsapp_id, "27820001001")
+        self.assertEqual(contacts["+27820001002"].whatsapp_id, "")
+        self.assertEqual(
+            set(WhatsAppContact.objects.values_list("msisdn", "whatsapp_id")),
+            {("+27820001001", "27820001001"), ("+27820001002", "")},
+        )
+
+    def test_get_cached_contacts(self):
+        """
+        Should return the latest unexpired check for each contact
+        """
+        old = WhatsAppContact.objects.create(msisdn="+27820001001")
+        WhatsAppContact.objects.filter(id=old.id).update(
+            created=timezone.now() - timedelta(days=8)
+        )
+        WhatsAppContact.objects.create(msisdn="+27820001002")
+        latest = WhatsAppContact.objects.create(
+            msisdn="+27820001002", whatsapp_id="27820001002"
+        )
+
+        with self.assertNumQueries(1):
+            cached = tasks.get_cached_contacts(["+27820001001", "+27820001002"])
+        self.assertEqual(cached, {"+27820001002": latest})
+
+    @responses.activate
+    def test_queue_contact_checks(self):
+        """
+        Should check the contacts in the background, unless they are already queued
+        """
+        add_contacts_response({})
+        tasks.queue_contact_checks(["+27820001001"])
+        tasks.queue_contact_checks(["+27820001001", "+27820001002"])
+
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(
+            json.loads(responses.calls[1].request.body)["contacts"], ["+27820001002"]
+        )
+
+    def test_prune_whatsapp_contacts(self):
+        """
+        Should delete all the expired contacts, in batches
+        """
+        expired = [WhatsAppContact.objects.create(msisdn="+27820001001").id]
+        expired.append(WhatsAppContact.objects.create(msisdn="+27820001001").id)
+        WhatsAppContact.objects.filter(id__in=expired).update(
+            created=timezone.now() - timedelta(days=8)
+        )
+        WhatsAppContact.objects.create(msisdn="+27820001002")
+
+        with patch.object(tasks, "PRUNE_BATCH_SIZE", 1):
+            self.assertEqual(tasks.prune_whatsapp_contacts(), 2)
+        self.assertEqual(
+            list(WhatsAppContact.objects.values_list("msisdn", flat=True)),
+            ["+27820001002"],
+        )
@@ -1,13 +1,18 @@
 import json
+from unittest.mock import patch
 
+import responses
 from django.contrib.auth.models import Permission, User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
 
-from registrations.models import ClinicCode
+from ndoh_hub.utils import redis
+from registrations.facility_codes import facility_codes
+from registrations.models import ClinicCode, WhatsAppContact
+from registrations.test_tasks import add_contacts_response
 
 
 class HUBAPITestCase(TestCase):
@@ -58,7 +63,9 @@ class FacilityDetailsViewTests(APITestCase):
                 "area_type": "rural",
                 "code": "123456",
                 "district": "test district",
+                "latitude": None,
                 "location": "(location)",
+                "longitude": None,
                 "municipality": "test munnicipality",
                 "name": "test1",
                 "province": "ZA-EC",
@@ -68,8 +75,94 @@ class FacilityDetailsViewTests(APITestCase):
             },
         )
 
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=True)
+    def test_get_facility_details_cached(self):
+        """
+        With the cache enabled, should return the same details without querying the
+        database
+        """
+        self.addCleanup(facility_codes.invalidate)
+        ClinicCode.objects.create(
+            code="123456", value="123456", uid="cc1", name="test1", province="ZA-EC"
+        )
+        user = User.objects.create_user("test", "test")
+        self.client.force_authenticate(user)
+        url = reverse("facility-detail")
+        facility_codes.get()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"facility_code": "123456"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response.json(),
+                {
+                    "area_type": None,
+                    "code": "123456",
+                    "district": None,
+                    "latitude": None,
+                    "location": None,
+                    "longitude": None,
+                    "municipality": None,
+                    "name": "test1",
+                    "province": "ZA-EC",
+                    "uid": "cc1",
+                    "unit_type": None,
+                    "value": "123456",
+                },
+            )
+
+            response = self.client.get(url, {"facility_code": "654321"})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class FacilityCheckViewTests(APITestCase):
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=True)
+    def test_filter_cached(self):
+        """
+        With the cache enabled, should return the same response without querying
+        the database
+        """
+        self.addCleanup(facility_codes.invalidate)
+        ClinicCode.objects.create(
+            code="123456", value="123456", uid="cc1", name="test1"
+        )
+        ClinicCode.objects.create(
+            code="654321", value="123456", uid="cc2", name="test2"
+        )
+        user = User.objects.create_user("test", "test")
+        self.client.force_authenticate(user)
+        url = reverse("facility-check")
+        with override_settings(FACILITY_CODE_CACHE_ENABLED=False):
+            expected = self.client.get(url, {"criteria": "value:123456"}).json()
+        facility_codes.get()
+
+        with self.assertNumQueries(0):
+            r = self.client.get(url, {"criteria": "value:123456"})
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.json(), expected)
+        self.assertEqual(r.json()["height"], 2)
+
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=True)
+    def test_cached_clinic_code_changed(self):
+        """
+        With the cache enabled, changes to the clinic codes should be returned once
+        they're committed
+        """
+        facility_codes.invalidate()
+        self.addCleanup(facility_codes.invalidate)
+        user = User.objects.create_user("test", "test")
+        self.client.force_authenticate(user)
+        url = reverse("facility-check")
+        r = self.client.get(url, {"criteria": "value:123456"})
+        self.assertEqual(r.json()["height"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ClinicCode.objects.create(
+                code="123456", value="123456", uid="cc1", name="test1"
+            )
+        r = self.client.get(url, {"criteria": "value:123456"})
+        self.assertEqual(r.json()["rows"], [["123456", "123456", "cc1", "test1"]])
+
     def test_filter_by_code(self):
         ClinicCode.objects.create(
             code="123456", value="123456", uid="cc1", name="test1"
@@ -124,6 +217,139 @@ class FacilityCheckViewTests(APITestCase):
         )
 
 
+class FacilitySearchViewTests(APITestCase):
+    url = reverse("facility-search")
+
+    def setUp(self):
+        ClinicCode.objects.create(
+            code="1", value="123456", uid="cc1", name="Bergvliet Clinic"
+        )
+        ClinicCode.objects.create(
+            code="2",
+            value="654321",
+            uid="cc2",
+            name="Groote Schuur Hospital",
+            province="ZA-WC",
+            district="Cape Town",
+        )
+        user = User.objects.create_user("test", "test")
+        self.client.force_authenticate(user)
+
+    def test_query_required(self):
+        """
+        Should return an error if there is no query
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"q": "clinic", "limit": "a"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search(self):
+        """
+        Should return the ranked matches
+        """
+        response = self.client.get(
+            self.url, {"q": "grote schuur", "province": "ZA-WC", "limit": 5}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "results": [
+                    {
+                        "code": "2",
+                        "value": "654321",
+                        "uid": "cc2",
+                        "name": "Groote Schuur Hospital",
+                        "province": "ZA-WC",
+                        "district": "Cape Town",
+                        "similarity": 0.5,
+                    }
+                ]
+            },
+        )
+
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=True)
+    def test_search_cached(self):
+        """
+        With the cache enabled, should search without querying the database
+        """
+        self.addCleanup(facility_codes.invalidate)
+        facility_codes.get()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"q": "bergvliet"})
+        self.assertEqual([r["uid"] for r in response.json()["results"]], ["cc1"])
+
+
+class FacilityNearestViewTests(APITestCase):
+    url = reverse("facility-nearest")
+
+    def setUp(self):
+        ClinicCode.objects.create(
+            code="1",
+            value="123456",
+            uid="cc1",
+            name="Cape Town Clinic",
+            location="-33.92584+018.42322/",
+        )
+        ClinicCode.objects.create(
+            code="2",
+            value="654321",
+            uid="cc2",
+            name="Durban Clinic",
+            location="-29.85868+031.02184/",
+        )
+        user = User.objects.create_user("test", "test")
+        self.client.force_authenticate(user)
+
+    def test_location_required(self):
+        """
+        Should return an error if there is no valid location
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"location": "invalid"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nearest(self):
+        """
+        Should return the closest clinics, with their distances
+        """
+        response = self.client.get(
+            self.url, {"location": "-33.92584+018.42322/", "limit": 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "results": [
+                    {
+                        "code": "1",
+                        "value": "123456",
+                        "uid": "cc1",
+                        "name": "Cape Town Clinic",
+                        "province": None,
+                        "district": None,
+                        "location": "-33.92584+018.42322/",
+                        "distance": 0,
+                    }
+                ]
+            },
+        )
+
+    @override_settings(FACILITY_CODE_CACHE_ENABLED=True)
+    def test_nearest_cached(self):
+        """
+        With the cache enabled, should find the clinics without querying the
+        database
+        """
+        self.addCleanup(facility_codes.invalidate)
+        facility_codes.get()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"location": "-29.8+031.0/"})
+        self.assertEqual([r["uid"] for r in response.json()["results"]], ["cc2", "cc1"])
+
+
 class WhatsAppContactCheckViewTests(AuthenticatedAPITestCase):
     def setUp(self):
         super().setUp()
@@ -191,3 +417,92 @@ class WhatsAppContactCheckViewTests(AuthenticatedAPITestCase):
                 ]
             },
         )
+
+
+@override_settings(WHATSAPP_CONTACT_CHECK_ENABLED=True, TURN_URL="http://turn")
+class WhatsAppContactCheckPipelineTests(AuthenticatedAPITestCase):
+    url = reverse("whatsappcontact-list")
+
+    def setUp(self):
+        super().setUp()
+        self.normalclient.credentials(HTTP_AUTHORIZATION="Bearer %s" % self.normaltoken)
+        self.normaluser.user_permissions.add(
+            Permission.objects.get(name="Can add WhatsApp Contact")
+        )
+        WhatsAppContact.objects.create(msisdn="+27820001001", whatsapp_id="27820001001")
+        WhatsAppContact.objects.create(msisdn="+27820001002")
+        self.addCleanup(redis.delete, "whatsapp_contact_check:+27820001003")
+
+    def check(self, blocking):
+        response = self.normalclient.post(
+            self.url,
+            data={
+                "blocking": blocking,
+                "contacts": ["0820001001", "+27820001002", "0820001003"],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()["contacts"]
+
+    @responses.activate
+    def test_wait(self):
+        """
+        Should return the cached contacts, and check the uncached ones
+        """
+        add_contacts_response({"+27820001003": "27820001003"})
+        self.assertEqual(
+            self.check("wait"),
+            [
+                {"input": "0820001001", "status": "valid", "wa_id": "27820001001"},
+                {"input": "+27820001002", "status": "invalid"},
+                {"input": "0820001003", "status": "valid", "wa_id": "27820001003"},
+            ],
+        )
+        self.assertEqual(
+            json.loads(responses.calls[0].request.body),
+            {"blocking": "wait", "contacts": ["+27820001003"]},
+        )
+
+    @responses.activate
+    def test_no_wait(self):
+        """
+        Should return the cached contacts, and queue checks for the uncached ones
+        """
+        add_contacts_response({"+27820001003": "27820001003"})
+        with patch("registrations.tasks.check_whatsapp_contacts") as task:
+            self.assertEqual(
+                self.check("no_wait")[2],
+                {"input": "0820001003", "status": "processing"},
+            )
+        task.delay.assert_called_once_with(["+27820001003"])
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_wait_api_error(self):
+        """
+        If the WhatsApp API is unavailable, should queue the uncached checks
+        """
+        responses.add(responses.POST, "http://turn/v1/contacts", status=500)
+        with patch("registrations.tasks.check_whatsapp_contacts") as task:
+            self.assertEqual(
+                self.check("wait")[2], {"input": "0820001003", "status": "processing"}
+            )
+        task.delay.assert_called_once_with(["+27820001003"])
+
+    def test_many_contacts(self):
+        """
+        Should look up thousands of cached contacts in a single query
+        """
+        WhatsAppContact.objects.bulk_create(
+            WhatsAppContact(msisdn=f"+2782{i:07d}", whatsapp_id=f"2782{i:07d}")
+            for i in range(2000)
+        )
+        contacts = [f"+2782{i:07d}" for i in range(2000)]
+        # The token, the user and group permissions, and the contacts
+        with self.assertNumQueries(4):
+            response = self.normalclient.post(
+                self.url, data={"blocking": "wait", "contacts": contacts}, format="json"
+            )
+        self.assertEqual(len(response.json()["contacts"]), 2000)
+        self.assertEqual(response.json()["contacts"][5]["wa_id"], "27820000005")
@@ -16,5 +16,15 @@ urlpatterns = [
         views.FacilityDetailsView.as_view(),
         name="facility-detail",
     ),
+    path(
+        "api/v1/facilitySearch",
+        views.FacilitySearchView.as_view(),
+        name="facility-search",
+    ),
+    path(
+        "api/v1/facilityNearest",
+        views.FacilityNearestView.as_view(),
+        name="facility-nearest",
+    ),
     re_path(r"^api/v1/", include(router.urls)),
 ]
@@ -1,6 +1,11 @@
+import logging
 from functools import partial
 
+import phonenumbers
+from django.conf import settings
 from django.forms.models import model_to_dict
+from django.http import HttpResponse
+from requests.exceptions import RequestException
 from rest_framework import generics, mixins, status, viewsets
 from rest_framework.authentication import (
     BasicAuthentication,
@@ -13,8 +18,19 @@ from rest_framework.response import Response
 
 from ndoh_hub.utils import msisdn_to_whatsapp_id
 
+from .facility_codes import (
+    FACILITY_CHECK_FIELDS,
+    FACILITY_CHECK_HEADERS,
+    facility_codes,
+    nearest_facilities,
+    search_facilities,
+)
 from .models import ClinicCode, WhatsAppContact
 from .serializers import WhatsAppContactCheckSerializer
+from .spatial import parse_location
+from .tasks import check_contacts, get_cached_contacts, queue_contact_checks
+
+logger = logging.getLogger(__name__)
 
 
 class BearerTokenAuthentication(TokenAuthentication):
@@ -32,6 +48,14 @@ class FacilityDetailsView(generics.RetrieveAPIView):
                 status.HTTP_400_BAD_REQUEST,
             )
 
+        if settings.FACILITY_CODE_CACHE_ENABLED:
+            details = facility_codes.get().get_details(facility_code)
+            if details is None:
+                return Response(
+                    {"error": "Clinic not found"}, status.HTTP_404_NOT_FOUND
+                )
+            return HttpResponse(details, content_type="application/json")
+
         try:
             clinic = ClinicCode.objects.get(value=facility_code)
         except ClinicCode.DoesNotExist:
@@ -62,49 +86,126 @@ class FacilityCheckView(generics.RetrieveAPIView):
                 status.HTTP_400_BAD_REQUEST,
             )
 
+        if settings.FACILITY_CODE_CACHE_ENABLED and field in FACILITY_CHECK_FIELDS:
+            return HttpResponse(
+                facility_codes.get().get_facility_check(field, value),
+                content_type="application/json",
+            )
+
         results = ClinicCode.objects.filter(**{field: value}).values_list(
-            "code", "value", "uid", "name"
+            *FACILITY_CHECK_FIELDS
         )
         return Response(
             {
                 "title": "FacilityCheck",
-                "headers": [
-                    {
-                        "hidden": False,
-                        "meta": False,
-                        "name": "code",
-                        "column": "code",
-                        "type": "java.lang.String",
-                    },
-                    {
-                        "hidden": False,
-                        "meta": False,
-                        "name": "value",
-                        "column": "value",
-                        "type": "java.lang.String",
-                    },
-                    {
-                        "hidden": False,
-                        "meta": False,
-                        "name": "uid",
-                        "column": "uid",
-                        "type": "java.lang.String",
-                    },
-                    {
-                        "hidden": False,
-                        "meta": False,
-                        "name": "name",
-                        "column": "name",
-                        "type": "java.lang.String",
-                    },
-                ],
+                "headers": FACILITY_CHECK_HEADERS,
                 "rows": results,
-                "width": 4,
+                "width": len(FACILITY_CHECK_FIELDS),
                 "height": len(results),
             }
         )
 
 
+class FacilitySearchView(generics.GenericAPIView):
+    """
+    Searches for the clinics with names that best match the `q` query parameter,
+    optionally filtered by `province` and `district`
+    """
+
+    queryset = ClinicCode.objects.all()
+    permission_classes = (DjangoModelPermissions,)
+    authentication_classes = (BasicAuthentication, TokenAuthentication)
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request: Request) -> Response:
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"error": "Must supply 'q' query parameter"},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            return Response(
+                {"error": "Limit query parameter must be a number"},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(max(limit, 1), self.max_limit)
+
+        results = search_facilities(
+            query,
+            limit=limit,
+            province=request.query_params.get("province"),
+            district=request.query_params.get("district"),
+        )
+        return Response(
+            {
+                "results": [
+                    {
+                        "code": clinic["code"],
+                        "value": clinic["value"],
+                        "uid": clinic["uid"],
+                        "name": clinic["name"],
+                        "province": clinic["province"],
+                        "district": clinic["district"],
+                        "similarity": round(similarity, 3),
+                    }
+                    for clinic, similarity in results
+                ]
+            }
+        )
+
+
+class FacilityNearestView(generics.GenericAPIView):
+    """
+    Finds the clinics closest to the ISO6709 `location` query parameter
+    """
+
+    queryset = ClinicCode.objects.all()
+    permission_classes = (DjangoModelPermissions,)
+    authentication_classes = (BasicAuthentication, TokenAuthentication)
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request: Request) -> Response:
+        latitude, longitude = parse_location(request.query_params.get("location"))
+        if latitude is None or longitude is None:
+            return Response(
+                {"error": "Must supply an ISO6709 'location' query parameter"},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            return Response(
+                {"error": "Limit query parameter must be a number"},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(max(limit, 1), self.max_limit)
+
+        return Response(
+            {
+                "results": [
+                    {
+                        "code": clinic["code"],
+                        "value": clinic["value"],
+                        "uid": clinic["uid"],
+                        "name": clinic["name"],
+                        "province": clinic["province"],
+                        "district": clinic["district"],
+                        "location": clinic["location"],
+                        "distance": round(distance, 2),
+                    }
+                    for clinic, distance in nearest_facilities(
+                        latitude, longitude, limit
+                    )
+                ]
+            }
+        )
+
+
 class WhatsAppContactCheckViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     authentication_classes = (SessionAuthentication, BearerTokenAuthentication)
     permission_classes = (DjangoModelPermissions,)
@@ -117,10 +218,42 @@ class WhatsAppContactCheckViewSet(mixins.CreateModelMixin, viewsets.GenericViewS
 
         return {"input": msisdn, "status": "valid", "wa_id": whatsapp_id}
 
+    def get_statuses(self, contacts, blocking):
+        """
+        Looks up all the contacts in the cache in a single query, and either checks
+        the uncached ones now, or queues them to be checked in the background
+        """
+        msisdns = {
+            contact.raw_input: phonenumbers.format_number(
+                contact, phonenumbers.PhoneNumberFormat.E164
+            )
+            for contact in contacts
+        }
+        cached = get_cached_contacts(set(msisdns.values()))
+        uncached = {m for m in msisdns.values() if m not in cached}
+        if uncached and blocking == "wait":
+            try:
+                cached.update(check_contacts(uncached))
+                uncached = set()
+            except RequestException:
+                logger.exception("WhatsApp contact check failed, queueing instead")
+        if uncached:
+            queue_contact_checks(uncached)
+
+        for contact in contacts:
+            msisdn = msisdns[contact.raw_input]
+            if msisdn in cached:
+                yield dict(cached[msisdn].api_format, input=contact.raw_input)
+            else:
+                yield {"input": contact.raw_input, "status": "processing"}
+
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        results = map(partial(self.get_status), data["contacts"])
+        if settings.WHATSAPP_CONTACT_CHECK_ENABLED:
+            results = list(self.get_statuses(data["contacts"], data["blocking"]))
+        else:
+            results = map(partial(self.get_status), data["contacts"])
         return Response({"contacts": results}, status=status.HTTP_201_CREATED)